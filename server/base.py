@@ -126,6 +126,8 @@ SUBSTITUTIONS = {
     'plugin_path': {'name': '$plugin_path', 'description': 'path to the plugins root folder'},
     'project_name': {'name': '$project_name', 'description': 'Name of the project'},
     'revision': {'name': '$revision', 'description': 'revision hash of the revision which is processed'},
+    'revision_file': {'name': '$revision_file', 'description': 'file with one revision hash per line which are processed, the plugin prints "+++ revision <revision hash>" to stdout and stderr before the output of each revision (plugins with revision_batch_size only)'},
+    'result_file': {'name': '$result_file', 'description': 'file to which the plugin writes "<revision hash> <exit code>" per processed revision (plugins with revision_batch_size only)'},
     'queue': {'name': '$queue', 'description': 'default job queue'},
     'cores_per_job': {'name': '$cores_per_job', 'description': 'cores per job (HPC only)'},
 }
@@ -206,4 +208,106 @@ LOGGING = {
     }
 }
 
-PLUGIN_URLS = ["https://github.com/smartshark/vcsSHARK","https://github.com/smartshark/coastSHARK", "https://github.com/smartshark/mecoSHARK","https://github.com/smartshark/issueSHARK","https://github.com/smartshark/mailingSHARK","https://github.com/smartshark/labelSHARK","https://github.com/smartshark/refSHARK","https://github.com/smartshark/linkSHARK","https://github.com/smartshark/changeSHARK","https://github.com/smartshark/inducingSHARK", "https://github.com/smartshark/readabilitySHARK"]
\ No newline at end of file
+PLUGIN_URLS = ["https://github.com/smartshark/vcsSHARK","https://github.com/smartshark/coastSHARK", "https://github.com/smartshark/mecoSHARK","https://github.com/smartshark/issueSHARK","https://github.com/smartshark/mailingSHARK","https://github.com/smartshark/labelSHARK","https://github.com/smartshark/refSHARK","https://github.com/smartshark/linkSHARK","https://github.com/smartshark/changeSHARK","https://github.com/smartshark/inducingSHARK", "https://github.com/smartshark/readabilitySHARK"]
+
+# Number of jobs which are written to the database at once when the jobs of a plugin execution are created
+JOB_CREATION_BATCH_SIZE = 5000
+
+# Number of previous jobs of a plugin whose runtime is used to estimate the runtime of new jobs
+RUNTIME_HISTORY_SIZE = 1000
+
+# Jobs are submitted with the walltime, memory and cores predicted from previous jobs of the plugin:
+# RESOURCE_MARGIN times the 95th percentile of successful jobs, if at least RESOURCE_HISTORY_MIN_JOBS jobs finished
+RESOURCE_MARGIN = 1.5
+RESOURCE_HISTORY_MIN_JOBS = 10
+
+# Bounds of the predicted walltime in seconds
+RESOURCE_MIN_TIME = 600
+RESOURCE_MAX_TIME = 2 * 24 * 3600
+
+# Walltime and memory are doubled for each previous failed job of a revision, at most this many times
+RESOURCE_MAX_ESCALATIONS = 3
+
+# Days after the submission of a plugin execution in which the accounting of its finished jobs is collected
+JOB_ACCOUNTING_DAYS = 7
+
+# Number of channels and sftp sessions that are opened at once over one pooled ssh connection to the HPC system
+SSH_POOL_MAX_SESSIONS = 8
+
+# Seconds after which unused pooled ssh connections are closed
+SSH_POOL_IDLE_TIMEOUT = 600
+
+# Seconds for which the job states polled from slurm for a plugin execution are reused without asking slurm again
+JOB_STATE_POLL_INTERVAL = 60
+
+# Seconds before the last poll at which the next poll of job states starts, covers jobs that changed during a poll
+JOB_STATE_POLL_OVERLAP = 300
+
+# Seconds for which the polled job states of a plugin execution are kept, afterwards they are polled from submission
+JOB_STATE_CACHE_TIMEOUT = 7 * 24 * 60 * 60
+
+# Number of jobs whose state is fetched from the backend and written to the database at once
+JOB_STATE_BATCH_SIZE = 5000
+
+# Seconds between two runs of the reconcile_jobs command over all waiting jobs
+JOB_STATE_RECONCILE_INTERVAL = 60
+
+# Seconds between two runs of the submit_jobs command, which submits the jobs that did not fit into the queue
+JOB_SUBMISSION_INTERVAL = 60
+
+# Number of failed submissions after which a job is given up and gets the state EXIT
+JOB_SUBMISSION_MAX_ATTEMPTS = 3
+
+# Seconds after which the submission lock of a plugin execution expires, e.g., if the submitting process died
+JOB_SUBMISSION_LOCK_TIMEOUT = 60 * 60
+
+# Seconds between two runs of the ingest_job_completions command
+JOB_COMPLETION_INGEST_INTERVAL = 10
+
+# Maximal number of job completion records which are read and stored at once
+JOB_COMPLETION_BATCH_SIZE = 5000
+
+# Number of bytes which are read and uploaded at once when plugin archives and repositories are transferred
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Seconds an execution waits for another execution which updates the repository of the same project
+PROJECT_LOCK_TIMEOUT = 3600
+
+# Directory of the local cache for the logs of finished jobs which are read from the HPC system
+LOG_CACHE_PATH = os.path.join(BASE_DIR, 'log_cache')
+
+# Maximal size of the log cache in bytes, the least recently read logs are removed first
+LOG_CACHE_SIZE = 10 * 1024 * 1024 * 1024
+
+# Logs larger than this many bytes are always read from the HPC system
+LOG_CACHE_MAX_FILE_SIZE = 1024 * 1024 * 1024
+
+# Number of log lines which are shown at once on the job output page
+LOG_PAGE_LINES = 1000
+
+# Maximal number of bytes which are returned by one ranged read of a log
+LOG_MAX_READ_BYTES = 4 * 1024 * 1024
+
+# SQLite database of the full-text index over the logs of finished jobs
+LOG_INDEX_PATH = os.path.join(BASE_DIR, 'log_index.sqlite3')
+
+# Seconds between two runs of the index_job_logs command
+LOG_INDEX_INTERVAL = 60
+
+# Number of finished jobs whose logs are indexed at once
+LOG_INDEX_BATCH_SIZE = 500
+
+# Logs larger than this many bytes are not indexed, searches read them instead
+LOG_INDEX_MAX_FILE_SIZE = 100 * 1024 * 1024
+
+# Days after the submission of a finished plugin execution after which its logs are packed into one archive
+LOG_ARCHIVE_DAYS = 14
+
+# Seconds between two runs of the archive_job_logs command
+LOG_ARCHIVE_INTERVAL = 3600
+
+# Seconds between two runs of the extract_parse_errors command
+PARSE_ERROR_EXTRACTION_INTERVAL = 300
+
+# Number of finished coastSHARK jobs whose parse errors are extracted at once
+PARSE_ERROR_EXTRACTION_BATCH_SIZE = 5000
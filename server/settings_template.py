@@ -34,7 +34,16 @@ HPC = {
     'ssh_key_path': '',
     'cores_per_job': 4,
     'local_log_path': '',
-    'hosts_per_job': 1
+    'hosts_per_job': 1,
+    'max_array_size': 1000,  # must not exceed MaxArraySize of the slurm configuration
+    'array_throttle': None,  # maximum number of concurrently running tasks per job array
+    'spool_path': 'xxx',  # shared directory to which finished jobs write their completion records
+    'local_spool_path': '',  # spool_path mounted on this machine, read over ssh if empty
+    'scratch_path': '${TMPDIR:-/tmp}',  # node local directory for the worktrees of revision jobs
+    'pack_size': 1,  # number of revision jobs that run in one array task
+    'pack_parallelism': 1,  # number of jobs of an array task that run at the same time
+    'max_queued_jobs': None,  # maximum number of queued jobs and array tasks of the user, e.g., MaxSubmitJobs
+    'max_array_dependencies': 100,  # maximum number of required jobs and array tasks a job array waits for
 }
 
 AZURE = {
@@ -51,6 +60,7 @@ LOCALQUEUE = {
     'redis_url': 'redis://localhost:6379',
     'plugin_installation': os.path.join(BASE_DIR, 'plugin_installations'),
     'plugin_output': os.path.join(BASE_DIR, 'plugin_output'),
+    'scratch_path': '/tmp/servershark/worktrees',  # worktrees of revision jobs
     'job_queue': 'queue:jobs',
     'result_queue': 'queue:results',
     'timeout': 120,
@@ -14,13 +14,16 @@ from django.core.urlresolvers import reverse
 from django.http import HttpResponseRedirect
 from django.shortcuts import get_object_or_404, redirect, render
 from django.utils.safestring import mark_safe
-from django.db.models import Q
+from django.db.models import Q, Exists, OuterRef
 
+from smartshark.datacollection.executionutils import reconcile_job_states
 from smartshark.datacollection.pluginmanagementinterface import PluginManagementInterface
 from smartshark.mongohandler import handler
+from smartshark.utils.verification import check_parse_errors
 
 from .views.collection import JobSubmissionThread
-from .models import MongoRole, SmartsharkUser, Plugin, Argument, Project, Job, PluginExecution, ExecutionHistory, CommitVerification
+from .models import MongoRole, SmartsharkUser, Plugin, Argument, Project, Job, PluginExecution, ExecutionHistory, CommitVerification, ExecutionDependency, \
+    RevisionIndex, Revision
 
 logger = logging.getLogger('django')
 
@@ -61,6 +64,27 @@ class CoastRecheckListFilter(SimpleListFilter):
 
 
 
+class RevisionIndexListFilter(SimpleListFilter):
+    title = 'Revision index'
+    parameter_name = 'revision_index'
+
+    def lookups(self, request, model_admin):
+        return (
+            ('indexed', 'Commit is in the MongoDB'),
+            ('missing', 'Commit is not in the MongoDB'),
+        )
+
+    def queryset(self, request, queryset):
+        indexed = Revision.objects.filter(index__project=OuterRef('project'), index__vcs_system_url=OuterRef('vcs_system'),
+                                          revision_hash=OuterRef('commit'))
+        if self.value() == 'indexed':
+            return queryset.annotate(indexed=Exists(indexed)).filter(indexed=True)
+        elif self.value() == 'missing':
+            return queryset.annotate(indexed=Exists(indexed)).filter(indexed=False)
+        else:
+            return queryset.all()
+
+
 class JobAdmin(admin.ModelAdmin):
     list_display = ('id', 'plugin_execution', 'status', 'revision_hash')
     list_filter = ('plugin_execution__project', 'plugin_execution__plugin', 'status', 'plugin_execution__execution_type')
@@ -77,13 +101,8 @@ class JobAdmin(admin.ModelAdmin):
 
     def set_job_stati(self, request, queryset):
         interface = PluginManagementInterface.find_correct_plugin_manager()
-        job_stati = interface.get_job_stati(queryset)
-        i = 0
-        for job in queryset:
-            job.status = job_stati[i]
-            job.save()
-            i += 1
-        messages.info(request, 'Job stati set from backend.')
+        changed = reconcile_job_states(interface, queryset)
+        messages.info(request, 'Job stati set from backend, {} jobs changed.'.format(changed))
 
     def set_exit(self, request, queryset):
         for job in queryset:
@@ -113,6 +132,9 @@ class JobAdmin(admin.ModelAdmin):
             new_plugin_execution = PluginExecution.objects.get(pk=old_pk)
             new_plugin_execution.pk = None
             new_plugin_execution.status = 'WAIT'
+            new_plugin_execution.reconciled_at = None
+            new_plugin_execution.submission_locked_at = None
+            new_plugin_execution.logs_archived = False
 
             # if we restart one or multiple jobs we need to set the plugin execution type to that
             # otherwise we would have a full plugin_execution on one or multiple jobs instead of a
@@ -131,12 +153,26 @@ class JobAdmin(admin.ModelAdmin):
                 new_eh.plugin_execution = new_plugin_execution
                 new_eh.save()
 
-            # create new jobs from old jobs
+            # create new jobs from old jobs, the new jobs are submitted by the job submission thread
             for old_job in jobs:
                 new_job = Job.objects.get(pk=old_job.pk)
                 new_job.pk = None
                 new_job.plugin_execution = new_plugin_execution
                 new_job.status = 'WAIT'
+                new_job.submitted = False
+                new_job.submission_attempts = 0
+                # the slurm job and the accounting of the old run must not be read for the new job
+                new_job.job_id = None
+                new_job.array_name = None
+                new_job.array_task_id = None
+                new_job.exit_code = None
+                new_job.started_at = None
+                new_job.finished_at = None
+                new_job.max_rss = None
+                new_job.cpu_time = None
+                # the logs of the new run are not indexed and their parse errors not extracted yet
+                new_job.log_indexed = None
+                new_job.parse_errors_extracted = False
                 new_job.save()
 
             thread = JobSubmissionThread(new_plugin_execution.project, [new_plugin_execution], create_jobs=False)
@@ -146,9 +182,24 @@ class JobAdmin(admin.ModelAdmin):
     set_job_stati.short_description = 'Set job status from backend'
 
 
+class ExecutionDependencyInline(admin.TabularInline):
+    model = ExecutionDependency
+    fk_name = 'plugin_execution'
+    extra = 0
+    fields = ('required_execution', 'match_revision')
+    readonly_fields = ('required_execution', 'match_revision')
+    can_delete = False
+    verbose_name = 'Required Plugin Execution'
+    verbose_name_plural = 'Required Plugin Executions'
+
+    def has_add_permission(self, request):
+        return False
+
+
 class PluginExecutionAdmin(admin.ModelAdmin):
     list_display = ('plugin', 'project', 'repository_url', 'execution_type', 'submitted_at')
     list_filter = ('project',)
+    inlines = (ExecutionDependencyInline, )
 
     actions = ['restart_plugin_execution']
 
@@ -161,6 +212,9 @@ class PluginExecutionAdmin(admin.ModelAdmin):
             plugin_execution = PluginExecution.objects.get(pk=pe.pk)
             plugin_execution.pk = None
             plugin_execution.status = 'WAIT'
+            plugin_execution.reconciled_at = None
+            plugin_execution.submission_locked_at = None
+            plugin_execution.logs_archived = False
             plugin_execution.save()
 
             # rewrite execution history for arguments and new plugin_execution
@@ -177,6 +231,39 @@ class PluginExecutionAdmin(admin.ModelAdmin):
     restart_plugin_execution.short_description = 'Restart plugin execution'
 
 
+class RevisionIndexAdmin(admin.ModelAdmin):
+    list_display = ('project', 'vcs_system_url', 'revision_count', 'updated_at')
+    list_filter = ('project',)
+    readonly_fields = ('project', 'vcs_system_url', 'last_commit_id', 'updated_at')
+
+    actions = ['update_index', 'rebuild_index']
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def revision_count(self, obj):
+        return obj.revisions.count()
+
+    def update_index(self, request, queryset):
+        added = 0
+        for index in queryset:
+            added += index.update()
+        messages.info(request, 'Added {} revisions to the revision index.'.format(added))
+
+    update_index.short_description = 'Update revision index from the MongoDB'
+
+    def rebuild_index(self, request, queryset):
+        added = 0
+        removed = 0
+        for index in queryset:
+            index_added, index_removed = index.rebuild()
+            added += index_added
+            removed += index_removed
+        messages.info(request, 'Added {} and removed {} revisions of the revision index.'.format(added, removed))
+
+    rebuild_index.short_description = 'Rebuild revision index from the MongoDB, removes deleted revisions'
+
+
 class MyUserAdmin(UserAdmin):
     def get_readonly_fields(self, request, obj=None):
         """
@@ -389,7 +476,7 @@ class CommitVerificationAdmin(admin.ModelAdmin):
     list_display = ('commit', 'project', 'vcsSHARK', 'mecoSHARK',
                     'coastSHARK')
     search_fields = ('commit',)
-    list_filter = ('project__name', 'vcsSHARK', 'mecoSHARK', 'coastSHARK', PluginFailedListFilter, CoastRecheckListFilter)
+    list_filter = ('project__name', 'vcsSHARK', 'mecoSHARK', 'coastSHARK', PluginFailedListFilter, CoastRecheckListFilter, RevisionIndexListFilter)
 
     actions = ['delete_ces_list', 'check_coast_parse_error', 'restart_coast', 'restart_meco', 'recheck_coast_parse_error']
 
@@ -451,42 +538,11 @@ class CommitVerificationAdmin(admin.ModelAdmin):
 
         interface = PluginManagementInterface.find_correct_plugin_manager()
 
-        # we need to get the most current job for each commit (because of repetitions for coastSHARK runs)
-        jobs = {}
-        for pe in PluginExecution.objects.filter(plugin__name__startswith='coastSHARK', project=queryset[0].project).order_by('submitted_at'):
-            for obj in queryset:
-                try:
-                    jobs[obj.commit] = Job.objects.get(plugin_execution=pe, revision_hash=obj.commit)
-                except Job.DoesNotExist:
-                    pass
-
+        # the latest job of each commit is checked (because of repetitions for coastSHARK runs)
         modified = 0
         not_modified = []
-        for obj in queryset:
-            # split of file for coastSHARK
-            tmp = obj.text
-            collect_state = False
-            coast_files = []
-            for line in tmp.split('\n'):
-                if collect_state and not line.strip().startswith('+++ mecoSHARK +++'):
-                    coast_files.append(line.strip()[1:])
-                if line.strip().startswith('+++ coastSHARK +++'):
-                    collect_state = True
-                if line.strip().startswith('+++ mecoSHARK +++'):
-                    collect_state = False
-
-            job = jobs[obj.commit]
-            stdout = interface.get_output_log(job)
-
-            new_lines = []
-            parse_error_files = []
-            for file in coast_files:
-                for line in stdout:
-                    if file in line and line.startswith(('Parser Error in file', 'Lexer Error in file')):
-                        new_lines.append(file + ' ({})'.format(line))
-                        parse_error_files.append(file)
-
-            if set(parse_error_files) == set(coast_files):
+        for obj, (new_lines, only_parse_errors) in check_parse_errors(interface, queryset).items():
+            if only_parse_errors:
                 modified += 1
             else:
                 not_modified.append(obj.commit)
@@ -500,44 +556,10 @@ class CommitVerificationAdmin(admin.ModelAdmin):
 
         interface = PluginManagementInterface.find_correct_plugin_manager()
 
-        # we need to get the most current job for each commit (because of repetitions for coastSHARK runs)
-        jobs = {}
-        for pe in PluginExecution.objects.filter(plugin__name__startswith='coastSHARK', project=queryset[0].project).order_by('submitted_at'):
-            for obj in queryset:
-                try:
-                    jobs[obj.commit] = Job.objects.get(plugin_execution=pe, revision_hash=obj.commit)
-                except Job.DoesNotExist:
-                    pass
-                except Job.MultipleObjectsReturned:
-                    job_ids = [str(job.id) for job in Job.objects.filter(plugin_execution=pe, revision_hash=obj.commit)]
-                    messages.warning(request, 'Commit: {} has more than one Job, ignoring it, job_ids ({})'.format(obj.commit, ','.join(job_ids)))
-
+        # the latest job of each commit is checked (because of repetitions for coastSHARK runs)
         modified = 0
-        for obj in queryset:
-            # split of file for coastSHARK
-            tmp = obj.text
-            collect_state = False
-            coast_files = []
-            for line in tmp.split('\n'):
-                if collect_state and not line.strip().startswith('+++ mecoSHARK +++'):
-                    coast_files.append(line.strip()[1:])
-                if line.strip().startswith('+++ coastSHARK +++'):
-                    collect_state = True
-                if line.strip().startswith('+++ mecoSHARK +++'):
-                    collect_state = False
-
-            job = jobs[obj.commit]
-            stdout = interface.get_output_log(job)
-
-            new_lines = []
-            parse_error_files = []
-            for file in coast_files:
-                for line in stdout:
-                    if file in line and line.startswith(('Parser Error in file', 'Lexer Error in file')):
-                        new_lines.append(file + ' ({})'.format(line))
-                        parse_error_files.append(file)
-
-            if set(parse_error_files) == set(coast_files):
+        for obj, (new_lines, only_parse_errors) in check_parse_errors(interface, queryset).items():
+            if only_parse_errors:
                 obj.coastSHARK = True
                 modified += 1
 
@@ -597,3 +619,4 @@ admin.site.register(Argument, ArgumentAdmin)
 admin.site.register(Project, ProjectAdmin)
 admin.site.register(Job, JobAdmin)
 admin.site.register(PluginExecution, PluginExecutionAdmin)
+admin.site.register(RevisionIndex, RevisionIndexAdmin)
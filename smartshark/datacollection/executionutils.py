@@ -1,16 +1,26 @@
+import datetime
+import math
 import os
 import subprocess
-from collections import defaultdict
+import logging
+import statistics
 
 import pygit2
 import re
 
-from django.db.models import Q
-from django.db import connections
+from django.conf import settings
+from django.db.models import F, Q, Max, Count, Case, When, Value, CharField, IntegerField, BigIntegerField, \
+    DateTimeField, FloatField
+from django.db.models.query import QuerySet
+from django.db import connections, transaction
 
-from smartshark.models import Job, CommitVerification
+from django.utils import timezone
+
+from smartshark.models import Job, PluginExecution, CommitVerification, ExecutionDependency, RevisionIndex
 from smartshark.mongohandler import handler
 
+logger = logging.getLogger('django')
+
 
 def get_revisions_for_failed_verification(project):
     # we ensure that commits missing vcsSHARK are first
@@ -28,103 +38,493 @@ def get_revisions_for_failed_plugins(plugins, project):
 
 def get_all_revisions(plugin_execution):
     """Return all revisions that are stored in the mongodb for this url."""
-    revisions = set()
-    for rev in handler.get_revisions_for_url(plugin_execution.repository_url):
-        revisions.add(rev['revision_hash'])
-    return revisions
+    index = RevisionIndex.get_updated_index(plugin_execution.project, plugin_execution.repository_url)
+    return index.get_revision_hashes()
+
+
+def get_new_revisions(plugin_execution):
+    """Return all revisions that are stored in the mongodb for this url on which the plugin was not executed yet."""
+    index = RevisionIndex.get_updated_index(plugin_execution.project, plugin_execution.repository_url)
+    return index.get_new_revision_hashes(plugin_execution.plugin)
+
+
+def get_revisions_to_execute(plugin_execution):
+    """Return the revisions on which the revision plugin of the plugin execution is executed.
+
+    Revisions for the execution types all and new are returned as a queryset of the revision index, all others as list.
+    """
+    revisions_to_execute_plugin_on = []
+
+    if plugin_execution.execution_type == 'all':
+        revisions_to_execute_plugin_on = get_all_revisions(plugin_execution)
+    elif plugin_execution.execution_type == 'rev':
+        if len(plugin_execution.revisions.split(",")) == 1:
+            revisions_to_execute_plugin_on.append(plugin_execution.revisions)
+        else:
+            # If only some revisions (comma-separated list) need to be executed, create path and add it to list
+            for revision in plugin_execution.revisions.split(","):
+                revisions_to_execute_plugin_on.append(revision)
+
+    elif plugin_execution.execution_type == 'new':
+        # If the revision was already processed by a job, it is not new, so exclude it
+        revisions_to_execute_plugin_on = get_new_revisions(plugin_execution)
+
+    elif plugin_execution.execution_type == 'error':
+        # Get all revisions on which this plugin failed (in some revisions) on this project. Important:
+        # if the plugin on revision X failed in first run, but worked on revision X in the second it is not
+        # longer marked as failing for this revision
+        revisions = get_revisions_for_failed_plugins([plugin_execution.plugin], plugin_execution.project)
+        for revision in revisions:
+            revisions_to_execute_plugin_on.append(revision)
+
+    elif plugin_execution.execution_type == 'ver':
+        revisions_to_execute_plugin_on = get_revisions_for_failed_verification(plugin_execution.project)
 
+        # close connection because the above may take a long time
+        connections['default'].close()
 
-def find_required_jobs(plugin_execution, all_jobs):
-    job_list = []
-    required_plugins = plugin_execution.plugin.requires.all()
+    return revisions_to_execute_plugin_on
 
-    # If there are required plugins
-    if required_plugins:
-        # go through all plugins and set the jobs as required
-        for req_plugin in required_plugins:
-            for plugin_id, jobs_list in all_jobs.items():
-                if req_plugin.id == plugin_id:
-                    job_list.extend(jobs_list)
 
-    return job_list
+def count_revisions_to_execute(plugin_execution):
+    """Return the number of revisions get_revisions_to_execute would return, without writing anything.
 
+    For the execution types all and new the revision index is neither created nor updated: the revisions of the
+    existing index are counted and the commits stored in the mongodb since its last update are counted as new
+    revisions. The index itself is updated when the jobs are created or by the rebuild_revision_index command.
+    """
+    if plugin_execution.execution_type not in ['all', 'new']:
+        return count_revisions(get_revisions_to_execute(plugin_execution))
 
-def create_job(plugin_execution, req_jobs, revision_hash=None):
-    job = Job(plugin_execution=plugin_execution, revision_hash=revision_hash)
-    job.save()
+    index = RevisionIndex.objects.filter(project=plugin_execution.project,
+                                         vcs_system_url=plugin_execution.repository_url).first()
+    if index is None:
+        return handler.count_revisions_for_url(plugin_execution.repository_url)
 
-    for req_job in req_jobs:
-        job.requires.add(req_job)
-    job.save()
+    if plugin_execution.execution_type == 'all':
+        revisions = index.get_revision_hashes()
+    else:
+        revisions = index.get_new_revision_hashes(plugin_execution.plugin)
+    return revisions.count() + handler.count_revisions_for_url(plugin_execution.repository_url,
+                                                               index.last_commit_id or None)
 
-    return job
 
+def count_revisions(revisions):
+    if isinstance(revisions, QuerySet):
+        return revisions.count()
+    return len(revisions)
 
-def create_jobs_for_execution(project, plugin_executions):
-    jobs_temp = defaultdict(list)
-    ret_jobs = []
+
+def iterate_revisions(revisions):
+    if isinstance(revisions, QuerySet):
+        return revisions.iterator()
+    return iter(revisions)
+
+
+def requires_same_revision(plugin, req_plugin):
+    """Revision plugins that require revision plugins only need the job for the same revision."""
+    return plugin.plugin_type == 'rev' and req_plugin.plugin_type == 'rev'
+
+
+def get_job_runtime(plugin):
+    """Return the median runtime in seconds of the last successful jobs of the plugin.
+
+    If there are no finished jobs for this version of the plugin, all versions are used. Returns None if the plugin
+    never finished a job with known start and end time.
+    """
+    for jobs in [Job.objects.filter(plugin_execution__plugin=plugin),
+                 Job.objects.filter(plugin_execution__plugin__name=plugin.name)]:
+        times = jobs.filter(status='DONE', started_at__isnull=False, finished_at__isnull=False)\
+            .order_by('-pk').values_list('started_at', 'finished_at')[:settings.RUNTIME_HISTORY_SIZE]
+        runtimes = [(finished_at - started_at).total_seconds() for started_at, finished_at in times]
+        if runtimes:
+            return statistics.median(runtimes)
+
+    return None
+
+
+def plan_jobs_for_execution(project, plugin_executions, default_cores_per_job=1):
+    """Return the jobs that create_jobs_for_execution would create for the plugin executions, without creating them.
+
+    The plugin executions do not need to be saved. For each plugin execution a dict is returned with the number of
+    jobs, the number of jobs each job requires (fan_in), the median runtime of previous jobs of the plugin in seconds
+    and the estimated core hours. Runtime and core hours are None if there are no previous jobs of the plugin.
+    """
+    plan = []
+    jobs_by_plugin = {}
+
+    for plugin_execution in plugin_executions:
+        plugin = plugin_execution.plugin
+
+        if plugin.plugin_type == 'rev':
+            jobs = count_revisions_to_execute(plugin_execution)
+        elif plugin.plugin_type in ['repo', 'other']:
+            jobs = 1
+        else:
+            jobs = 0
+
+        fan_in = 0
+        for req_plugin in plugin.requires.all():
+            if req_plugin.id not in jobs_by_plugin:
+                continue
+            if requires_same_revision(plugin, req_plugin):
+                fan_in += 1
+            else:
+                fan_in += jobs_by_plugin[req_plugin.id]
+
+        runtime = get_job_runtime(plugin)
+        cores_per_job = plugin_execution.cores_per_job or default_cores_per_job
+        core_hours = None
+        if runtime is not None:
+            core_hours = jobs * runtime * cores_per_job / 3600
+
+        plan.append({
+            'plugin': str(plugin),
+            'plugin_type': plugin.plugin_type,
+            'execution_type': plugin_execution.execution_type,
+            'jobs': jobs,
+            'fan_in': fan_in,
+            'runtime': runtime,
+            'cores_per_job': cores_per_job,
+            'core_hours': core_hours,
+        })
+        jobs_by_plugin[plugin.id] = jobs
+
+    return plan
+
+
+def create_dependencies(plugin_execution, executions_by_plugin):
+    """Create the dependencies of the plugin execution on the plugin executions of its required plugins.
+
+    The executions of this run are used first, otherwise the latest execution of the required plugin for the project
+    that still has waiting jobs, so a plugin can be started while the plugins it requires are still running.
+    Revision plugins that require revision plugins only depend on the job for the same revision.
+    """
+    dependencies = []
+    for req_plugin in plugin_execution.plugin.requires.all():
+        req_execution = executions_by_plugin.get(req_plugin.id, None)
+        if req_execution is None:
+            req_execution = PluginExecution.objects.filter(project_id=plugin_execution.project_id, plugin=req_plugin,
+                                                           job__status='WAIT').order_by('-pk').first()
+        if req_execution is not None:
+            dependencies.append(ExecutionDependency(plugin_execution=plugin_execution, required_execution=req_execution,
+                                                    match_revision=requires_same_revision(plugin_execution.plugin, req_plugin)))
+
+    ExecutionDependency.objects.bulk_create(dependencies)
+    return dependencies
+
+
+class JobCreator(object):
+    """Creates the jobs of one plugin execution in batches.
+
+    Jobs are collected in memory and written with bulk_create once batch_size jobs are pending. Only counters are
+    kept after a batch is written, so the memory used does not depend on the number of revisions. If submit is
+    given, it is called with the plugin execution and the jobs of each batch after the batch is written. Requirements between
+    jobs are not stored per job, they follow from the ExecutionDependency objects of the plugin execution.
+    """
+
+    def __init__(self, plugin_execution, batch_size=None, progress=None, submit=None):
+        self.plugin_execution = plugin_execution
+        self.batch_size = batch_size or settings.JOB_CREATION_BATCH_SIZE
+        self.progress = progress
+        self.submit = submit
+        self.created = 0
+        self._pending = []
+
+        # bulk_create does not return primary keys on MySQL, we find the new jobs by their ids instead
+        self._last_id = Job.objects.filter(plugin_execution=plugin_execution).aggregate(last_id=Max('pk'))['last_id'] or 0
+
+    def add(self, revision_hash=None):
+        self._pending.append(Job(plugin_execution=self.plugin_execution, revision_hash=revision_hash))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+
+        with transaction.atomic():
+            Job.objects.bulk_create(self._pending, batch_size=self.batch_size)
+            job_ids = list(Job.objects.filter(plugin_execution=self.plugin_execution, pk__gt=self._last_id)
+                           .order_by('pk').values_list('pk', flat=True))
+
+        first_id = self._last_id
+        self._last_id = job_ids[-1]
+        self.created += len(job_ids)
+        self._pending = []
+
+        logger.info('Created {} jobs for plugin execution {}'.format(self.created, self.plugin_execution.pk))
+        if self.progress is not None:
+            self.progress(self.plugin_execution, self.created)
+
+        if self.submit is not None:
+            self.submit(self.plugin_execution, Job.objects.filter(plugin_execution=self.plugin_execution,
+                                                                  pk__gt=first_id, pk__lte=self._last_id).order_by('pk'))
+
+
+def create_jobs_for_execution(project, plugin_executions, progress=None, submit=None):
+    """Create the jobs for the given plugin executions and return the number of created jobs.
+
+    Revisions are read from the revision index with a server side cursor and written in batches, so the jobs of
+    large repositories are never held in memory at once.
+
+    :param progress: optional callable which is called with the plugin execution and the number of jobs created
+                     for it so far after each written batch
+    :param submit: optional callable which is called with the plugin execution and the jobs of each written batch,
+                   e.g. PluginManagementInterface.submit_jobs to submit jobs while the remaining jobs are created
+    """
+    executions_by_plugin = {}
+    created = 0
 
     # We have three plugin_types that are interesting here: repo, rev and other. We need to define to handle them
     # separately
     for plugin_execution in plugin_executions:
-        req_jobs = find_required_jobs(plugin_execution, jobs_temp)
+        create_dependencies(plugin_execution, executions_by_plugin)
+        creator = JobCreator(plugin_execution, progress=progress, submit=submit)
 
         if plugin_execution.plugin.plugin_type == 'other':
-            job = create_job(plugin_execution, req_jobs)
-            jobs_temp[plugin_execution.plugin.id].append(job)
-            ret_jobs.append(job)
+            creator.add()
 
         if plugin_execution.plugin.plugin_type == 'repo':
-            job = create_job(plugin_execution, req_jobs)
-            jobs_temp[plugin_execution.plugin.id].append(job)
-            ret_jobs.append(job)
+            creator.add()
 
         if plugin_execution.plugin.plugin_type == 'rev':
-            revisions_to_execute_plugin_on = []
-
-            # We need to get all actual revisions first, if we want to execute them on all revisions or new ones
-            if plugin_execution.execution_type == 'all' or plugin_execution.execution_type == 'new':
-                all_revisions = get_all_revisions(plugin_execution)
-
-            if plugin_execution.execution_type == 'all':
-                revisions_to_execute_plugin_on = all_revisions
-            elif plugin_execution.execution_type == 'rev':
-                if len(plugin_execution.revisions.split(",")) == 1:
-                    revisions_to_execute_plugin_on.append(plugin_execution.revisions)
-                else:
-                    # If only some revisions (comma-separated list) need to be executed, create path and add it to list
-                    for revision in plugin_execution.revisions.split(","):
-                        revisions_to_execute_plugin_on.append(revision)
-
-            elif plugin_execution.execution_type == 'new':
-                # Get all jobs that were executed with this plugin on this project
-                jobs = plugin_execution.plugin.get_all_jobs_for_project(plugin_execution.project)
-                job_revision_hashes = [job.revision_hash for job in jobs]
-
-                # Go through all paths: If the revision was already processed by a job, it is not new, so exclude it
-                for revision in all_revisions:
-                    if revision not in job_revision_hashes:
-                        revisions_to_execute_plugin_on.append(revision)
-
-            elif plugin_execution.execution_type == 'error':
-                # Get all revisions on which this plugin failed (in some revisions) on this project. Important:
-                # if the plugin on revision X failed in first run, but worked on revision X in the second it is not
-                # longer marked as failing for this revision
-                revisions = get_revisions_for_failed_plugins([plugin_execution.plugin], plugin_execution.project)
-                for revision in revisions:
-                    revisions_to_execute_plugin_on.append(revision)
-
-            elif plugin_execution.execution_type == 'ver':
-                revisions_to_execute_plugin_on = get_revisions_for_failed_verification(plugin_execution.project)
-
-                # close connection because the above may take a long time
-                connections['default'].close()
-
-            # Create command
-            for revision in revisions_to_execute_plugin_on:
-                job = create_job(plugin_execution, req_jobs, revision_hash=revision)
-
-                jobs_temp[plugin_execution.plugin.id].append(job)
-                ret_jobs.append(job)
-
-    return ret_jobs
+            for revision in iterate_revisions(get_revisions_to_execute(plugin_execution)):
+                creator.add(revision_hash=revision)
+
+        creator.flush()
+        executions_by_plugin[plugin_execution.plugin.id] = plugin_execution
+        created += creator.created
+
+    return created
+
+
+def submit_pending_jobs(interface, plugin_execution, jobs=None):
+    """Submit the jobs of the plugin execution that are not submitted yet and return the number of submitted jobs.
+
+    At most JOB_CREATION_BATCH_SIZE jobs are submitted at once, only the given jobs if jobs is set, and never more than
+    the interface has capacity for. The remaining jobs are submitted by the next call of the submit_jobs command. Jobs
+    are only submitted after all jobs they require, otherwise they could not wait for them.
+
+    The interface stores every submitted job as soon as the backend accepted it, no transaction is open during the
+    submission. Jobs that the backend did not accept are tried again, after JOB_SUBMISSION_MAX_ATTEMPTS failed attempts
+    they are given up and get the state EXIT.
+    """
+    # the lock keeps the job submission thread and the submit_jobs command from submitting the same jobs, locks of
+    # processes that died during the submission expire
+    locked_at = timezone.now()
+    expired = locked_at - datetime.timedelta(seconds=settings.JOB_SUBMISSION_LOCK_TIMEOUT)
+    if not PluginExecution.objects.filter(Q(submission_locked_at__isnull=True) | Q(submission_locked_at__lt=expired),
+                                          pk=plugin_execution.pk).update(submission_locked_at=locked_at):
+        return 0
+
+    try:
+        if Job.objects.filter(plugin_execution__dependents__plugin_execution=plugin_execution, submitted=False)\
+                .exclude(status='EXIT').exists():
+            return 0
+
+        if jobs is None:
+            jobs = Job.objects.filter(plugin_execution=plugin_execution)
+        limit = settings.JOB_CREATION_BATCH_SIZE
+        capacity = interface.get_submission_capacity(plugin_execution)
+        if capacity is not None:
+            limit = min(limit, capacity)
+        jobs = list(jobs.filter(submitted=False).exclude(status='EXIT').order_by('pk')[:limit])
+        if not jobs:
+            return 0
+
+        try:
+            return interface.submit_jobs(plugin_execution, jobs)
+        finally:
+            _count_failed_submissions(jobs)
+    finally:
+        PluginExecution.objects.filter(pk=plugin_execution.pk, submission_locked_at=locked_at)\
+            .update(submission_locked_at=None)
+
+
+def _count_failed_submissions(jobs):
+    failed = Job.objects.filter(pk__in=[job.pk for job in jobs], submitted=False)
+    failed.update(submission_attempts=F('submission_attempts') + 1)
+
+    given_up = failed.filter(submission_attempts__gte=settings.JOB_SUBMISSION_MAX_ATTEMPTS)
+    given_up_ids = list(given_up.values_list('pk', flat=True))
+    if given_up_ids:
+        logger.error('Giving up the submission of jobs {} after {} attempts'.format(
+            given_up_ids, settings.JOB_SUBMISSION_MAX_ATTEMPTS))
+        Job.objects.filter(pk__in=given_up_ids).update(status='EXIT')
+
+
+def reconcile_job_states(interface, jobs):
+    """Fetch the states of the jobs from the backend and store the states that changed.
+
+    Changed jobs are updated with one query per state and batch instead of one save per job. Returns the number of
+    jobs whose state changed.
+    """
+    jobs = list(jobs)
+    job_stati = interface.get_job_stati(jobs)
+
+    changed = {}
+    for job, status in zip(jobs, job_stati):
+        if status != job.status:
+            changed.setdefault(status, []).append(job.pk)
+
+    for status, job_ids in changed.items():
+        for start in range(0, len(job_ids), settings.JOB_STATE_BATCH_SIZE):
+            Job.objects.filter(pk__in=job_ids[start:start + settings.JOB_STATE_BATCH_SIZE]).update(status=status)
+
+    return sum(len(job_ids) for job_ids in changed.values())
+
+
+def reconcile_plugin_execution(interface, plugin_execution):
+    """Reconcile the states of all waiting jobs of the plugin execution in batches and return the number of changes."""
+    reconciled_at = timezone.now()
+    jobs = Job.objects.filter(plugin_execution=plugin_execution, status='WAIT', submitted=True)\
+        .only('pk', 'status', 'job_id', 'array_name', 'array_task_id', 'plugin_execution_id').order_by('pk')
+
+    changed = 0
+    last_id = 0
+    with interface.job_state_poll():
+        while True:
+            batch = list(jobs.filter(pk__gt=last_id)[:settings.JOB_STATE_BATCH_SIZE])
+            if not batch:
+                break
+            changed += reconcile_job_states(interface, batch)
+            last_id = batch[-1].pk
+
+    PluginExecution.objects.filter(pk=plugin_execution.pk).update(reconciled_at=reconciled_at)
+    return changed
+
+
+def store_completion_records(records):
+    """Store the completion records "<job id> <exit code> <start> <end> <peak rss in kB>" written by finished jobs.
+
+    Start and end are unix timestamps. Jobs with exit code 0 are DONE, all others EXIT. The jobs are updated with one
+    query per batch. Returns the job ids of all parsed records, including those of jobs that do not exist anymore.
+    """
+    completions = {}
+    for record in records:
+        try:
+            job_id, exit_code, started_at, finished_at, max_rss = [int(value) for value in record.split()]
+        except ValueError:
+            logger.error('Could not parse completion record: %s' % record)
+            continue
+
+        completions[job_id] = {
+            'status': 'DONE' if exit_code == 0 else 'EXIT',
+            'exit_code': exit_code,
+            'started_at': datetime.datetime.fromtimestamp(started_at, tz=timezone.utc),
+            'finished_at': datetime.datetime.fromtimestamp(finished_at, tz=timezone.utc),
+            'max_rss': max_rss,
+        }
+
+    update_jobs(completions, {'status': CharField(), 'exit_code': IntegerField(), 'started_at': DateTimeField(),
+                              'finished_at': DateTimeField(), 'max_rss': BigIntegerField()})
+
+    return list(completions.keys())
+
+
+def update_jobs(values, fields):
+    """Update the jobs in values, a dict of job id to a dict of field to value, with one query per 1000 jobs.
+
+    fields maps the names of the updated fields to their output field, every job needs a value for every field.
+    """
+    job_ids = list(values.keys())
+    for start in range(0, len(job_ids), 1000):
+        chunk = job_ids[start:start + 1000]
+        Job.objects.filter(pk__in=chunk).update(**{
+            field: Case(*[When(pk=job_id, then=Value(values[job_id][field])) for job_id in chunk],
+                        output_field=output_field)
+            for field, output_field in fields.items()
+        })
+
+
+def collect_job_accounting(interface):
+    """Store the accounting of finished jobs from the backend and return the number of updated jobs.
+
+    Only jobs of plugin executions submitted in the last JOB_ACCOUNTING_DAYS days without cpu time are considered.
+    Start, end and peak memory that are already known, e.g., from completion records, are kept.
+    """
+    since = timezone.now() - datetime.timedelta(days=settings.JOB_ACCOUNTING_DAYS)
+    jobs = Job.objects.filter(status__in=['DONE', 'EXIT'], submitted=True, job_id__isnull=False, cpu_time__isnull=True,
+                              plugin_execution__submitted_at__gte=since)\
+        .only('pk', 'job_id', 'array_name', 'array_task_id', 'started_at', 'finished_at', 'max_rss').order_by('pk')
+
+    updated = 0
+    last_id = 0
+    while True:
+        batch = list(jobs.filter(pk__gt=last_id)[:settings.JOB_STATE_BATCH_SIZE])
+        if not batch:
+            break
+        last_id = batch[-1].pk
+
+        accounting = interface.get_job_accounting(batch)
+        values = {}
+        for job in batch:
+            if job.pk in accounting:
+                job_accounting = accounting[job.pk]
+                values[job.pk] = {
+                    'started_at': job.started_at or job_accounting['started_at'],
+                    'finished_at': job.finished_at or job_accounting['finished_at'],
+                    'max_rss': job.max_rss or job_accounting['max_rss'],
+                    'cpu_time': job_accounting['cpu_time'],
+                }
+
+        update_jobs(values, {'started_at': DateTimeField(), 'finished_at': DateTimeField(),
+                             'max_rss': BigIntegerField(), 'cpu_time': FloatField()})
+        updated += len(values)
+
+    return updated
+
+
+def _percentile(values, percent=95):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(math.ceil(len(values) * percent / 100.0)) - 1)]
+
+
+def predict_job_resources(plugin, attempts=0):
+    """Return the walltime in seconds, the peak memory in kB and the cores for a job of the plugin.
+
+    The prediction is RESOURCE_MARGIN times the 95th percentile of the last successful jobs of this version of the
+    plugin, or of all versions if this version has not enough jobs yet. Walltime and memory are doubled for every
+    previous failed attempt of the job, at most RESOURCE_MAX_ESCALATIONS times. Returns None if the plugin has less
+    than RESOURCE_HISTORY_MIN_JOBS successful jobs, values without history, e.g., the cores, are None.
+    """
+    for jobs in [Job.objects.filter(plugin_execution__plugin=plugin),
+                 Job.objects.filter(plugin_execution__plugin__name=plugin.name)]:
+        history = list(jobs.filter(status='DONE', started_at__isnull=False, finished_at__isnull=False)
+                       .order_by('-pk').values_list('started_at', 'finished_at', 'max_rss', 'cpu_time')
+                       [:settings.RUNTIME_HISTORY_SIZE])
+        if len(history) >= settings.RESOURCE_HISTORY_MIN_JOBS:
+            break
+    else:
+        return None
+
+    factor = settings.RESOURCE_MARGIN * 2 ** min(attempts, settings.RESOURCE_MAX_ESCALATIONS)
+    runtimes = [max(1.0, (finished_at - started_at).total_seconds()) for started_at, finished_at, _, _ in history]
+    memory = [max_rss for _, _, max_rss, _ in history if max_rss]
+    cores = [cpu_time / runtime for runtime, (_, _, _, cpu_time) in zip(runtimes, history) if cpu_time]
+
+    return {
+        'time': int(min(settings.RESOURCE_MAX_TIME, max(settings.RESOURCE_MIN_TIME, _percentile(runtimes) * factor))),
+        'memory': int(_percentile(memory) * factor) if memory else None,
+        'cores': max(1, int(math.ceil(_percentile(cores)))) if cores else None,
+    }
+
+
+def get_previous_attempts(plugin_execution, revisions=None):
+    """Return the highest number of failed jobs of the plugin for the project and one of the revisions."""
+    failed = Job.objects.filter(plugin_execution__plugin__name=plugin_execution.plugin.name,
+                                plugin_execution__project_id=plugin_execution.project_id, status='EXIT')\
+        .exclude(plugin_execution=plugin_execution)\
+        .exclude(submitted=False, submission_attempts__gt=0)
+
+    if not revisions:
+        return failed.filter(revision_hash__isnull=True).count()
+
+    attempts = 0
+    revisions = list(revisions)
+    for start in range(0, len(revisions), 500):
+        counts = failed.filter(revision_hash__in=revisions[start:start + 500]).values('revision_hash')\
+            .annotate(attempts=Count('pk')).values_list('attempts', flat=True)
+        attempts = max([attempts] + list(counts))
+    return attempts
@@ -1,23 +1,38 @@
+import collections
+import contextlib
+import datetime
+import hashlib
+import math
 import os
 import re
+import shlex
 import string
 import subprocess
 import threading
 import uuid
 import logging
 
-from pycoshark.mongomodels import VCSSystem
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.db.models import Case, When, Value, IntegerField
 
 from server.settings import HPC
 
 from smartshark.utils.connector import BaseConnector
+from smartshark.datacollection.executionutils import submit_pending_jobs, predict_job_resources, get_previous_attempts
 from smartshark.datacollection.pluginmanagementinterface import PluginManagementInterface
-from smartshark.models import Job
+from smartshark.models import Job, PluginExecution
 from smartshark.scp import SCPClient
 from smartshark.shellhandler import ShellHandler
+from smartshark.utils.joblog import BATCH_REVISION_MARKER, SPLIT_BATCH_LOG_AWK, get_archive_command, \
+    get_grep_command, get_search_archive_command, open_log_or_archive, parse_grep_output, run_grep, search_archive
 
 logger = logging.getLogger('hpcconnector')
 
+# prints "<job id> <revision>" of the jobs of the slurm array task from the index file of the array given to array.sh
+TASK_JOBS = 'awk -v TASK="$SLURM_ARRAY_TASK_ID" \'$1 == TASK {print $2, $3}\' "$1"'
+
 
 class JobSubmissionThread(threading.Thread):
     def __init__(self, path_to_remote_file, host, username, password, port, tunnel_host, tunnel_username,
@@ -36,8 +51,8 @@ class JobSubmissionThread(threading.Thread):
         self.ssh_key_path = ssh_key_path
 
     def run(self):
-        with ShellHandler(self.host, self.username, self.password, self.port, self.tunnel_host,
-                          self.tunnel_username, self.tunnel_password, self.tunnel_port, self.use_tunnel, 10020, self.ssh_key_path) as handler:
+        with ShellHandler(self.host, self.username, self.password, self.port, self.tunnel_host, self.tunnel_username,
+                          self.tunnel_password, self.tunnel_port, self.use_tunnel, self.ssh_key_path) as handler:
             out, err = handler.execute_file(self.remote_file, False)
             logger.debug(out)
             logger.debug(err)
@@ -72,49 +87,86 @@ class HPCConnector(PluginManagementInterface, BaseConnector):
         self.cores_per_job = HPC['cores_per_job']
         self.local_log_path = HPC['local_log_path']
         self.ssh_key_path = HPC['ssh_key_path']
+        self.max_array_size = HPC.get('max_array_size', 1000)
+        self.array_throttle = HPC.get('array_throttle', None)
+        self.spool_path = HPC.get('spool_path', os.path.join(HPC['root_path'], 'spool'))
+        self.local_spool_path = HPC.get('local_spool_path', '')
+        self.scratch_path = HPC.get('scratch_path', '${TMPDIR:-/tmp}')
+        self.pack_size = HPC.get('pack_size', 1)
+        self.pack_parallelism = HPC.get('pack_parallelism', 1)
+        self.max_queued_jobs = HPC.get('max_queued_jobs', None)
+        self.max_array_dependencies = HPC.get('max_array_dependencies', 100)
+        # cache key to polled states of the current poll and the keys of the changed ones (see job_state_poll)
+        self._job_state_polls = None
+        self._changed_job_state_polls = set()
 
     @property
     def identifier(self):
         return 'GWDG'
 
+    @property
+    def cache_logs(self):
+        # logs read over sftp are cached, logs in the local log path are read directly
+        return not self.local_log_path
+
+    def _shell(self):
+        """Return a ShellHandler for the cluster, the ssh connection is taken from the process wide pool."""
+        return ShellHandler(self.host, self.username, self.password, self.port, self.tunnel_host, self.tunnel_username,
+                            self.tunnel_password, self.tunnel_port, self.use_tunnel, self.ssh_key_path)
+
     def default_queue(self):
         return self.queue
 
     def default_cores_per_job(self):
         return self.cores_per_job
 
-    def generate_bsub_command(self, plugin_command, job, plugin_execution_output_path):
-        output_path = os.path.join(plugin_execution_output_path, str(job.id) + '_out.txt')
-        error_path = os.path.join(plugin_execution_output_path, str(job.id) + '_err.txt')
+    def _get_sbatch_options(self, plugin_execution, output_path, error_path, name, parallelism=1, revisions=None,
+                            pack_size=1):
+        """Return the options of sbatch for jobs of the plugin execution for the given revisions.
 
+        Walltime, memory and cores are predicted from previous jobs of the plugin (see predict_job_resources), the
+        configured cores per job are an upper bound. Array tasks which run pack_size jobs, parallelism of them at the
+        same time, get the walltime of pack_size / parallelism jobs in a row, at most RESOURCE_MAX_TIME.
+        """
         cores_per_job = self.cores_per_job
         queue = self.queue
 
         # plugin execution may want to override some settings
-        if job.plugin_execution.cores_per_job:
-            cores_per_job = job.plugin_execution.cores_per_job
-        if job.plugin_execution.queue:
-            queue = job.plugin_execution.queue
+        if plugin_execution.cores_per_job:
+            cores_per_job = plugin_execution.cores_per_job
+        if plugin_execution.queue:
+            queue = plugin_execution.queue
+
+        walltime = '2-00:00:00'
+        memory = ''
+        resources = predict_job_resources(plugin_execution.plugin, get_previous_attempts(plugin_execution, revisions))
+        if resources:
+            time = min(settings.RESOURCE_MAX_TIME, resources['time'] * int(math.ceil(pack_size / parallelism)))
+            walltime = '%d-%02d:%02d:%02d' % (time // 86400, time % 86400 // 3600, time % 3600 // 60, time % 60)
+            if resources['cores']:
+                cores_per_job = min(cores_per_job, resources['cores'])
+            if resources['memory']:
+                memory = ' --mem=%sM' % int(math.ceil(resources['memory'] * parallelism / 1024.0))
+
+        # packed array tasks run several jobs at the same time, each of them gets the cores of a job
+        cores_per_job *= parallelism
+
+        return '--parsable -n %s -t %s%s -p %s -o %s -e %s -N %s -J "%s"' % (cores_per_job, walltime, memory, queue, output_path, error_path, self.hosts_per_job, name)
+
+    def generate_bsub_command(self, job, plugin_execution_output_path, dependency=''):
+        # the output of slurm itself, the logs of the plugin are written by run.sh
+        output_path = os.path.join(plugin_execution_output_path, str(job.id) + '_slurm_out.txt')
+        error_path = os.path.join(plugin_execution_output_path, str(job.id) + '_slurm_err.txt')
 
         # bsub_command = 'bsub -n %s -W 48:00 -q %s -o %s -e %s -J "%s" ' % (cores_per_job, queue, output_path, error_path, job.id)
-        bsub_command = '/opt/slurm/bin/sbatch -n %s -t 2-00:00:00 -p %s -o %s -e %s -N %s -J "%s" ' % (cores_per_job, queue, output_path, error_path, self.hosts_per_job, job.id)
-
-        # required jobs no longer used
-        # req_jobs = job.requires.all()
-        # if req_jobs:
-        #     bsub_command += "-w '"
-        #     for req_job in req_jobs:
-        #         bsub_command += 'ended("%s") && ' % str(req_job.id)
-
-        #     bsub_command = bsub_command[:-4]
-        #     bsub_command += "' "
-
-        command = string.Template(plugin_command).safe_substitute({
-            'path': os.path.join(self.project_path, job.plugin_execution.project.name),
-            'revision': job.revision_hash
-        })
-
-        full_cmd = "%s%s" % (bsub_command, command)
+        revisions = [job.revision_hash] if job.revision_hash else None
+        bsub_command = '/opt/slurm/bin/sbatch %s ' % self._get_sbatch_options(job.plugin_execution, output_path, error_path,
+                                                                            job.id, revisions=revisions)
+        if dependency:
+            bsub_command += dependency + ' '
+
+        full_cmd = '%s%s %s %s' % (bsub_command, os.path.join(plugin_execution_output_path, 'run.sh'), job.id,
+                                   job.revision_hash or '')
         logger.debug('Generated bsub command: %s' % full_cmd)
 
         return full_cmd
@@ -122,27 +174,580 @@ class HPCConnector(PluginManagementInterface, BaseConnector):
     def get_sent_bash_command(self, job):
         plugin_command = self._generate_plugin_execution_command(self.plugin_path, job.plugin_execution)
         plugin_execution_output_path = os.path.join(self.log_path, str(job.plugin_execution.id))
-        return self.generate_bsub_command(plugin_command, job, plugin_execution_output_path)
+
+        command = string.Template(plugin_command).safe_substitute({
+            'path': self._get_job_path(job.plugin_execution),
+            'revision': job.revision_hash
+        })
+        return '%s\n%s' % (self.generate_bsub_command(job, plugin_execution_output_path), command)
 
     def execute_plugins(self, project, plugin_executions):
+        self.prepare_execution(project, plugin_executions)
+
+        for plugin_execution in plugin_executions:
+            # jobs that do not fit into the queue are submitted later by the submit_jobs command
+            while submit_pending_jobs(self, plugin_execution):
+                pass
+
+    def prepare_execution(self, project, plugin_executions):
         # Prepare project (clone / pull)
         logger.info('Preparing project...')
         self.prepare_project(plugin_executions)
 
-        logger.info('Generating bsub script...')
-        commands = []
+        self.execute_command('mkdir -p %s' % self.spool_path, ignore_errors=True)
         for plugin_execution in plugin_executions:
-            plugin_command = self._generate_plugin_execution_command(self.plugin_path, plugin_execution)
-
-            jobs = Job.objects.filter(plugin_execution=plugin_execution).all()
             plugin_execution_output_path = os.path.join(self.log_path, str(plugin_execution.id))
             self.execute_command('mkdir %s' % plugin_execution_output_path, ignore_errors=True)
 
-            for job in jobs:
-                commands.append(self.generate_bsub_command(plugin_command, job, plugin_execution_output_path))
+    def get_queue_capacity(self):
+        """Return how many more jobs or array tasks may be queued for the user, None if there is no limit."""
+        if not self.max_queued_jobs:
+            return None
+
+        # -r lists every array task, they count against the limits of the site like single jobs
+        queued = self.execute_command('/opt/slurm/bin/squeue -h -r -u %s -o %%i | wc -l' % self.username)
+        return max(0, self.max_queued_jobs - int(queued[0].strip()))
 
-        logger.info('Sending and executing bsub script...')
-        self.send_and_execute_file(commands, False)
+    def get_submission_capacity(self, plugin_execution):
+        """Return how many jobs fit into the queue (see max_queued_jobs), packed jobs share one array task."""
+        capacity = self.get_queue_capacity()
+        if capacity is not None and plugin_execution.plugin.plugin_type == 'rev':
+            capacity *= self._get_pack(plugin_execution)[0]
+        return capacity
+
+    def submit_jobs(self, plugin_execution, jobs):
+        """Submit the jobs, submit_pending_jobs never passes more jobs than fit into the queue."""
+        jobs = list(jobs)
+        if plugin_execution.plugin.plugin_type == 'rev':
+            return self.submit_job_arrays(plugin_execution, jobs)
+
+        logger.info('Generating bsub script...')
+        plugin_execution_output_path = os.path.join(self.log_path, str(plugin_execution.id))
+        self.create_job_scripts(plugin_execution)
+
+        # jobs of other plugins do not depend on single revisions, all jobs wait for the same jobs
+        dependency = self.get_dependency_option(self._get_required_slurm_jobs(plugin_execution, [])[0])
+
+        commands = []
+        for job in jobs:
+            job.plugin_execution = plugin_execution
+            # sbatch --parsable prints the slurm job id, we prefix it with the job to store it afterwards
+            commands.append('echo "%s $(%s)"' % (job.id, self.generate_bsub_command(job, plugin_execution_output_path,
+                                                                                      dependency)))
+
+        # we wait for the submission of the batch, this keeps the jobs in the queue in the order of their creation
+        logger.info('Sending and executing bsub script for {} jobs...'.format(len(commands)))
+        out = self.send_and_execute_file(commands, True)
+        return self.store_slurm_job_ids(out)
+
+    def submit_job_arrays(self, plugin_execution, jobs):
+        """Submit the jobs of a revision plugin execution as slurm job arrays of at most max_array_size tasks.
+
+        Every array gets an index file with one line "<task id> <job id> <revision>" per job. The array script
+        (see create_job_scripts) resolves job id and revision of the task from the lines of the index file and writes
+        the logs of the task to the same files as a single job would. The jobs remember the name of their array and
+        their task id, get_job_stati uses these to map the states of the array tasks back to the jobs.
+
+        If pack_size is larger than one, every array task runs up to pack_size jobs, pack_parallelism of them at the
+        same time. This saves the scheduling overhead for short jobs. The jobs still write their own logs and
+        completion records, the task fails if one of its jobs failed.
+        Plugins with a revision_batch_size are called once per array task for up to revision_batch_size revisions.
+        The jobs are split into arrays by the jobs they require (see _get_arrays).
+        """
+        pack_size, parallelism = self._get_pack(plugin_execution)
+        plugin_execution_output_path = os.path.join(self.log_path, str(plugin_execution.id))
+        run_script, array_script = self.create_job_scripts(plugin_execution)
+
+        # the jobs of a revision batch store the runtime of the whole call, the prediction is already the one of a task
+        jobs_per_task = 1 if plugin_execution.plugin.revision_batch_size else pack_size
+
+        execution_job_ids, revision_jobs = self._get_required_slurm_jobs(plugin_execution, jobs)
+        commands = []
+        array_jobs = {}
+        for tasks, aftercorr, afterok in self._get_arrays([(job.pk, job.revision_hash) for job in jobs], pack_size,
+                                                          revision_jobs):
+            array_name = 'array_%s' % tasks[0][1]
+            index_file = os.path.join(plugin_execution_output_path, array_name + '.txt')
+            array_jobs[array_name] = [pk for task_id, pk, revision in tasks]
+
+            self.write_remote_file(index_file, ''.join('%s %s %s\n' % task for task in tasks))
+            Job.objects.filter(pk__in=[pk for task_id, pk, revision in tasks]).update(
+                array_name=array_name,
+                array_task_id=Case(*[When(pk=pk, then=Value(task_id)) for task_id, pk, revision in tasks],
+                                   output_field=IntegerField())
+            )
+
+            array = self._get_array_spec(sorted(set(task_id for task_id, pk, revision in tasks)))
+            if self.array_throttle:
+                array += '%%%s' % self.array_throttle
+
+            # the output of slurm itself, the logs of the plugin are written by the array script
+            output_path = os.path.join(plugin_execution_output_path, array_name + '_%a_slurm_out.txt')
+            error_path = os.path.join(plugin_execution_output_path, array_name + '_%a_slurm_err.txt')
+            dependency = self.get_dependency_option(execution_job_ids | afterok, [aftercorr] if aftercorr else [])
+            commands.append('echo "%s $(/opt/slurm/bin/sbatch %s %s--array=%s %s %s)"' % (
+                array_name, self._get_sbatch_options(plugin_execution, output_path, error_path, array_name, parallelism,
+                                                     [revision for task_id, pk, revision in tasks], jobs_per_task),
+                dependency + ' ' if dependency else '', array,
+                array_script, index_file))
+
+        logger.info('Sending and executing bsub script for {} job arrays...'.format(len(commands)))
+        out = self.send_and_execute_file(commands, True)
+        return self.store_slurm_job_ids(out, array_jobs)
+
+    def _get_arrays(self, jobs, pack_size, revision_jobs):
+        """Split the jobs, a list of (job id, revision), into job arrays and return them as list of
+        (tasks, aftercorr, afterok), tasks is a list of (task id, job id, revision).
+
+        revision_jobs maps revisions to the waiting slurm jobs they require (see _get_required_slurm_jobs). Jobs which
+        require a task of a waiting job array get the task id of the task they require, unless the task would get more
+        than pack_size jobs, and their array waits with aftercorr on the required array. So every task starts as
+        soon as the tasks with its revisions succeeded and is cancelled if one of them failed. Other jobs with
+        waiting required jobs are packed into arrays which wait with afterok for the required jobs of all their jobs,
+        at most max_array_dependencies of them per array. Jobs without waiting required jobs are packed into arrays
+        without dependency.
+        """
+        corresponding = collections.OrderedDict()
+        required = []
+        free = []
+        for pk, revision in jobs:
+            slurm_jobs = revision_jobs.get(revision, set())
+            if not slurm_jobs:
+                free.append((pk, revision))
+            elif len(slurm_jobs) == 1 and next(iter(slurm_jobs))[1] is not None:
+                job_id, task_id = next(iter(slurm_jobs))
+                tasks = corresponding.setdefault(job_id, collections.OrderedDict())
+                tasks.setdefault(task_id, []).append((pk, revision))
+            else:
+                required.append((slurm_jobs, pk, revision))
+
+        arrays = []
+        for job_id, tasks in corresponding.items():
+            array_tasks = []
+            for task_id, task_jobs in sorted(tasks.items()):
+                if len(task_jobs) > pack_size:
+                    required.extend(({(job_id, task_id)}, pk, revision) for pk, revision in task_jobs)
+                else:
+                    array_tasks.extend((task_id, pk, revision) for pk, revision in task_jobs)
+            if array_tasks:
+                arrays.append((array_tasks, job_id, set()))
+
+        # jobs which require the same jobs are next to each other, so arrays wait for as few jobs as possible
+        required.sort(key=lambda job: sorted((job_id, -1 if task_id is None else task_id)
+                                             for job_id, task_id in job[0]))
+        groups = [([], set())]
+        for slurm_jobs, pk, revision in required:
+            dependencies = set(job_id if task_id is None else '%s_%s' % (job_id, task_id)
+                               for job_id, task_id in slurm_jobs)
+            array_jobs, afterok = groups[-1]
+            if len(array_jobs) == self.max_array_size * pack_size or \
+                    len(afterok | dependencies) > self.max_array_dependencies:
+                array_jobs, afterok = [], set()
+                groups.append((array_jobs, afterok))
+            array_jobs.append((pk, revision))
+            afterok |= dependencies
+
+        for start in range(0, len(free), self.max_array_size * pack_size):
+            groups.append((free[start:start + self.max_array_size * pack_size], set()))
+
+        for array_jobs, afterok in groups:
+            if array_jobs:
+                arrays.append(([(i // pack_size, pk, revision) for i, (pk, revision) in enumerate(array_jobs)], None,
+                               afterok))
+        return arrays
+
+    def _get_array_spec(self, task_ids):
+        """Return the --array option of sbatch for the sorted task ids, consecutive ids are given as range."""
+        ranges = []
+        for task_id in task_ids:
+            if ranges and ranges[-1][1] == task_id - 1:
+                ranges[-1][1] = task_id
+            else:
+                ranges.append([task_id, task_id])
+        return ','.join(str(first) if first == last else '%s-%s' % (first, last) for first, last in ranges)
+
+    def _get_required_slurm_jobs(self, plugin_execution, jobs):
+        """Return the waiting slurm jobs which the jobs of the plugin execution require (see ExecutionDependency).
+
+        Returns the slurm job ids which all jobs require and a dict of revision to the set of (slurm job id, array task
+        id) which the jobs of the revision require, the task id is None for single jobs. Only required jobs that are
+        still waiting and still in the queue of slurm are considered. Jobs which finished but whose state is not
+        reconciled yet are not waited for, slurm would regard a dependency on a purged job as invalid and cancel the
+        jobs waiting for it.
+        """
+        execution_job_ids = set()
+        revision_jobs = collections.defaultdict(set)
+        revisions = list(set(job.revision_hash for job in jobs if job.revision_hash))
+        for dependency in plugin_execution.dependencies.all():
+            required_jobs = Job.objects.filter(plugin_execution_id=dependency.required_execution_id, status='WAIT',
+                                               job_id__isnull=False)
+
+            if not dependency.match_revision:
+                execution_job_ids.update(required_jobs.values_list('job_id', flat=True).distinct())
+                continue
+
+            for start in range(0, len(revisions), 500):
+                for revision, job_id, array_task_id in required_jobs.filter(
+                        revision_hash__in=revisions[start:start + 500]).values_list('revision_hash', 'job_id',
+                                                                                   'array_task_id'):
+                    revision_jobs[revision].add((job_id, array_task_id))
+
+        if not execution_job_ids and not revision_jobs:
+            return execution_job_ids, revision_jobs
+
+        # -r lists every array task as "<slurm job id>_<task id>"
+        queued = set(line.strip() for line in self.execute_command('/opt/slurm/bin/squeue -h -r -u %s -o %%i' %
+                                                                   self.username))
+        queued_job_ids = set(entry.split('_')[0] for entry in queued)
+        execution_job_ids = set(job_id for job_id in execution_job_ids if str(job_id) in queued_job_ids)
+        for revision in list(revision_jobs):
+            revision_jobs[revision] = set(
+                (job_id, task_id) for job_id, task_id in revision_jobs[revision]
+                if (str(job_id) in queued_job_ids if task_id is None else '%s_%s' % (job_id, task_id) in queued)
+            )
+            if not revision_jobs[revision]:
+                del revision_jobs[revision]
+        return execution_job_ids, revision_jobs
+
+    def get_dependency_option(self, afterok, aftercorr=()):
+        """Return the sbatch option which lets jobs wait with afterok for the slurm jobs in afterok, single array tasks
+        are given as "<slurm job id>_<task id>", and with aftercorr for the tasks with the same task ids of the job
+        arrays in aftercorr. Jobs whose required jobs fail are cancelled by slurm.
+        """
+        dependencies = []
+        if afterok:
+            dependencies.append('afterok:' + ':'.join(sorted(str(job_id) for job_id in afterok)))
+        if aftercorr:
+            dependencies.append('aftercorr:' + ':'.join(sorted(str(job_id) for job_id in aftercorr)))
+        if not dependencies:
+            return ''
+        return '--dependency=%s --kill-on-invalid-dep=yes' % ','.join(dependencies)
+
+    def store_slurm_job_ids(self, output, array_jobs=None):
+        """Store the slurm job ids from the output of a submission script in the jobs.
+
+        Every line of the output is either "<job id> <slurm job id>" or "<array name> <slurm job id>", sbatch may
+        append ";<cluster>" to the slurm job id. All jobs of an array, array_jobs maps the names of the submitted arrays
+        to their job ids, get the slurm job id of the array. Jobs of an earlier submission of an array with the same
+        name keep their state, their tasks are not part of the submitted array. The jobs are
+        marked as submitted, jobs without slurm job id, e.g., because sbatch failed, are submitted again later.
+        Returns the number of submitted jobs.
+        """
+        submitted = 0
+        job_ids = {}
+        for line in output or []:
+            m = re.match(r'^(array_\d+|\d+) (\d+)(;\S+)?$', line.strip())
+            if not m:
+                if line.strip():
+                    logger.error('Could not parse slurm job id from output line: %s' % line.strip())
+                continue
+
+            if m.group(1).startswith('array_'):
+                submitted += Job.objects.filter(pk__in=(array_jobs or {}).get(m.group(1), []))\
+                    .update(job_id=int(m.group(2)), submitted=True)
+            else:
+                job_ids[int(m.group(1))] = int(m.group(2))
+
+        pks = list(job_ids.keys())
+        for start in range(0, len(pks), 1000):
+            chunk = pks[start:start + 1000]
+            submitted += Job.objects.filter(pk__in=chunk).update(
+                job_id=Case(*[When(pk=pk, then=Value(job_ids[pk])) for pk in chunk], output_field=IntegerField()),
+                submitted=True
+            )
+
+        return submitted
+
+    def _get_pack(self, plugin_execution):
+        """Return the number of jobs per array task and how many of them run at the same time."""
+        if plugin_execution.plugin.revision_batch_size:
+            return plugin_execution.plugin.revision_batch_size, 1
+        return self.pack_size, min(self.pack_size, self.pack_parallelism)
+
+    def _get_job_path(self, plugin_execution):
+        """Return the path of the repository for the jobs of the plugin execution as it is used in run.sh.
+
+        Revision jobs get their own worktree (see create_job_scripts), all other jobs share the project folder.
+        """
+        if plugin_execution.plugin.plugin_type == 'rev':
+            return '"$WORKTREE"'
+        return os.path.join(self.project_path, plugin_execution.project.name)
+
+    def create_job_scripts(self, plugin_execution):
+        """Write the scripts which run one job of the plugin execution and return the paths of run.sh and array.sh.
+
+        run.sh takes the id and the revision of a job, writes the logs of the job and afterwards a completion record
+        "<job id> <exit code> <start> <end> <peak rss in kB>" to the spool directory (see read_completion_records).
+        The record is written to a temporary file and renamed, so it is never read incomplete. Jobs that are killed,
+        e.g., by the time limit, write no record, their state is reconciled from sacct.
+        For revision plugins run.sh checks the revision out into a git worktree of the project in the node local
+        scratch_path, which shares the objects of the project clone. The worktree is removed when the job exits, so
+        any number of revision jobs of a project can run at the same time.
+        array.sh takes an index file and runs the jobs in the lines of the index file that belong to the slurm array
+        task (see submit_job_arrays), it fails if one of the jobs failed.
+        For plugins with a revision_batch_size, array.sh instead calls the plugin once with the revisions of all jobs
+        of the task in $revision_file. The plugin writes "<revision> <exit code>" per revision to $result_file, from
+        which array.sh writes the completion records of the jobs. Jobs without result get the exit code of the plugin,
+        or 1 if the plugin succeeded. The logs of the call are split into the logs of the jobs at the lines which start
+        the output of a revision (see split_batch_log).
+        """
+        plugin_execution_output_path = os.path.join(self.log_path, str(plugin_execution.id))
+        run_script = os.path.join(plugin_execution_output_path, 'run.sh')
+        array_script = os.path.join(plugin_execution_output_path, 'array.sh')
+        rss_file = os.path.join(plugin_execution_output_path, '${JOB_ID}_rss.txt')
+        project_folder = os.path.join(self.project_path, plugin_execution.project.name)
+
+        plugin_command = self._generate_plugin_execution_command(self.plugin_path, plugin_execution)
+        command = string.Template(plugin_command).safe_substitute({
+            'path': self._get_job_path(plugin_execution),
+            'revision': '"$REVISION"'
+        })
+
+        run = [
+            'if [ -x /usr/bin/time ]; then',
+            '    /usr/bin/time -f %%M -o %s %s' % (rss_file, command),
+            'else',
+            '    %s' % command,
+            'fi',
+            'EXIT_CODE=$?',
+        ]
+        if plugin_execution.plugin.plugin_type == 'rev':
+            # only this worktree is removed, a prune would also remove the worktrees of jobs on other nodes
+            run = [
+                'WORKTREE=$(mktemp -d %s/%s_${JOB_ID}_XXXXXX)' % (self.scratch_path, plugin_execution.project.name),
+                'trap \'git -C %s worktree remove --force "$WORKTREE" || rm -rf "$WORKTREE"\' EXIT' % project_folder,
+                'if git -C %s worktree add --quiet --detach "$WORKTREE" "$REVISION"; then' % project_folder,
+            ] + ['    ' + line for line in run] + [
+                'else',
+                '    EXIT_CODE=1',
+                'fi',
+            ]
+
+        self.write_remote_file(run_script, '\n'.join([
+            '#!/bin/bash',
+            'JOB_ID=$1',
+            'REVISION=$2',
+            'START=$(date +%s)',
+            'exec > %s/${JOB_ID}_out.txt 2> %s/${JOB_ID}_err.txt' % (plugin_execution_output_path, plugin_execution_output_path),
+        ] + run + [
+            'MAX_RSS=$(tail -n 1 %s 2>/dev/null)' % rss_file,
+            'rm -f %s' % rss_file,
+            'case "$MAX_RSS" in ""|*[!0-9]*) MAX_RSS=0;; esac',
+            'echo "$JOB_ID $EXIT_CODE $START $(date +%%s) $MAX_RSS" > %s/.${JOB_ID}.tmp' % self.spool_path,
+            'mv %s/.${JOB_ID}.tmp %s/${JOB_ID}.done' % (self.spool_path, self.spool_path),
+            'exit $EXIT_CODE',
+            ''
+        ]), executable=True)
+
+        pack_size, parallelism = self._get_pack(plugin_execution)
+        if plugin_execution.plugin.revision_batch_size:
+            array = self._get_batch_script(plugin_execution, project_folder, rss_file)
+        elif pack_size > 1:
+            # the states of the jobs come from their completion records, xargs fails if one of the jobs failed, so
+            # arrays which wait for this task with aftercorr do not start after a failed job
+            array = [
+                '%s | xargs -L 1 -P %s %s' % (TASK_JOBS, parallelism, run_script),
+            ]
+        else:
+            array = [
+                'read JOB_ID REVISION <<< "$(%s)"' % TASK_JOBS,
+                'exec %s "$JOB_ID" "$REVISION"' % run_script,
+            ]
+
+        self.write_remote_file(array_script, '\n'.join(['#!/bin/bash'] + array + ['']), executable=True)
+
+        return run_script, array_script
+
+    def _get_batch_script(self, plugin_execution, project_folder, rss_file):
+        """Return the lines of array.sh which call a plugin with a revision_batch_size for all jobs of the task."""
+        plugin_execution_output_path = os.path.join(self.log_path, str(plugin_execution.id))
+        batch = os.path.join(plugin_execution_output_path, '${BATCH}')
+        rss_file = rss_file.replace('${JOB_ID}', '${BATCH}')
+
+        plugin_command = self._generate_plugin_execution_command(self.plugin_path, plugin_execution)
+        command = string.Template(plugin_command).safe_substitute({
+            'path': '"$WORKTREE"',
+            'revision': '"$REVISION"',
+            'revision_file': '"$REVISION_FILE"',
+            'result_file': '"$RESULT_FILE"',
+        })
+
+        return [
+            'BATCH=$(basename "$1" .txt)_${SLURM_ARRAY_TASK_ID}',
+            '%s > %s_jobs.txt' % (TASK_JOBS, batch),
+            'REVISION_FILE=%s_revisions.txt' % batch,
+            'RESULT_FILE=%s_results.txt' % batch,
+            'cut -d " " -f 2 %s_jobs.txt > "$REVISION_FILE"' % batch,
+            'rm -f "$RESULT_FILE"',
+            'REVISION=$(head -n 1 "$REVISION_FILE")',
+            'START=$(date +%s)',
+            'exec 3>&1 4>&2 > %s_out.txt 2> %s_err.txt' % (batch, batch),
+            'WORKTREE=$(mktemp -d %s/%s_${BATCH}_XXXXXX)' % (self.scratch_path, plugin_execution.project.name),
+            'trap \'git -C %s worktree remove --force "$WORKTREE" || rm -rf "$WORKTREE"\' EXIT' % project_folder,
+            'if git -C %s worktree add --quiet --detach "$WORKTREE" "$REVISION"; then' % project_folder,
+            '    if [ -x /usr/bin/time ]; then',
+            '        /usr/bin/time -f %%M -o %s %s' % (rss_file, command),
+            '    else',
+            '        %s' % command,
+            '    fi',
+            '    EXIT_CODE=$?',
+            'else',
+            '    EXIT_CODE=1',
+            'fi',
+            'END=$(date +%s)',
+            'exec 1>&3 2>&4',
+            'MAX_RSS=$(tail -n 1 %s 2>/dev/null)' % rss_file,
+            'rm -f %s' % rss_file,
+            'case "$MAX_RSS" in ""|*[!0-9]*) MAX_RSS=0;; esac',
+            # the logs of the jobs may be links to the logs of an earlier batch
+            'while read JOB_ID REVISION; do',
+            '    rm -f %s/${JOB_ID}_out.txt %s/${JOB_ID}_err.txt' % (plugin_execution_output_path,
+                                                                 plugin_execution_output_path),
+            'done < %s_jobs.txt' % batch,
+            'for LOG_TYPE in out err; do',
+            '    awk -v marker="%s" -v prefix=%s/ -v suffix=_${LOG_TYPE}.txt \'%s\' %s_jobs.txt %s_${LOG_TYPE}.txt' % (
+                BATCH_REVISION_MARKER, plugin_execution_output_path, SPLIT_BATCH_LOG_AWK, batch, batch),
+            '    rm -f %s_${LOG_TYPE}.txt' % batch,
+            'done',
+            'FAILED=0',
+            'while read JOB_ID REVISION; do',
+            '    JOB_EXIT_CODE=$(awk -v r="$REVISION" \'$1 == r {print $2}\' "$RESULT_FILE" 2>/dev/null | tail -n 1)',
+            '    case "$JOB_EXIT_CODE" in',
+            '        ""|*[!0-9]*) JOB_EXIT_CODE=$EXIT_CODE; [ "$JOB_EXIT_CODE" = 0 ] && JOB_EXIT_CODE=1;;',
+            '    esac',
+            '    [ "$JOB_EXIT_CODE" = 0 ] || FAILED=1',
+            '    echo "$JOB_ID $JOB_EXIT_CODE $START $END $MAX_RSS" > %s/.${JOB_ID}.tmp' % self.spool_path,
+            '    mv %s/.${JOB_ID}.tmp %s/${JOB_ID}.done' % (self.spool_path, self.spool_path),
+            'done < %s_jobs.txt' % batch,
+            'exit $FAILED',
+        ]
+
+    def read_completion_records(self, limit):
+        if self.local_spool_path:
+            records = []
+            for file_name in sorted(os.listdir(self.local_spool_path)):
+                if not file_name.endswith('.done'):
+                    continue
+                with open(os.path.join(self.local_spool_path, file_name), 'r') as f:
+                    records.append((file_name[:-len('.done')], ' '.join(f.read().split())))
+                if len(records) >= limit:
+                    break
+            return records
+
+        # one line per record file: the name of the file without .done and its content
+        command = "find %s -maxdepth 1 -name '*.done' | head -n %s | while read f; do " \
+                  "echo \"$(basename \"$f\" .done) $(tr '\\n' ' ' < \"$f\")\"; done" % (self.spool_path, limit)
+        records = []
+        for line in self.execute_command(command):
+            name, _, record = line.strip().partition(' ')
+            if name:
+                records.append((name, record.strip()))
+        return records
+
+    def get_job_accounting(self, jobs):
+        """Return the start, end, peak memory and cpu time of the finished jobs from sacct.
+
+        The peak memory is the maximum of the job steps. Jobs that were packed into one array task share the
+        accounting of the task, they get their share of the cpu time only.
+        """
+        jobs_by_slurm_id = {}
+        for job in jobs:
+            jobs_by_slurm_id.setdefault(self._get_slurm_id(job), []).append(job)
+
+        accounting = {}
+        slurm_job_ids = sorted(set(str(job.job_id) for job in jobs))
+        for start in range(0, len(slurm_job_ids), 3000):
+            command = '/opt/slurm/bin/sacct --jobs {} --noheader --parsable2 --format="JobID,Start,End,TotalCPU,MaxRSS"'\
+                .format(','.join(slurm_job_ids[start:start + 3000]))
+
+            for line in self.execute_command(command):
+                m = line.strip().split('|')
+                if len(m) != 5:
+                    continue
+
+                # steps, e.g., <id>.batch, report the memory, the allocation reports the times
+                slurm_id, _, step = m[0].partition('.')
+                entry = accounting.setdefault(slurm_id, {'started_at': None, 'finished_at': None, 'max_rss': None,
+                                                         'cpu_time': None})
+                max_rss = self._parse_memory(m[4])
+                if max_rss is not None:
+                    entry['max_rss'] = max(entry['max_rss'] or 0, max_rss)
+                if not step:
+                    entry['started_at'] = self._parse_time(m[1])
+                    entry['finished_at'] = self._parse_time(m[2])
+                    entry['cpu_time'] = self._parse_duration(m[3])
+
+        results = {}
+        for slurm_id, entry in accounting.items():
+            task_jobs = jobs_by_slurm_id.get(slurm_id, [])
+            for job in task_jobs:
+                results[job.pk] = dict(entry)
+                if len(task_jobs) > 1:
+                    results[job.pk]['max_rss'] = None
+                    if entry['cpu_time'] is not None:
+                        results[job.pk]['cpu_time'] = entry['cpu_time'] / len(task_jobs)
+
+        return results
+
+    def _parse_time(self, value):
+        try:
+            return timezone.make_aware(datetime.datetime.strptime(value, '%Y-%m-%dT%H:%M:%S'))
+        except ValueError:
+            # Unknown, None
+            return None
+
+    def _parse_duration(self, value):
+        """Return the seconds of a duration of sacct in the format [DD-[HH:]]MM:SS[.mmm]."""
+        m = re.match(r'^(?:(\d+)-)?(?:(\d+):)?(\d+):(\d+(?:\.\d+)?)$', value)
+        if not m:
+            return None
+        days, hours, minutes, seconds = m.groups()
+        return int(days or 0) * 86400 + int(hours or 0) * 3600 + int(minutes) * 60 + float(seconds)
+
+    def _parse_memory(self, value):
+        """Return the kB of a memory value of sacct, e.g., 1234K or 1.5G."""
+        m = re.match(r'^(\d+(?:\.\d+)?)([KMGT]?)$', value)
+        if not m:
+            return None
+        return int(float(m.group(1)) * {'': 1.0 / 1024, 'K': 1, 'M': 1024, 'G': 1024 ** 2, 'T': 1024 ** 3}[m.group(2)])
+
+    def delete_completion_records(self, names):
+        if self.local_spool_path:
+            for name in names:
+                try:
+                    os.remove(os.path.join(self.local_spool_path, name + '.done'))
+                except FileNotFoundError:
+                    pass
+            return
+
+        for start in range(0, len(names), 1000):
+            chunk = names[start:start + 1000]
+            self.execute_command('cd %s && rm -f %s' % (self.spool_path, ' '.join(name + '.done' for name in chunk)))
+
+    def quarantine_completion_records(self, names):
+        """Move the records into the failed folder of the spool directory."""
+        if self.local_spool_path:
+            failed_path = os.path.join(self.local_spool_path, 'failed')
+            os.makedirs(failed_path, exist_ok=True)
+            for name in names:
+                try:
+                    os.replace(os.path.join(self.local_spool_path, name + '.done'),
+                               os.path.join(failed_path, name + '.done'))
+                except FileNotFoundError:
+                    pass
+            return
+
+        for start in range(0, len(names), 1000):
+            chunk = names[start:start + 1000]
+            self.execute_command('cd %s && mkdir -p failed && mv -f %s failed/' %
+                                 (self.spool_path, ' '.join(name + '.done' for name in chunk)), ignore_errors=True)
+
+    def write_remote_file(self, path, content, executable=False):
+        with self._shell() as handler, handler.open_sftp() as sftp_client:
+            with sftp_client.open(path, 'w') as remote_file:
+                remote_file.write(content)
+            if executable:
+                sftp_client.chmod(path, 0o755)
 
     def get_plugin_execution_where_repository_url_is_set(self, plugin_executions):
         for plugin_execution in plugin_executions:
@@ -165,129 +770,235 @@ class HPCConnector(PluginManagementInterface, BaseConnector):
         found_plugin_execution = self.get_plugin_execution_where_repository_url_is_set(plugin_executions)
         project_folder = os.path.join(self.project_path, self.get_project_name(plugin_executions))
         if any('vcsshark' == plugin_exec.plugin.name.lower() for plugin_exec in plugin_executions):
-            # Create project folder
-            logger.info('vcsshark is executed, remove old dir and clone new')
-            self.execute_command('rm -rf %s' % project_folder, ignore_errors=True)
-            self.execute_command('git clone %s %s ' % (found_plugin_execution.repository_url, project_folder),
-                                 ignore_errors=True)
-        else:
-            # If there is a plugin that needs the repository folder and it is not existent,
-            # we need to get it from the gridfs
-            if found_plugin_execution is not None and not os.path.isdir(project_folder.replace('/usr/users/', '/mnt/')):
-                logger.info('local project {} does not exist, fetching project from gridfs'.format(project_folder))
-                repository = VCSSystem.objects.get(url=found_plugin_execution.repository_url).repository_file
-
-                if repository.grid_id is None:
-                    logger.error("Execute vcsshark first!")
-                    raise Exception("VCSShark need to be executed first!")
-
-                # Read tar_gz and copy it to temporary file
-                tmp_tar_gz = 'tmp.tar.gz'
-                with open(tmp_tar_gz, 'wb') as repository_tar_gz:
-                    repository_tar_gz.write(repository.read())
-
-                # Copy and extract tar on HPC system
-                self.copy_project_tar()
-
-                # Delete temporary tar_gz
-                os.remove(tmp_tar_gz)
-
+            logger.info('vcsshark is executed, update the clone of the project')
+            self.refresh_project(found_plugin_execution.repository_url, project_folder)
+        elif found_plugin_execution is not None:
+            # If there is a plugin that needs the repository folder and it is not existent or was fetched from an
+            # older archive, we need to get it from the gridfs. A folder without hash was cloned by vcsshark.
+            repository_file = self._get_repository_file(found_plugin_execution.repository_url)
+            repository_hash = self._get_repository_hash(repository_file)
+            hash_path = os.path.join(self.project_path, '.%s.repository_hash' % os.path.basename(project_folder))
+
+            current_hash = self.execute_command('if [ -d {0} ]; then cat {1} 2>/dev/null || echo cloned; fi'.format(project_folder, hash_path), ignore_errors=True)
+            if [line.strip() for line in current_hash] in [['cloned'], [repository_hash]]:
+                logger.info('project {} is up to date'.format(project_folder))
+            else:
+                logger.info('project {} does not exist or changed, fetching project from gridfs'.format(project_folder))
+                self.copy_project_tar(repository_file, project_folder)
+                self.write_remote_file(hash_path, repository_hash)
 
     def delete_output_for_plugin_execution(self, plugin_execution):
-        self.execute_command('rm -rf %s' % os.path.join(self.log_path, str(plugin_execution.id)))
+        path = os.path.join(self.log_path, str(plugin_execution.id))
+        self.execute_command('rm -rf %s %s.zip' % (path, path))
+
+    def _open_log(self, job, log_type):
+        file_name = os.path.join(str(job.plugin_execution.id), str(job.id) + '_' + log_type + '.txt')
+        archive_name = str(job.plugin_execution.id) + '.zip'
 
-    def get_output_log(self, job):
         if self.local_log_path:
-            return self._get_log_local(job, log_type='out')
+            return open_log_or_archive(open, os.path.join(self.local_log_path, file_name),
+                                       os.path.join(self.local_log_path, archive_name), job, log_type)
+        return self._open_log_ssh(job, log_type, file_name, archive_name)
+
+    @contextlib.contextmanager
+    def _open_log_ssh(self, job, log_type, file_name, archive_name):
+        with self._shell() as handler, handler.open_sftp() as sftp_client:
+            with open_log_or_archive(sftp_client.open, os.path.join(self.log_path, file_name),
+                                     os.path.join(self.log_path, archive_name), job, log_type) as log_file:
+                yield log_file
+
+    def search_logs(self, plugin_execution, log_type, patterns, jobs=None, max_count=None):
+        """Search all logs of the plugin execution with one grep on the HPC system or in the local log path, archived
+        logs are searched in one pass over the archive where it is stored."""
+        path = os.path.join(self.local_log_path or self.log_path, str(plugin_execution.id))
+        job_ids = {job.pk for job in jobs} if jobs is not None else None
+
+        if plugin_execution.logs_archived:
+            if self.local_log_path:
+                with open(path + '.zip', 'rb') as archive_file:
+                    return search_archive(archive_file, log_type, patterns, job_ids, max_count)
+            command = get_search_archive_command(path + '.zip', log_type, patterns, max_count)
         else:
-            return self._get_output_log_ssh(job)
+            command = get_grep_command(path, log_type, patterns, max_count)
 
-    def get_error_log(self, job):
         if self.local_log_path:
-            return self._get_log_local(job, log_type='err')
+            output = run_grep(command)
         else:
-            return self._get_error_log_ssh(job)
+            # grep writes to stderr if the plugin execution has no logs yet
+            output = self.execute_command(' '.join(shlex.quote(argument) for argument in command), ignore_errors=True)
+
+        return parse_grep_output(output, job_ids)
 
-    def _get_log_local(self, job, log_type='out'):
-        output = []
+    def archive_logs(self, plugin_execution):
+        """Pack the logs of the plugin execution into a zip archive on the HPC system and remove the log folder."""
+        path = os.path.join(self.log_path, str(plugin_execution.id))
+        command = ' '.join(shlex.quote(argument) for argument in get_archive_command(path))
+        self.execute_command('{} && rm -rf {}'.format(command, shlex.quote(path)))
+        return True
 
-        file_path = os.path.join(self.local_log_path, str(job.plugin_execution.id), str(job.id) + '_' + log_type + '.txt')
+    def get_job_stati(self, jobs):
+        """Use slurms sacct to fetch the job status for the given list of jobs.
 
-        with open(file_path, 'r') as f:
-            output = [line.strip() for line in f.readlines()]
+        Jobs with a slurm job id are polled by id with sacct --jobs. The states are cached per plugin execution
+        (see _poll_plugin_execution), so only state changes since the last poll need to be fetched. Jobs which were
+        submitted before the slurm job ids were stored are looked up by name.
 
-        return output
+        possible formats and job states: https://slurm.schedmd.com/sacct.html
+        """
+        jobs = list(jobs)
+        states = self._get_job_states_by_name([job for job in jobs if job.job_id is None])
 
-    def _get_output_log_ssh(self, job):
-        with ShellHandler(self.host, self.username, self.password, self.port, self.tunnel_host,
-                          self.tunnel_username, self.tunnel_password, self.tunnel_port, self.use_tunnel, 10021, self.ssh_key_path) as handler:
-            sftp_client = handler.get_ssh_client().open_sftp()
-            plugin_execution_output_path = os.path.join(self.log_path, str(job.plugin_execution.id))
-            try:
-                remote_file = sftp_client.open(os.path.join(plugin_execution_output_path, str(job.id) + '_out.txt'))
-            except FileNotFoundError:
-                return ['File Not Found']
+        jobs_by_execution = {}
+        for job in jobs:
+            if job.job_id is not None:
+                jobs_by_execution.setdefault(job.plugin_execution_id, []).append(job)
 
-            output = []
-            try:
-                for line in remote_file:
-                    output.append(line.strip())
-            finally:
-                remote_file.close()
-
-        return output
-
-    def _get_error_log_ssh(self, job):
-        with ShellHandler(self.host, self.username, self.password, self.port, self.tunnel_host,
-                          self.tunnel_username, self.tunnel_password, self.tunnel_port, self.use_tunnel, 10022, self.ssh_key_path) as handler:
-            sftp_client = handler.get_ssh_client().open_sftp()
-            plugin_execution_output_path = os.path.join(self.log_path, str(job.plugin_execution.id))
-            try:
-                remote_file = sftp_client.open(os.path.join(plugin_execution_output_path, str(job.id) + '_err.txt'))
-            except FileNotFoundError:
-                return ['File Not Found']
+        with self.job_state_poll():
+            for plugin_execution_id, execution_jobs in jobs_by_execution.items():
+                slurm_states = self._poll_plugin_execution(plugin_execution_id, execution_jobs)
+                for job in execution_jobs:
+                    states[job.pk] = slurm_states.get(self._get_slurm_id(job), None)
 
-            output = []
-            try:
-                for line in remote_file:
-                    output.append(line.strip())
-            finally:
-                remote_file.close()
+        return [self._map_job_state(states.get(job.pk, None)) for job in jobs]
 
-        return output
+    @contextlib.contextmanager
+    def job_state_poll(self):
+        """Keep the polled states in memory until the poll ends and write the changed ones to the cache once.
 
-    def get_job_stati(self, jobs):
-        """Use slurms sacct to fetch the job status for the given list of jobs.
+        The states of a plugin execution grow with every polled batch, writing them after every batch would pickle
+        them again and again.
+        """
+        if self._job_state_polls is not None:
+            yield
+            return
 
-        possible formats and job states: https://slurm.schedmd.com/sacct.html
+        self._job_state_polls = {}
+        try:
+            yield
+        finally:
+            polls, changed = self._job_state_polls, self._changed_job_state_polls
+            self._job_state_polls, self._changed_job_state_polls = None, set()
+            for cache_key in changed:
+                cache.set(cache_key, polls[cache_key], settings.JOB_STATE_CACHE_TIMEOUT)
+
+    def _get_slurm_id(self, job):
+        if job.array_task_id is not None:
+            return '%s_%s' % (job.job_id, job.array_task_id)
+        return str(job.job_id)
+
+    def _poll_plugin_execution(self, plugin_execution_id, jobs):
+        """Return the slurm states of the plugin execution as dict of slurm job id to state.
+
+        The result is cached together with the time of the poll and the polled slurm job ids. A poll within
+        JOB_STATE_POLL_INTERVAL seconds returns the cached states, later polls only ask sacct for jobs that changed
+        since the last successful poll and merge the result into the cached states. Slurm job ids which were not polled
+        before, e.g., because the jobs are polled in batches, are polled from the submission of the plugin execution.
+        Must be called within job_state_poll, which writes the states to the cache when the poll ends.
+        """
+        cache_key = 'slurm_job_states_%s' % plugin_execution_id
+        if cache_key not in self._job_state_polls:
+            self._job_state_polls[cache_key] = cache.get(cache_key) or {'polled_at': None, 'job_ids': set(),
+                                                                         'states': {}}
+        polled = self._job_state_polls[cache_key]
+        now = timezone.now()
+
+        new_job_ids = set(str(job.job_id) for job in jobs) - polled['job_ids']
+
+        # all known jobs are polled together, so the time of the poll is valid for all of them
+        known_job_ids = polled['job_ids']
+        if polled['polled_at'] is not None and (now - polled['polled_at']).total_seconds() < settings.JOB_STATE_POLL_INTERVAL:
+            known_job_ids = set()
+
+        if new_job_ids:
+            submitted_at = PluginExecution.objects.get(pk=plugin_execution_id).submitted_at
+            polled['states'].update(self._get_job_states_by_id(new_job_ids, submitted_at))
+
+        if known_job_ids:
+            # the overlap covers jobs that changed while the last poll was running
+            start = polled['polled_at'] - datetime.timedelta(seconds=settings.JOB_STATE_POLL_OVERLAP)
+            polled['states'].update(self._get_job_states_by_id(known_job_ids, start))
+
+        if new_job_ids or known_job_ids:
+            # the poll time moves only if the known jobs were polled, otherwise their changes would be skipped
+            if known_job_ids or polled['polled_at'] is None:
+                polled['polled_at'] = now
+            polled['job_ids'] = polled['job_ids'] | new_job_ids
+            self._changed_job_state_polls.add(cache_key)
+
+        return polled['states']
+
+    def _get_job_states_by_id(self, slurm_job_ids, start):
+        """Return the states of jobs that changed since start as dict of slurm job id to state."""
+        states = {}
+        slurm_job_ids = sorted(slurm_job_ids)
+        for chunk_start in range(0, len(slurm_job_ids), 3000):
+            chunk = slurm_job_ids[chunk_start:chunk_start + 3000]
+            command = '/opt/slurm/bin/sacct -S {} --jobs {} --noheader --parsable2 --format="JobID,State"'.format(
+                timezone.localtime(start).strftime('%Y-%m-%dT%H:%M:%S'), ','.join(chunk))
+            stdout = self.execute_command(command)
+
+            for line in stdout:
+                m = line.strip().split('|')
+                # job steps (<id>.batch) and pending array tasks (<id>_[1-10]) are skipped
+                if len(m) == 2 and re.match(r'^\d+(_\d+)?$', m[0]):
+                    states[m[0]] = m[1].split()[0]
+
+        return states
+
+    def _get_job_states_by_name(self, jobs):
+        """Return the slurm states of jobs without slurm job id as dict of job id to state, looked up by job name.
+
+        Jobs that were submitted as part of a job array get the state of their array task.
         """
-        results = []
-        job_ids = [str(job.id) for job in jobs]
+        job_ids = [str(job.id) for job in jobs if not job.array_name]
+        array_names = sorted(set(job.array_name for job in jobs if job.array_name))
 
         # 1. create job id batches
+        states = {}
         for start in range(0, len(job_ids), 3000):
             chunk = job_ids[start:start + 3000]
             command = '/opt/slurm/bin/sacct -S 2019-01-01 --name {} --format="JobName,State"'.format(','.join(chunk))
             stdout = self.execute_command(command)
 
-            states = {}
             for line in stdout[1:]:
                 m = list(re.findall(r'\S+', line))  # split on any number of consecutive whitespaces
                 if len(m) == 2:
                     states[m[0]] = m[1]
 
-            for jid in chunk:
-                if jid not in states.keys():
-                    results.append('WAIT')
-                elif states[jid].lower() == 'completed':
-                    results.append('DONE')
-                elif states[jid].lower() in ['pending', 'running', 'requeued', 'resizing', 'suspended']:
-                    results.append('WAIT')
-                else:
-                    results.append('EXIT')
+        # 2. array tasks have job ids of the form <array job id>_<task id>, pending tasks are not listed individually
+        array_states = {}
+        for start in range(0, len(array_names), 3000):
+            chunk = array_names[start:start + 3000]
+            command = '/opt/slurm/bin/sacct -S 2019-01-01 --name {} --noheader --parsable2 --format="JobName,JobID,State"'.format(','.join(chunk))
+            stdout = self.execute_command(command)
+
+            for line in stdout:
+                m = line.strip().split('|')
+                if len(m) != 3:
+                    continue
+                task = re.match(r'^\d+_(\d+)$', m[1])
+                if task:
+                    array_states[(m[0], int(task.group(1)))] = m[2].split()[0]
+
+        results = {}
+        for job in jobs:
+            if job.array_name:
+                results[job.pk] = array_states.get((job.array_name, job.array_task_id), None)
+            else:
+                results[job.pk] = states.get(str(job.id), None)
 
         return results
 
+    def _map_job_state(self, state):
+        if state is None:
+            return 'WAIT'
+        elif state.lower() == 'completed':
+            return 'DONE'
+        elif state.lower() in ['pending', 'running', 'requeued', 'resizing', 'suspended']:
+            return 'WAIT'
+        else:
+            return 'EXIT'
+
     # old lsf style
     # def get_job_stati(self, jobs):
     #     old lsf style
@@ -368,24 +1079,33 @@ class HPCConnector(PluginManagementInterface, BaseConnector):
         self.execute_command('rm -rf %s/%s' % (self.plugin_path, str(plugin)))
 
     def install_plugins(self, plugins):
+        """Install the plugins, plugins which are installed with the same archive and install arguments are skipped.
+
+        After a successful installation the hash of the archive and the install arguments is written to
+        <plugin_path>/<plugin>/.install_hash.
+        """
         installations = []
         for plugin in plugins:
             try:
-                self.copy_plugin(plugin)
-                self.execute_install(plugin)
+                archive_hash = self._get_file_hash(plugin.get_full_path_to_archive())
+                install_hash = self._get_install_hash(archive_hash, plugin)
+                hash_path = os.path.join(self.plugin_path, str(plugin), '.install_hash')
+
+                if install_hash in [line.strip() for line in self.execute_command('cat %s' % hash_path, ignore_errors=True)]:
+                    logger.info('Plugin %s is already installed with the same archive and arguments' % str(plugin))
+                else:
+                    self.copy_plugin(plugin, archive_hash)
+                    self.execute_install(plugin)
+                    self.write_remote_file(hash_path, install_hash)
                 installations.append((True, None))
             except Exception as e:
                 installations.append((False, str(e)))
 
         return installations
 
-    def copy_plugin(self, plugin):
-        with ShellHandler(self.host, self.username, self.password, self.port, self.tunnel_host,
-                          self.tunnel_username, self.tunnel_password, self.tunnel_port, self.use_tunnel, 10023, self.ssh_key_path) as handler:
-            scp = SCPClient(handler.get_ssh_client().get_transport())
-
-            # Copy plugin
-            scp.put(plugin.get_full_path_to_archive(), remote_path=b'~')
+    def copy_plugin(self, plugin, archive_hash):
+        # Copy plugin
+        self.upload_file(plugin.get_full_path_to_archive(), plugin.get_name_of_archive(), archive_hash)
 
         try:
             self.delete_plugin(plugin)
@@ -399,20 +1119,99 @@ class HPCConnector(PluginManagementInterface, BaseConnector):
         # Delete tar
         self.execute_command('rm -f ~/%s' % (plugin.get_name_of_archive()))
 
-    def copy_project_tar(self):
-        with ShellHandler(self.host, self.username, self.password, self.port, self.tunnel_host,
-                          self.tunnel_username, self.tunnel_password, self.tunnel_port, self.use_tunnel, 10023, self.ssh_key_path) as handler:
-            scp = SCPClient(handler.get_ssh_client().get_transport())
+    def upload_file(self, local_path, remote_path, file_hash):
+        """Upload the file in chunks with sftp and verify its hash, an interrupted upload of the same file is resumed.
 
-            # Copy plugin
-            scp.put('tmp.tar.gz', remote_path=b'~')
+        The data is written to <remote_path>.part and the hash of the file to <remote_path>.part.sha256. If the hash
+        of a partial upload matches, the upload continues at the end of the partial file, otherwise it starts over.
+        Relative remote paths are relative to the home directory.
+        """
+        part_path = remote_path + '.part'
+        hash_path = part_path + '.sha256'
 
-        # Untar plugin
-        self.execute_command('mkdir -p %s' % self.project_path)
-        self.execute_command('tar -C %s -xvf ~/tmp.tar.gz' % self.project_path)
+        with self._shell() as handler, handler.open_sftp() as sftp_client:
+            offset = 0
+            try:
+                with sftp_client.open(hash_path, 'r') as f:
+                    if f.read().decode('utf-8').strip() == file_hash:
+                        offset = sftp_client.stat(part_path).st_size
+            except FileNotFoundError:
+                pass
+
+            if offset == 0:
+                with sftp_client.open(hash_path, 'w') as f:
+                    f.write(file_hash)
+            else:
+                logger.info('Resuming upload of %s at %s bytes' % (local_path, offset))
+
+            with open(local_path, 'rb') as local_file, sftp_client.open(part_path, 'a' if offset else 'w') as remote_file:
+                remote_file.set_pipelined(True)
+                local_file.seek(offset)
+                for chunk in iter(lambda: local_file.read(settings.UPLOAD_CHUNK_SIZE), b''):
+                    remote_file.write(chunk)
+
+        remote_hash = self.execute_command('sha256sum %s' % part_path)[0].split()[0]
+        if remote_hash != file_hash:
+            self.execute_command('rm -f %s %s' % (part_path, hash_path))
+            raise Exception('Upload of %s failed, the hash of the uploaded file does not match.' % local_path)
+
+        self.execute_command('mv %s %s' % (part_path, remote_path))
+        self.execute_command('rm -f %s' % hash_path)
+
+    def _with_project_lock(self, project_folder, command):
+        """Return the command wrapped so that it runs with the lock of the project folder (see refresh_project)."""
+        lock_path = os.path.join(self.project_path, '.%s.lock' % os.path.basename(project_folder))
+        return 'mkdir -p {0} && ( flock -w {1} 9 && {2} ) 9>{3}'.format(self.project_path, settings.PROJECT_LOCK_TIMEOUT,
+                                                                         command, lock_path)
+
+    def refresh_project(self, repository_url, project_folder):
+        """Update the clone of the repository in the project folder, the folder is only cloned again if that fails.
+
+        The clone is updated with git fetch --prune and reset to the fetched default branch, files created by
+        plugins are removed. If the folder is no clone or the update fails, e.g., because the clone is corrupt, it is
+        removed and cloned again. git does not look for a repository above the project folder, so a folder which is no
+        clone is never reset as part of another repository. Changes to a project folder hold a lock per project
+        folder, so concurrent executions for the same project do not work on the folder at the same time.
+        """
+        hash_path = os.path.join(self.project_path, '.%s.repository_hash' % os.path.basename(project_folder))
+        update = 'export GIT_CEILING_DIRECTORIES=$(cd {2} && pwd -P) && ' \
+                 'git -C {0} remote set-url origin {1} && git -C {0} fetch --prune --quiet origin && ' \
+                 'git -C {0} reset --hard --quiet origin/HEAD && git -C {0} clean -fdxq && echo updated'
+        clone = 'rm -rf {0} && git clone --quiet {1} {0} && echo cloned'
+        command = 'rm -f {0} && ( ( {1} ) || ( {2} ) )'.format(hash_path, update, clone).format(
+            project_folder, repository_url, self.project_path)
+
+        output = [line.strip() for line in self.execute_command(self._with_project_lock(project_folder, command) + ' 2>&1', ignore_errors=True)]
+        if 'updated' not in output and 'cloned' not in output:
+            raise Exception('Could not update or clone %s to %s: %s' % (repository_url, project_folder, ' '.join(output)))
+
+    def copy_project_tar(self, repository_file, project_folder):
+        """Stream the repository archive from GridFS to the HPC system and extract it to the project folder.
+
+        The archive is written chunk by chunk to a temporary file with a unique name, so concurrent executions do not
+        overwrite each other, and its sha256 is compared with the hash of the streamed data before it is extracted.
+        """
+        remote_tar = '%s_%s.tar.gz' % (os.path.basename(project_folder), uuid.uuid4())
+        file_hash = hashlib.sha256()
+
+        with self._shell() as handler, handler.open_sftp() as sftp_client:
+            with sftp_client.open(remote_tar, 'w') as remote_file:
+                remote_file.set_pipelined(True)
+                for chunk in iter(lambda: repository_file.read(settings.UPLOAD_CHUNK_SIZE), b''):
+                    file_hash.update(chunk)
+                    remote_file.write(chunk)
+
+        remote_hash = self.execute_command('sha256sum ~/%s' % remote_tar)[0].split()[0]
+        if remote_hash != file_hash.hexdigest():
+            self.execute_command('rm -f ~/%s' % remote_tar)
+            raise Exception('Transfer of the repository archive for %s failed, the hashes do not match.' % project_folder)
+
+        # Untar project
+        self.execute_command(self._with_project_lock(project_folder, 'rm -rf {0} && tar -C {1} -xf ~/{2}'.format(
+            project_folder, self.project_path, remote_tar)))
 
         # Delete tar
-        self.execute_command('rm -f ~/tmp.tar.gz')
+        self.execute_command('rm -f ~/%s' % remote_tar)
 
     def execute_install(self, plugin):
         # Build parameter for install script.
@@ -438,8 +1237,7 @@ class HPCConnector(PluginManagementInterface, BaseConnector):
 
         logger.info('Execute command: %s' % command)
 
-        with ShellHandler(self.host, self.username, self.password, self.port, self.tunnel_host,
-                          self.tunnel_username, self.tunnel_password, self.tunnel_port, self.use_tunnel, 10024, self.ssh_key_path) as handler:
+        with self._shell() as handler:
             (stdout, stderr) = handler.execute(command)
 
             logger.debug('Output: %s' % ' '.join(stdout))
@@ -461,8 +1259,7 @@ class HPCConnector(PluginManagementInterface, BaseConnector):
             shell_file.write("rm -rf %s\n" % path_to_remote_sh_file)
 
         # Copy Shell file with jobs to execute
-        with ShellHandler(self.host, self.username, self.password, self.port, self.tunnel_host,
-                          self.tunnel_username, self.tunnel_password, self.tunnel_port, self.use_tunnel, 10025, self.ssh_key_path) as handler:
+        with self._shell() as handler:
             scp = SCPClient(handler.get_ssh_client().get_transport())
             scp.put(path_to_sh_file, remote_path=b'%s' % str.encode(path_to_remote_sh_file))
 
@@ -475,8 +1272,7 @@ class HPCConnector(PluginManagementInterface, BaseConnector):
         # Execute. We need the variable order_needed as it distighushes between two separate possible execution methods
         logger.info("Execute command: %s" % path_to_remote_sh_file)
         if blocking:
-            with ShellHandler(self.host, self.username, self.password, self.port, self.tunnel_host,
-                              self.tunnel_username, self.tunnel_password, self.tunnel_port, self.use_tunnel, 10026, self.ssh_key_path) as handler:
+            with self._shell() as handler:
                 out = handler.execute_file(path_to_remote_sh_file, True)
                 logger.debug('Output: %s' % ' '.join(out))
                 return out
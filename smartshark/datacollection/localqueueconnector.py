@@ -11,17 +11,23 @@ This can be used for local debugging for plugin development.
 import tarfile
 import logging
 import os
+import shutil
+import subprocess
 import string
+import sys
 import json
 
 import redis
 
 from django.conf import settings
-from pycoshark.mongomodels import VCSSystem
 
 from smartshark.utils.connector import BaseConnector
 from smartshark.models import Job
+from smartshark.datacollection.executionutils import submit_pending_jobs
 from smartshark.datacollection.pluginmanagementinterface import PluginManagementInterface
+from smartshark.utils.joblog import get_archive_command, get_grep_command, open_log_or_archive, parse_grep_output, \
+    run_grep, search_archive
+from smartshark.utils.projectclone import project_lock
 
 
 class LocalQueueConnector(PluginManagementInterface, BaseConnector):
@@ -47,6 +53,7 @@ class LocalQueueConnector(PluginManagementInterface, BaseConnector):
         self.project_path = os.path.join(settings.LOCALQUEUE['root_path'], 'projects')
 
         self._debug = settings.LOCALQUEUE['debug']
+        self._project_names = {}
         self.con = redis.from_url(self.redis_url)
 
 
@@ -60,6 +67,15 @@ class LocalQueueConnector(PluginManagementInterface, BaseConnector):
 
         We are just pushing the shell commands that would have been run on the HPC System to the redis queue.
         """
+        self.prepare_execution(project, plugin_executions)
+
+        for plugin_execution in plugin_executions:
+            # jobs that do not fit into the queue are submitted later by the submit_jobs command
+            while submit_pending_jobs(self, plugin_execution):
+                pass
+
+    def prepare_execution(self, project, plugin_executions):
+        """Fetch the repository of the project and create the output folders."""
         self._log.info('Preparing project...')
 
         # this try/catch is used to catch other executions which do not have a project
@@ -76,51 +92,82 @@ class LocalQueueConnector(PluginManagementInterface, BaseConnector):
         # Check if vcsshark is executed
         project_folder = os.path.join(self.project_path, project_name)
         if any('vcsshark' == plugin_exec.plugin.name.lower() for plugin_exec in plugin_executions):
-            # Clone to update
+            # the worker updates the clone before it runs the jobs, with the lock of the project folder
             self._delete_sanity_check(project_folder)
-            self._execute_command({'shell': 'rm -rf {}'.format(project_folder)})
-            self._execute_command({'shell': 'git clone {} {}'.format(pe.repository_url, project_folder)})
+            self._execute_command({'refresh_project': project_folder, 'repository_url': pe.repository_url})
         else:
-            # If there is a plugin that needs the repository folder and it is not existent,
-            # we need to get it from the gridfs
-            if not all_projects and not os.path.isdir(project_folder):
-                self._log.info('fetching project from gridfs')
-                repository = VCSSystem.objects.get(url=pe.repository_url).repository_file
-
-                if repository.grid_id is None:
-                    self._log.error("Execute vcsshark first!")
-                    raise Exception("VCSShark need to be executed first!")
-
-                # make sure we have the directories
-                os.makedirs(self.project_path)
-
-                # Read tar_gz and copy it to temporary file
-                tmp_tar_gz = os.path.join(self.project_path, 'tmp.tar.gz')
-                with open(tmp_tar_gz, 'wb') as repository_tar_gz:
-                    repository_tar_gz.write(repository.read())
-
-                # Extract it
-                with tarfile.open(tmp_tar_gz, "r:gz") as tar_gz:
-                    tar_gz.extractall(self.project_path)
-
-                # Delete temporary tar_gz
-                os.remove(tmp_tar_gz)
+            # If there is a plugin that needs the repository folder and it is not existent or was fetched from an
+            # older archive, we need to get it from the gridfs. A folder without hash was cloned by vcsshark.
+            if not all_projects:
+                repository_file = self._get_repository_file(pe.repository_url)
+                repository_hash = self._get_repository_hash(repository_file)
+                hash_path = os.path.join(self.project_path, '.{}.repository_hash'.format(project_name))
+
+                current_hash = None
+                if os.path.isdir(project_folder):
+                    current_hash = 'cloned'
+                    if os.path.isfile(hash_path):
+                        with open(hash_path, 'r') as f:
+                            current_hash = f.read().strip()
+
+                if current_hash not in ['cloned', repository_hash]:
+                    self._log.info('fetching project from gridfs')
+                    self._delete_sanity_check(project_folder)
+
+                    with project_lock(project_folder):
+                        shutil.rmtree(project_folder, ignore_errors=True)
+
+                        # Extract it while it is read from the gridfs
+                        with tarfile.open(fileobj=repository_file, mode='r|gz') as tar_gz:
+                            tar_gz.extractall(self.project_path)
+
+                        with open(hash_path, 'w') as f:
+                            f.write(repository_hash)
 
         for plugin_execution in plugin_executions:
-            plugin_command = self._generate_plugin_execution_command(self.plugin_path, plugin_execution)
+            self._project_names[plugin_execution.pk] = project_name
 
             plugin_execution_output_path = os.path.join(self.output_path, str(plugin_execution.pk))
             self._execute_command({'shell': 'mkdir -p {}'.format(plugin_execution_output_path)})
 
-            for job in Job.objects.filter(plugin_execution=plugin_execution).all():
-                command = string.Template(plugin_command).safe_substitute({
-                    'path': os.path.join(self.project_path, project_name),
-                    'revision': job.revision_hash
-                })
+    def submit_jobs(self, plugin_execution, jobs):
+        """Push the commands of the jobs to the redis queue.
 
-                # in addition to the shell command we are passing ids so that the worker can write back to the database if the job was successful.
-                self._execute_command({'shell': command, 'job_id': job.pk, 'plugin_execution_id': plugin_execution.pk})
+        The plugin execution must have been prepared with prepare_execution by this connector. Jobs of revision
+        plugins run in their own git worktree of the project, which is created and removed by the worker. Plugins with
+        a revision_batch_size get one command for up to revision_batch_size jobs.
+        """
+        plugin_command = self._generate_plugin_execution_command(self.plugin_path, plugin_execution)
+        # plugin executions submitted by the submit_jobs command were prepared by another process
+        project_name = self._project_names.get(plugin_execution.pk, plugin_execution.project.name)
+        project_folder = os.path.join(self.project_path, project_name)
+
+        batch_size = plugin_execution.plugin.revision_batch_size
+        if batch_size:
+            # the plugin is called once per batch, the worker substitutes $revision_file and $result_file
+            jobs = list(jobs)
+            for start in range(0, len(jobs), batch_size):
+                job_ids = [job.pk for job in jobs[start:start + batch_size]]
+                self._execute_command({'shell': plugin_command, 'job_ids': job_ids,
+                                       'plugin_execution_id': plugin_execution.pk, 'repository': project_folder})
+            return Job.objects.filter(pk__in=[job.pk for job in jobs]).update(submitted=True)
+
+        submitted = []
+        for job in jobs:
+            # the worker holds the lock of the project folder while the job uses it
+            data = {'job_id': job.pk, 'plugin_execution_id': plugin_execution.pk, 'repository': project_folder}
+            if plugin_execution.plugin.plugin_type == 'rev':
+                # the worker substitutes $path with a worktree of the revision that only this job uses
+                substitutions = {'revision': job.revision_hash}
+            else:
+                substitutions = {'path': project_folder, 'revision': job.revision_hash}
+            data['shell'] = string.Template(plugin_command).safe_substitute(substitutions)
 
+            # in addition to the shell command we are passing ids so that the worker can write back to the database if the job was successful.
+            self._execute_command(data)
+            submitted.append(job.pk)
+
+        return Job.objects.filter(pk__in=submitted).update(submitted=True)
 
     def _delete_sanity_check(self, path):
         """At least dont allow rm -rf /."""
@@ -130,7 +177,7 @@ class LocalQueueConnector(PluginManagementInterface, BaseConnector):
     def _execute_command(self, data):
         if self._debug:
             print('Would execute:')
-            print(data['shell'])
+            print(data.get('shell', data))
             if 'job_id' in data.keys():
                 print('Job: {}'.format(data['job_id']))
             print('--')
@@ -144,21 +191,29 @@ class LocalQueueConnector(PluginManagementInterface, BaseConnector):
             stati.append('WAIT')
         return stati
 
-    def _get_log_file(self, job, log_type):
-        ret = []
+    def _open_log(self, job, log_type):
+        """Open the log file of the job in the output path or in the archive of its plugin execution."""
         plugin_execution_output_path = os.path.join(self.output_path, str(job.plugin_execution.pk))
-        with open(os.path.join(plugin_execution_output_path, str(job.pk) + '_' + log_type + '.txt'), 'r') as f:
-            for line in f.readlines():
-                ret.append(line.rstrip())
-        return ret
-
-    def get_output_log(self, job):
-        """Return the contents of the out log file."""
-        return self._get_log_file(job, 'out')
-
-    def get_error_log(self, job):
-        """Return the contents of the err log file."""
-        return self._get_log_file(job, 'err')
+        log_path = os.path.join(plugin_execution_output_path, str(job.pk) + '_' + log_type + '.txt')
+        return open_log_or_archive(open, log_path, plugin_execution_output_path + '.zip', job, log_type)
+
+    def search_logs(self, plugin_execution, log_type, patterns, jobs=None, max_count=None):
+        """Search all logs of the plugin execution in the output path with one grep or in one pass over its archive."""
+        path = os.path.join(self.output_path, str(plugin_execution.pk))
+        job_ids = {job.pk for job in jobs} if jobs is not None else None
+
+        if plugin_execution.logs_archived:
+            with open(path + '.zip', 'rb') as archive_file:
+                return search_archive(archive_file, log_type, patterns, job_ids, max_count)
+        return parse_grep_output(run_grep(get_grep_command(path, log_type, patterns, max_count)), job_ids)
+
+    def archive_logs(self, plugin_execution):
+        """Pack the logs of the plugin execution into a zip archive in the output path and remove the log folder."""
+        path = os.path.join(self.output_path, str(plugin_execution.pk))
+        self._delete_sanity_check(path)
+        subprocess.run(get_archive_command(path, sys.executable), check=True)
+        shutil.rmtree(path, ignore_errors=True)
+        return True
 
     def get_sent_bash_command(self, job):
         """Not implemented."""
@@ -217,4 +272,4 @@ class LocalQueueConnector(PluginManagementInterface, BaseConnector):
         """Delete folder containing output for plugin execution id."""
         path_to_remove = os.path.join(self.output_path, str(plugin_execution.id))
         self._delete_sanity_check(path_to_remove)
-        self._execute_command({'shell': 'rm -rf {}'.format(path_to_remove)})
+        self._execute_command({'shell': 'rm -rf {} {}.zip'.format(path_to_remove, path_to_remove)})
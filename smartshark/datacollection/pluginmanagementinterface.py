@@ -1,12 +1,21 @@
 import abc
+import contextlib
+import logging
 import os
 import sys
 
 from server.settings import COLLECTION_CONNECTOR_IDENTIFIER
+from smartshark.utils.joblog import LogCache, get_size, iter_lines, read_lines, read_range, search_lines, tail_lines
+from smartshark.utils.logindex import LogIndex
+
+logger = logging.getLogger('django')
 
 
 class PluginManagementInterface(metaclass=abc.ABCMeta):
 
+    # connectors which read the logs from another host keep the logs of finished jobs in the local log cache
+    cache_logs = False
+
     @abc.abstractproperty
     def identifier(self):
         return
@@ -19,6 +28,24 @@ class PluginManagementInterface(metaclass=abc.ABCMeta):
     def execute_plugins(self, project, plugin_executions):
         return
 
+    @abc.abstractmethod
+    def prepare_execution(self, project, plugin_executions):
+        """Prepare everything the jobs of the plugin executions need before the first job is submitted."""
+        return
+
+    @abc.abstractmethod
+    def submit_jobs(self, plugin_execution, jobs):
+        """Submit the given jobs of one plugin execution and return the number of submitted jobs.
+
+        Submitted jobs must be marked as submitted as soon as the backend accepted them. Jobs that are not submitted are
+        tried again by the submit_jobs command (see executionutils.submit_pending_jobs).
+        """
+        return
+
+    def get_submission_capacity(self, plugin_execution):
+        """Return how many jobs of the plugin execution may be submitted now, None if there is no limit."""
+        return None
+
     @abc.abstractmethod
     def delete_plugins(self, plugins):
         return
@@ -27,13 +54,128 @@ class PluginManagementInterface(metaclass=abc.ABCMeta):
     def get_job_stati(self, jobs):
         return
 
+    @contextlib.contextmanager
+    def job_state_poll(self):
+        """Group the get_job_stati calls of one poll, e.g., the batches of a reconciliation, so connectors can keep
+        their state between the calls.
+        """
+        yield
+
     @abc.abstractmethod
-    def get_output_log(self, job):
+    def _open_log(self, job, log_type):
+        """Return a context manager for the out or err log of the job as binary file which supports seek.
+
+        Raises FileNotFoundError if the log does not exist.
+        """
         return
 
-    @abc.abstractmethod
+    @contextlib.contextmanager
+    def open_log(self, job, log_type, cache=True):
+        """Open the out or err log of the job as binary file, the logs of finished jobs are read from the log cache.
+
+        Logs which are read once, e.g., to index them, should not be cached.
+        """
+        cache = LogCache() if cache and self.cache_logs and job.status in ['DONE', 'EXIT'] else None
+        path = cache.get(job, log_type) if cache else None
+
+        if path is None:
+            with self._open_log(job, log_type) as log_file:
+                # logs read from an archive are already in the cache
+                path = cache.get(job, log_type) if cache else None
+                if cache and path is None:
+                    try:
+                        path = cache.put(job, log_type, log_file)
+                    except OSError as e:
+                        logger.warning('Could not cache the {} log of job {}: {}'.format(log_type, job.pk, e))
+                if path is None:
+                    log_file.seek(0)
+                    yield log_file
+                    return
+
+        with open(path, 'rb') as log_file:
+            yield log_file
+
+    def get_log_size(self, job, log_type):
+        """Return the size of the log in bytes."""
+        with self.open_log(job, log_type) as log_file:
+            return get_size(log_file)
+
+    def read_log(self, job, log_type, offset=0, length=None):
+        """Return up to length bytes of the log starting at offset."""
+        with self.open_log(job, log_type) as log_file:
+            return read_range(log_file, offset, length)
+
+    def tail_log(self, job, log_type, count=None):
+        """Return the last count lines of the log."""
+        with self.open_log(job, log_type) as log_file:
+            return tail_lines(log_file, count)
+
+    def read_log_lines(self, job, log_type, start=0, count=None):
+        """Return up to count lines of the log starting with line start and whether the log has more lines."""
+        with self.open_log(job, log_type) as log_file:
+            return read_lines(log_file, start, count)
+
+    def search_logs(self, plugin_execution, log_type, patterns, jobs=None, max_count=None):
+        """Return the lines of the logs of the plugin execution which contain one of the patterns as dict of job id to
+        list of LogMatch, at most max_count lines per log. Only the logs of the given jobs are searched if jobs is given.
+
+        This reads every log on its own, connectors search all logs of the plugin execution at once where they are stored.
+        """
+        if jobs is None:
+            jobs = plugin_execution.job_set.all()
+
+        matches = {}
+        for job in jobs:
+            try:
+                with self.open_log(job, log_type) as log_file:
+                    job_matches = search_lines(log_file, patterns, max_count)
+            except FileNotFoundError:
+                continue
+            if job_matches:
+                matches[job.pk] = job_matches
+        return matches
+
+    def search_job_logs(self, jobs, log_type, patterns, max_count=None):
+        """Search the logs of jobs of different plugin executions with one search per plugin execution, see
+        search_logs. The logs of jobs which are in the log index are searched in the index."""
+        indexed_jobs = [job for job in jobs if job.log_indexed]
+        matches = {}
+        if indexed_jobs:
+            log_index = LogIndex()
+            try:
+                matches.update(log_index.search(patterns, log_type, jobs=indexed_jobs, max_count=max_count))
+            finally:
+                log_index.close()
+
+        jobs_by_execution = {}
+        for job in jobs:
+            if not job.log_indexed:
+                jobs_by_execution.setdefault(job.plugin_execution_id, []).append(job)
+
+        for execution_jobs in jobs_by_execution.values():
+            matches.update(self.search_logs(execution_jobs[0].plugin_execution, log_type, patterns, execution_jobs,
+                                            max_count))
+        return matches
+
+    def archive_logs(self, plugin_execution):
+        """Pack the logs of the finished plugin execution into one compressed archive, the logs are read from the
+        archive afterwards. Returns False if the connector does not archive logs."""
+        return False
+
+    def get_output_log(self, job):
+        """Return all lines of the out log, prefer the ranged reads for large logs."""
+        return self._get_log_lines(job, 'out')
+
     def get_error_log(self, job):
-        return
+        """Return all lines of the err log, prefer the ranged reads for large logs."""
+        return self._get_log_lines(job, 'err')
+
+    def _get_log_lines(self, job, log_type):
+        try:
+            with self.open_log(job, log_type) as log_file:
+                return [line.strip() for line in iter_lines(log_file)]
+        except FileNotFoundError:
+            return ['File Not Found']
 
     @abc.abstractmethod
     def get_sent_bash_command(self, job):
@@ -51,6 +193,31 @@ class PluginManagementInterface(metaclass=abc.ABCMeta):
     def default_queue(self):
         return
 
+    def read_completion_records(self, limit):
+        """Return up to limit completion records of jobs as list of (name, record), the record is
+        "<job id> <exit code> <start> <end> <peak rss in kB>" and the name identifies it in the spool directory.
+
+        Connectors whose jobs do not write completion records return an empty list.
+        """
+        return []
+
+    def delete_completion_records(self, names):
+        """Delete the completion records with the given names after they were stored."""
+        return
+
+    def quarantine_completion_records(self, names):
+        """Move the completion records with the given names out of the way because they could not be stored, they
+        are kept for inspection."""
+        return
+
+    def get_job_accounting(self, jobs):
+        """Return the accounting of the finished jobs as dict of job id to a dict with started_at, finished_at,
+        max_rss in kB and cpu_time in seconds, values may be None.
+
+        Connectors that store the accounting when the job finishes return an empty dict.
+        """
+        return {}
+
     @staticmethod
     def find_correct_plugin_manager():
         plugin_files = [x[:-3] for x in os.listdir(os.path.dirname(os.path.realpath(__file__))) if x.endswith(".py")]
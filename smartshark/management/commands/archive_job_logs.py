@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import datetime
+import logging
+
+from django.conf import settings
+from django.utils import timezone
+
+from smartshark.models import Job, PluginExecution
+from smartshark.utils.periodiccommand import PeriodicCommand
+
+logger = logging.getLogger('django')
+
+
+class Command(PeriodicCommand):
+    """Packs the logs of finished plugin executions into one compressed archive per plugin execution.
+
+    Only plugin executions without waiting jobs which were submitted more than LOG_ARCHIVE_DAYS days ago are archived.
+    The logs are read from the archive afterwards.
+    """
+
+    help = 'Archive the logs of finished plugin executions'
+
+    interval_setting = 'LOG_ARCHIVE_INTERVAL'
+    activity = 'archiving'
+
+    def run_once(self, interface, **options):
+        plugin_executions = PluginExecution.objects.filter(
+            logs_archived=False,
+            submitted_at__lt=timezone.now() - datetime.timedelta(days=settings.LOG_ARCHIVE_DAYS)
+        ).exclude(pk__in=Job.objects.filter(status='WAIT').values('plugin_execution_id')).order_by('pk')
+
+        for plugin_execution in plugin_executions:
+            try:
+                if not interface.archive_logs(plugin_execution):
+                    self.stdout.write('the connector does not archive logs')
+                    return
+            except Exception as e:
+                # the logs stay in place and are archived in the next run
+                logger.exception(e)
+                self.stderr.write('archiving the logs of plugin execution {} failed: {}'.format(plugin_execution.pk, e))
+                continue
+
+            plugin_execution.logs_archived = True
+            plugin_execution.save(update_fields=['logs_archived'])
+            self.stdout.write('archived the logs of plugin execution {}'.format(plugin_execution.pk))
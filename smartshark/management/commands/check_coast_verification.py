@@ -3,8 +3,9 @@
 
 import logging
 
-from smartshark.models import Job, Project, PluginExecution, CommitVerification
+from smartshark.models import Project, CommitVerification
 from smartshark.datacollection.pluginmanagementinterface import PluginManagementInterface
+from smartshark.utils.verification import check_parse_errors
 
 from django.core.management.base import BaseCommand
 
@@ -31,50 +32,19 @@ class Command(BaseCommand):
         # get failed commits from CommitVerification where coastSHARK failed
         commits = CommitVerification.objects.filter(project=project, coastSHARK=False)
 
-        # we need to get the most current job for each commit (because of repetitions for coastSHARK runs)
-        jobs = {}
-        for pe in PluginExecution.objects.filter(plugin__name__startswith='coastSHARK', project=project).order_by('submitted_at'):
-            for obj in commits:
-                try:
-                    jobs[obj.commit] = Job.objects.get(plugin_execution=pe, revision_hash=obj.commit)
-                except Job.DoesNotExist:
-                    pass
-                except Job.MultipleObjectsReturned:
-                    jobs[obj.commit] = Job.objects.filter(plugin_execution=pe, revision_hash=obj.commit).last()
+        # the latest job of each commit is checked (because of repetitions for coastSHARK runs)
+        results = check_parse_errors(interface, commits)
 
         modified = 0
         for obj in commits:
 
             # we have not found a previous job with this commit, we can not check for parse error
-            if obj.commit not in jobs.keys():
+            if obj not in results:
                 self.stdout.write('could not find revision {} in previous jobs, skipping'.format(obj.commit))
                 continue
 
-            # split of file for coastSHARK
-            tmp = obj.text
-            collect_state = False
-            coast_files = []
-            for line in tmp.split('\n'):
-                if collect_state and not line.strip().startswith('+++ mecoSHARK +++'):
-                    coast_files.append(line.strip()[1:])
-                if line.strip().startswith('+++ coastSHARK +++'):
-                    collect_state = True
-                if line.strip().startswith('+++ mecoSHARK +++'):
-                    collect_state = False
-
-            # get job from our precalculated dict and fetch its stdout log
-            job = jobs[obj.commit]
-            stdout = interface.get_output_log(job)
-
-            new_lines = []
-            parse_error_files = []
-            for file in coast_files:
-                for line in stdout:
-                    if file in line and line.startswith(('Parser Error in file', 'Lexer Error in file')):
-                        new_lines.append(file + ' ({})'.format(line))
-                        parse_error_files.append(file)
-
-            if set(parse_error_files) == set(coast_files):
+            new_lines, only_parse_errors = results[obj]
+            if only_parse_errors:
                 obj.coastSHARK = True
                 modified += 1
 
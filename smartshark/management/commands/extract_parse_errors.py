@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from django.conf import settings
+
+from smartshark.models import Job
+from smartshark.utils.periodiccommand import PeriodicCommand
+from smartshark.utils.verification import extract_parse_errors
+
+
+class Command(PeriodicCommand):
+    """Stores the parse errors of finished coastSHARK jobs in JobParseError.
+
+    The first run is the backfill for all finished jobs, afterwards every run extracts the parse errors of the jobs
+    which finished since. The coastSHARK verification checks only extract the jobs which were missed.
+    """
+
+    help = 'Extract the parse errors of finished coastSHARK jobs'
+
+    interval_setting = 'PARSE_ERROR_EXTRACTION_INTERVAL'
+    activity = 'extraction'
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--project', type=str, help='Only extract the parse errors of jobs of this project.')
+
+    def run_once(self, interface, project=None, **options):
+        # jobs stay unextracted if the run fails and are extracted in the next run
+        jobs = Job.objects.filter(plugin_execution__plugin__name__startswith='coastSHARK', status__in=['DONE', 'EXIT'],
+                                  parse_errors_extracted=False).select_related('plugin_execution').order_by('pk')
+        if project:
+            jobs = jobs.filter(plugin_execution__project__name__iexact=project)
+
+        while True:
+            batch = list(jobs[:settings.PARSE_ERROR_EXTRACTION_BATCH_SIZE])
+            if not batch:
+                return
+
+            extract_parse_errors(interface, batch)
+            self.stdout.write('extracted the parse errors of {} jobs'.format(len(batch)))
@@ -49,16 +49,10 @@ class Command(BaseCommand):
         if options['execute']:
             found_revs = []
             notfound_revs = []
+            log_type = 'err' if options['filter_log_type'] == 'error' else 'out'
+            matches = interface.search_job_logs(jobs, log_type, [options['filter_string']], max_count=1)
             for job in jobs:
-                output = []
-                if options['filter_log_type'] == 'error':
-                    output = interface.get_error_log(job)
-                if options['filter_log_type'] == 'output':
-                    output = interface.get_output_log(job)
-                if output:
-                    output = '\n'.join(output)
-
-                if options['filter_string'] in output:
+                if job.pk in matches:
                     found_revs.append(job.revision_hash)
                 else:
                     notfound_revs.append(job.revision_hash)
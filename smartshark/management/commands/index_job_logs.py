@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import contextlib
+
+from django.conf import settings
+
+from smartshark.models import Job
+from smartshark.utils.joblog import get_size, iter_lines
+from smartshark.utils.logindex import LogIndex
+from smartshark.utils.periodiccommand import PeriodicCommand
+
+
+class Command(PeriodicCommand):
+    """Adds the logs of finished jobs to the full-text log index.
+
+    Every log is read once after its job finished, searches over the jobs (see search_job_logs of the
+    PluginManagementInterface) are answered from the index afterwards.
+    """
+
+    help = 'Index the logs of finished jobs'
+
+    interval_setting = 'LOG_INDEX_INTERVAL'
+    activity = 'indexing'
+
+    def index_job(self, interface, log_index, job):
+        """Index both logs of the job at once, return False if a log is too large to be indexed."""
+        with contextlib.ExitStack() as stack:
+            logs = {}
+            for log_type in ['out', 'err']:
+                try:
+                    log_file = stack.enter_context(interface.open_log(job, log_type, cache=False))
+                except FileNotFoundError:
+                    # jobs which were cancelled before they started have no logs
+                    logs[log_type] = []
+                    continue
+
+                if get_size(log_file) > settings.LOG_INDEX_MAX_FILE_SIZE:
+                    return False
+                logs[log_type] = iter_lines(log_file)
+
+            log_index.add(job, logs)
+        return True
+
+    def index(self, interface, log_index):
+        while True:
+            jobs = Job.objects.filter(status__in=['DONE', 'EXIT'], log_indexed__isnull=True).order_by('pk')
+            jobs = list(jobs[:settings.LOG_INDEX_BATCH_SIZE])
+            if not jobs:
+                return
+
+            indexed = []
+            too_large = []
+            for job in jobs:
+                if self.index_job(interface, log_index, job):
+                    indexed.append(job.pk)
+                else:
+                    too_large.append(job.pk)
+
+            Job.objects.filter(pk__in=indexed).update(log_indexed=True)
+            Job.objects.filter(pk__in=too_large).update(log_indexed=False)
+            self.stdout.write('indexed the logs of {} jobs, {} jobs have too large logs'.format(len(indexed),
+                                                                                            len(too_large)))
+
+    def run_once(self, interface, **options):
+        # jobs stay unindexed if the run fails and are indexed in the next run
+        log_index = LogIndex()
+        try:
+            self.index(interface, log_index)
+        finally:
+            log_index.close()
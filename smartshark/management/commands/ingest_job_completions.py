@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from django.conf import settings
+
+from smartshark.datacollection.executionutils import store_completion_records
+from smartshark.utils.periodiccommand import PeriodicCommand
+
+
+class Command(PeriodicCommand):
+    """Stores the completion records which finished jobs write to the spool directory.
+
+    Jobs get their state, exit code, runtime and peak memory from their own record as soon as they finish, without
+    asking the scheduler.
+    """
+
+    help = 'Ingest job completion records'
+
+    interval_setting = 'JOB_COMPLETION_INGEST_INTERVAL'
+    activity = 'ingestion'
+
+    def run_once(self, interface, **options):
+        # records stay in the spool directory until they are stored
+        while True:
+            records = interface.read_completion_records(settings.JOB_COMPLETION_BATCH_SIZE)
+            if not records:
+                return
+
+            job_ids = store_completion_records([record for _, record in records])
+            stored = {str(job_id) for job_id in job_ids}
+            interface.delete_completion_records([name for name, _ in records if name in stored])
+            self.stdout.write('stored {} job completions'.format(len(job_ids)))
+
+            # unparsable records would be read again in every batch
+            failed = [name for name, _ in records if name not in stored]
+            if failed:
+                interface.quarantine_completion_records(failed)
+                self.stderr.write('moved {} unparsable job completions to quarantine'.format(len(failed)))
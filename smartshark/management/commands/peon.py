@@ -1,7 +1,11 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import contextlib
 import json
+import shutil
+import string
+import tempfile
 import timeit
 import sys
 import os
@@ -11,9 +15,12 @@ import redis
 
 from django.conf import settings
 from django.db import connections
+from django.utils import timezone
 from django.core.management.base import BaseCommand
 
 from smartshark.models import Job
+from smartshark.utils.joblog import split_batch_log
+from smartshark.utils.projectclone import project_lock, refresh_clone
 
 
 class Command(BaseCommand):
@@ -27,6 +34,81 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         pass
 
+    @contextlib.contextmanager
+    def worktree(self, repository, revision):
+        """Check the revision out into a new git worktree of the repository and remove it afterwards.
+
+        Yields the path of the worktree or the repository itself if no revision is given. The lock of the project
+        folder is held shared meanwhile, so the clone is not updated while the job uses it.
+        """
+        if not repository:
+            yield repository
+            return
+
+        with project_lock(repository, shared=True):
+            if not revision:
+                yield repository
+                return
+
+            os.makedirs(self.scratch_path, exist_ok=True)
+            path = tempfile.mkdtemp(prefix='{}_{}_'.format(os.path.basename(repository), revision[:8]),
+                                    dir=self.scratch_path)
+            try:
+                subprocess.run(['git', '-C', repository, 'worktree', 'add', '--quiet', '--detach', path, revision],
+                               check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+                yield path
+            finally:
+                res = subprocess.run(['git', '-C', repository, 'worktree', 'remove', '--force', path],
+                                     stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                if res.returncode > 0:
+                    shutil.rmtree(path, ignore_errors=True)
+
+    def execute(self, data, jobs, out, err):
+        """Run the command of the jobs and return exit code, peak memory, cpu time and the results per revision.
+
+        A batch of revisions gets the file with the revisions as $revision_file, the plugin writes
+        "<revision> <exit code>" per processed revision to $result_file.
+        """
+        results = {}
+        max_rss = 0
+        cpu_time = 0
+        with tempfile.TemporaryDirectory() as batch_path:
+            substitutions = {
+                'revision': jobs[0].revision_hash,
+                'revision_file': os.path.join(batch_path, 'revisions.txt'),
+                'result_file': os.path.join(batch_path, 'results.txt'),
+            }
+            with open(substitutions['revision_file'], 'w') as f:
+                f.write(''.join('{}\n'.format(job.revision_hash) for job in jobs))
+
+            try:
+                with self.worktree(data.get('repository'), jobs[0].revision_hash) as path:
+                    if path:
+                        substitutions['path'] = path
+                    shell = string.Template(data['shell']).safe_substitute(substitutions)
+                    process = subprocess.Popen(shell.split(), stdout=out, stderr=err, universal_newlines=True)
+                    # wait4 also gives us the resource usage of this job only
+                    _, wait_status, rusage = os.wait4(process.pid, 0)
+                    if os.WIFSIGNALED(wait_status):
+                        exit_code = -os.WTERMSIG(wait_status)
+                    else:
+                        exit_code = os.WEXITSTATUS(wait_status)
+                    process.returncode = exit_code
+                    max_rss = rusage.ru_maxrss
+                    cpu_time = rusage.ru_utime + rusage.ru_stime
+            except subprocess.CalledProcessError as e:
+                err.write('could not create worktree: {}'.format(e.stderr))
+                exit_code = e.returncode
+
+            if os.path.isfile(substitutions['result_file']):
+                with open(substitutions['result_file'], 'r') as f:
+                    for line in f:
+                        result = line.split()
+                        if len(result) == 2 and result[1].lstrip('-').isdigit():
+                            results[result[0]] = int(result[1])
+
+        return exit_code, max_rss, cpu_time, results
+
     def loop(self):
         while True:
             # this blocks on empty queue
@@ -41,6 +123,15 @@ class Command(BaseCommand):
             if 'job_id' in data.keys():
                 job_id = data['job_id']
 
+            if 'refresh_project' in data.keys():
+                self.stdout.write('updating: {} ... '.format(data['refresh_project']), ending=b'')
+                try:
+                    refresh_clone(data['repository_url'], data['refresh_project'])
+                    self.stdout.write(self.style.SUCCESS('[OK]'))
+                except subprocess.CalledProcessError as e:
+                    self.stdout.write(self.style.ERROR('[ERROR]'))
+                    self.stderr.write(str(e))
+
             if 'shell' in data.keys():
                 start = timeit.default_timer()
 
@@ -49,50 +140,64 @@ class Command(BaseCommand):
 
                 # close db connection because we may have long running jobs
                 connections['default'].close()
-                if job_id:
+                if job_id or 'job_ids' in data.keys():
+                    # batches of revisions write their logs once, they are split into the logs of the jobs afterwards
+                    job_ids = data.get('job_ids', [job_id])
+                    name = str(job_id) if job_id else 'batch_{}'.format(job_ids[0])
+
                     # The peon writes these files as they are asynchronly directly accessed over PluginManagement, this is set to change in the future
-                    job = Job.objects.get(pk=data['job_id'])
-                    plugin_execution_output_path = os.path.join(self.output_path, str(job.plugin_execution.pk))
+                    jobs = list(Job.objects.filter(pk__in=job_ids).order_by('pk'))
+                    plugin_execution_output_path = os.path.join(self.output_path, str(data['plugin_execution_id']))
                     subprocess.run(['mkdir', '-p', plugin_execution_output_path])
-                    output_file = os.path.join(plugin_execution_output_path, str(job_id) + '_out.txt')
-                    error_file = os.path.join(plugin_execution_output_path, str(job_id) + '_err.txt')
+                    output_file = os.path.join(plugin_execution_output_path, name + '_out.txt')
+                    error_file = os.path.join(plugin_execution_output_path, name + '_err.txt')
 
-                    success = False
+                    started_at = timezone.now()
                     with open(output_file, 'w') as out:
                         with open(error_file, 'w') as err:
-                            try:
-                                success = True
-                                subprocess.run(data['shell'].split(), stdout=out, stderr=err, check=True, universal_newlines=True)
-                            except subprocess.CalledProcessError:
-                                success = False
+                            exit_code, max_rss, cpu_time, results = self.execute(data, jobs, out, err)
 
                     end = timeit.default_timer() - start
                     self.stdout.write('finished in {:.5f}s '.format(end), ending=b'')
 
                     # TODO: backchannel for results (for job_id this should be possible, everything else not at the moment)
                     # self.con.rpush(self.result_queue, json.dumps({'job_id': data['job_id'], 'result': 'DONE'}))
-                    job = Job.objects.get(pk=data['job_id'])
-                    if success:
-                        job.status = 'DONE'
-                    else:
-                        job.status = 'EXIT'
-                    job.save()
-
-                    # analogous to the HPC jobs we set the job to exit if we have output to stderr
-                    error_text = ''
-                    with open(error_file, 'r') as err:
-                        error_text = err.read()
-                        if len(error_text) > 0:
-                            job.status = 'EXIT'
-                            job.save()
-                            success = False
+                    # the exit code decides the state, plugins may log to stderr without failing
+                    success = exit_code == 0
+                    finished_at = timezone.now()
+                    if not job_id:
+                        for log_file, log_type in [(output_file, 'out'), (error_file, 'err')]:
+                            split_batch_log(log_file, {
+                                job.revision_hash: os.path.join(plugin_execution_output_path,
+                                                                '{}_{}.txt'.format(job.pk, log_type))
+                                for job in jobs
+                            })
+
+                    for job in jobs:
+                        if job_id:
+                            job.exit_code = exit_code
+                        else:
+                            # revisions without result failed, even if the plugin succeeded
+                            job.exit_code = results.get(job.revision_hash, exit_code or 1)
+
+                        job.status = 'DONE' if job.exit_code == 0 else 'EXIT'
+                        job.max_rss = max_rss
+                        job.cpu_time = cpu_time / len(jobs)
+                        job.started_at = started_at
+                        job.finished_at = finished_at
+                        job.save()
 
                     if success:
                         self.stdout.write(self.style.SUCCESS('[OK]'))
                     else:
                         self.stdout.write(self.style.ERROR('[ERROR]'))
                         # self.stderr.write(res.stderr.decode('utf-8'))
-                        self.stderr.write(error_text)
+                        with open(error_file, 'r') as err:
+                            self.stderr.write(err.read())
+
+                    if not job_id:
+                        os.remove(output_file)
+                        os.remove(error_file)
 
                 else:  # no job_id, intermediate step
                     res = subprocess.run(data['shell'].split(), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
@@ -114,6 +219,7 @@ class Command(BaseCommand):
         self.result_queue = settings.LOCALQUEUE['result_queue']
 
         self.output_path = settings.LOCALQUEUE['plugin_output']
+        self.scratch_path = settings.LOCALQUEUE.get('scratch_path', os.path.join(tempfile.gettempdir(), 'servershark'))
 
         self.stdout.write('listening...')
 
@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from django.core.management.base import BaseCommand
+
+from smartshark.models import RevisionIndex
+
+
+class Command(BaseCommand):
+    """Rebuilds the revision indexes from the MongoDB.
+
+    The indexes are only extended by incremental updates, revisions that were deleted or rewritten in the MongoDB are
+    removed by the rebuild.
+    """
+
+    help = 'Rebuild the revision indexes of all or the given projects'
+
+    def add_arguments(self, parser):
+        parser.add_argument('project_names', type=str, nargs='*', help='Names of the projects, all if none are given.')
+
+    def handle(self, *args, **options):
+        indexes = RevisionIndex.objects.select_related('project').order_by('pk')
+        if options['project_names']:
+            indexes = indexes.filter(project__name__in=options['project_names'])
+
+        for index in indexes:
+            added, removed = index.rebuild()
+            self.stdout.write('{}: added {} and removed {} revisions'.format(index, added, removed))
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+
+from smartshark.datacollection.executionutils import reconcile_plugin_execution, collect_job_accounting
+from smartshark.models import Job, PluginExecution
+from smartshark.utils.periodiccommand import PeriodicCommand
+
+logger = logging.getLogger('django')
+
+
+class Command(PeriodicCommand):
+    """Reconciles the states of all waiting jobs with the backend.
+
+    The views only read the stored job states, this process keeps them up to date. Afterwards the accounting of
+    finished jobs is collected, from which the resources of new jobs are predicted.
+    """
+
+    help = 'Reconcile the states of waiting jobs with the backend'
+
+    interval_setting = 'JOB_STATE_RECONCILE_INTERVAL'
+    activity = 'reconciliation'
+
+    def run_once(self, interface, **options):
+        plugin_executions = PluginExecution.objects.filter(
+            pk__in=Job.objects.filter(status='WAIT').values('plugin_execution_id')).order_by('pk')
+
+        for plugin_execution in plugin_executions:
+            try:
+                changed = reconcile_plugin_execution(interface, plugin_execution)
+                self.stdout.write('{}: {} jobs changed state'.format(plugin_execution, changed))
+            except Exception as e:
+                # the next run tries again, other plugin executions should not wait for this one
+                logger.exception(e)
+                self.stderr.write('{}: reconciliation failed: {}'.format(plugin_execution, e))
+
+        try:
+            self.stdout.write('accounting of {} jobs collected'.format(collect_job_accounting(interface)))
+        except Exception as e:
+            logger.exception(e)
+            self.stderr.write('collecting the accounting failed: {}'.format(e))
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+
+from smartshark.datacollection.executionutils import submit_pending_jobs
+from smartshark.models import Job, PluginExecution
+from smartshark.utils.periodiccommand import PeriodicCommand
+
+logger = logging.getLogger('django')
+
+
+class Command(PeriodicCommand):
+    """Submits the jobs that were not submitted yet, e.g., because the queue of the backend was full.
+
+    Plugin executions are submitted in the order of their creation, so jobs are only submitted after the jobs they
+    require.
+    """
+
+    help = 'Submit the jobs that were not submitted yet'
+
+    interval_setting = 'JOB_SUBMISSION_INTERVAL'
+    activity = 'submission'
+
+    def run_once(self, interface, **options):
+        plugin_executions = PluginExecution.objects.filter(
+            pk__in=Job.objects.filter(submitted=False).exclude(status='EXIT').values('plugin_execution_id'))\
+            .order_by('pk')
+
+        for plugin_execution in plugin_executions:
+            try:
+                submitted = 0
+                while True:
+                    count = submit_pending_jobs(interface, plugin_execution)
+                    if not count:
+                        break
+                    submitted += count
+                self.stdout.write('{}: {} jobs submitted'.format(plugin_execution, submitted))
+            except Exception as e:
+                # the next run tries again, other plugin executions should not wait for this one
+                logger.exception(e)
+                self.stderr.write('{}: submission failed: {}'.format(plugin_execution, e))
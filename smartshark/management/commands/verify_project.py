@@ -10,7 +10,7 @@ import pygit2
 from django.core.management.base import BaseCommand
 from django.db import connections
 
-from smartshark.models import Project, CommitVerification
+from smartshark.models import Project, CommitVerification, RevisionIndex
 from smartshark.mongohandler import handler
 from smartshark.utils.projectUtils import create_local_repo_for_project, get_all_commits_of_repo, get_commit_from_database, get_code_entities_from_database
 from smartshark.datacollection.executionutils import get_revisions_for_failed_verification
@@ -69,6 +69,10 @@ class Command(BaseCommand):
                     self.stdout.write('Found {} commits that previously failed'.format(len(allCommits)))
                     self.stdout.write('Overwriting commit verification data for {} previously failed commits'.format(len(allCommits)))
 
+                # commits that are not in the revision index are not stored in the mongodb
+                index = RevisionIndex.get_updated_index(project, vcsMongo['url'])
+                indexed_commits = set(index.get_revision_hashes().iterator())
+
                 # close connection because the above may take a long time
                 connections['default'].close()
 
@@ -92,7 +96,9 @@ class Command(BaseCommand):
 
                     resultModel.text = ""
 
-                    db_commit = get_commit_from_database(self.db, commit, vcsMongo["_id"])
+                    db_commit = None
+                    if str(commit) in indexed_commits:
+                        db_commit = get_commit_from_database(self.db, commit, vcsMongo["_id"])
 
                     # Basic validation wihtout checkout the version
                     if not db_commit:
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 23:05
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartshark', '0038_jobverification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExecutionDependency',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('match_revision', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='pluginexecution',
+            name='execution_type',
+            field=models.CharField(blank=True, choices=[('all', 'Executed on all revisions'), ('new', 'Executed on new revisions'), ('rev', 'Executed on specified revisions'), ('error', 'Executed on revisions that previously threw an error'), ('ver', 'Execute on all revisions where verification failed for one Plugin')], max_length=5, null=True),
+        ),
+        migrations.AddField(
+            model_name='executiondependency',
+            name='plugin_execution',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dependencies', to='smartshark.PluginExecution'),
+        ),
+        migrations.AddField(
+            model_name='executiondependency',
+            name='required_execution',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dependents', to='smartshark.PluginExecution'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='executiondependency',
+            unique_together=set([('plugin_execution', 'required_execution')]),
+        ),
+    ]
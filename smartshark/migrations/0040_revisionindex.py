@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 23:07
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartshark', '0039_executiondependency'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Revision',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('revision_hash', models.CharField(db_index=True, max_length=100)),
+                ('committer_date', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RevisionIndex',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('vcs_system_url', models.CharField(max_length=500)),
+                ('last_commit_id', models.CharField(blank=True, default='', max_length=24)),
+                ('updated_at', models.DateTimeField(blank=True, null=True)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='smartshark.Project')),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='job',
+            name='revision_hash',
+            field=models.CharField(blank=True, db_index=True, default=None, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='revision',
+            name='index',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='smartshark.RevisionIndex'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='revisionindex',
+            unique_together=set([('project', 'vcs_system_url')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='revision',
+            unique_together=set([('index', 'revision_hash')]),
+        ),
+    ]
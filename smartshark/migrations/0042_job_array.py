@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 23:13
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartshark', '0041_job_runtime'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='array_name',
+            field=models.CharField(blank=True, db_index=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='array_task_id',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 23:15
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartshark', '0042_job_array'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pluginexecution',
+            name='reconciled_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
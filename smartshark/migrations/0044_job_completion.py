@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 23:17
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartshark', '0043_pluginexecution_reconciled_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='exit_code',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='max_rss',
+            field=models.BigIntegerField(blank=True, help_text='Peak resident set size in kB', null=True),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 23:25
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartshark', '0044_job_completion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plugin',
+            name='revision_batch_size',
+            field=models.PositiveIntegerField(blank=True, default=None, null=True),
+        ),
+    ]
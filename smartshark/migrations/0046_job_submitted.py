@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 23:28
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def mark_existing_jobs_submitted(apps, schema_editor):
+    # jobs created before this migration were submitted together with their creation
+    apps.get_model('smartshark', 'Job').objects.update(submitted=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartshark', '0045_plugin_revision_batch_size'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='submitted',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.RunPython(mark_existing_jobs_submitted, migrations.RunPython.noop),
+    ]
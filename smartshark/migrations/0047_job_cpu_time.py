@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 23:31
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartshark', '0046_job_submitted'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='cpu_time',
+            field=models.FloatField(blank=True, help_text='Used cpu time (user and system) in seconds', null=True),
+        ),
+    ]
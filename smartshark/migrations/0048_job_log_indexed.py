@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 23:38
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartshark', '0047_job_cpu_time'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='log_indexed',
+            field=models.NullBooleanField(db_index=True, help_text='Logs are in the full-text log index, False if they are too large to be indexed'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 23:40
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartshark', '0048_job_log_indexed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pluginexecution',
+            name='logs_archived',
+            field=models.BooleanField(default=False, help_text='Logs of the jobs are packed into one archive'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 23:42
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartshark', '0049_pluginexecution_logs_archived'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobParseError',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file', models.CharField(db_index=True, max_length=255)),
+                ('line', models.TextField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='parse_errors_extracted',
+            field=models.BooleanField(db_index=True, default=False, help_text='Parse errors of coastSHARK are stored in JobParseError'),
+        ),
+        migrations.AddField(
+            model_name='jobparseerror',
+            name='job',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='parse_errors', to='smartshark.Job'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 00:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartshark', '0050_jobparseerror'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='submission_attempts',
+            field=models.PositiveIntegerField(default=0, help_text='Failed submissions of the job'),
+        ),
+        migrations.AddField(
+            model_name='pluginexecution',
+            name='submission_locked_at',
+            field=models.DateTimeField(blank=True, help_text='Jobs are being submitted since, see submit_pending_jobs', null=True),
+        ),
+    ]
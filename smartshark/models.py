@@ -1,10 +1,12 @@
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import Q
 from django.dispatch import receiver
 from django.db.models.signals import post_save, pre_save
 from django import forms
 from django.utils.deconstruct import deconstructible
+from django.utils import timezone
 
 from collections import OrderedDict
 
@@ -92,6 +94,8 @@ class Plugin(models.Model):
     archive = models.FileField(upload_to="uploads/plugins/", validators=[validate_file])
     requires = models.ManyToManyField("self", blank=True, symmetrical=False)
     linux_libraries = models.CharField(max_length=1000, default=None, blank=True, null=True)
+    # revision plugins may process up to this many revisions in one call, listed in $revision_file
+    revision_batch_size = models.PositiveIntegerField(default=None, blank=True, null=True)
 
     active = models.BooleanField(default=False)
     installed = models.BooleanField(default=False)
@@ -158,12 +162,7 @@ class Plugin(models.Model):
         return revisions
 
     def get_all_jobs_for_project(self, project):
-        jobs = []
-        plugin_executions = PluginExecution.objects.all().filter(project=project, plugin=self)
-        for plugin_execution in plugin_executions:
-            jobs.extend(Job.objects.all().filter(plugin_execution=plugin_execution))
-
-        return jobs
+        return Job.objects.filter(plugin_execution__project=project, plugin_execution__plugin=self)
 
     def get_substitution_plugin_for(self, plugin):
         # Read the information in again from the tar archive
@@ -210,6 +209,7 @@ class Plugin(models.Model):
         self.plugin_type = info_json['plugin_type']
         self.description = info_json['description']
         self.linux_libraries = ','.join(info_json['linux_libraries'])
+        self.revision_batch_size = info_json.get('revision_batch_size', None)
         self.archive = archive
 
         # Save the schema of the plugin in the mongodb
@@ -295,6 +295,10 @@ class PluginExecution(models.Model):
     status = models.CharField(max_length=8, choices=STATUS_CHOICES, default='WAIT')
 
     submitted_at = models.DateTimeField(auto_now_add=True)
+    reconciled_at = models.DateTimeField(blank=True, null=True)
+    logs_archived = models.BooleanField(default=False, help_text='Logs of the jobs are packed into one archive')
+    submission_locked_at = models.DateTimeField(blank=True, null=True,
+                                                help_text='Jobs are being submitted since, see submit_pending_jobs')
 
     def __str__(self):
         return "Plugin Execution of Plugin %s and Project %s" % (self.plugin, self.project)
@@ -346,6 +350,23 @@ class PluginExecution(models.Model):
             sorted_values += value + ' '
         return sorted_values
 
+class ExecutionDependency(models.Model):
+    """Dependency of a plugin execution on another plugin execution.
+
+    If match_revision is set, the job for a revision only requires the job for the same revision of the required
+    plugin execution, otherwise it requires all jobs of the required plugin execution.
+    """
+    plugin_execution = models.ForeignKey(PluginExecution, on_delete=models.CASCADE, related_name='dependencies')
+    required_execution = models.ForeignKey(PluginExecution, on_delete=models.CASCADE, related_name='dependents')
+    match_revision = models.BooleanField(default=False)
+
+    class Meta:
+        unique_together = ('plugin_execution', 'required_execution',)
+
+    def __str__(self):
+        return "Plugin execution %s requires plugin execution %s" % (self.plugin_execution_id, self.required_execution_id)
+
+
 class ExecutionHistory(models.Model):
     execution_argument = models.ForeignKey(Argument, on_delete=models.CASCADE)
     plugin_execution = models.ForeignKey(PluginExecution, on_delete=models.CASCADE)
@@ -380,8 +401,39 @@ class Job(models.Model):
     job_id = models.IntegerField(blank=True, null=True)
     plugin_execution = models.ForeignKey(PluginExecution)
     status = models.CharField(max_length=8, choices=STATUS_CHOICES, default='WAIT')
-    revision_hash = models.CharField(max_length=100, blank=True, null=True, default=None)
+    revision_hash = models.CharField(max_length=100, blank=True, null=True, default=None, db_index=True)
     requires = models.ManyToManyField("self", blank=True, symmetrical=False)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    array_name = models.CharField(max_length=100, blank=True, null=True, db_index=True)
+    array_task_id = models.IntegerField(blank=True, null=True)
+    exit_code = models.IntegerField(blank=True, null=True)
+    max_rss = models.BigIntegerField(blank=True, null=True, help_text='Peak resident set size in kB')
+    cpu_time = models.FloatField(blank=True, null=True, help_text='Used cpu time (user and system) in seconds')
+    submitted = models.BooleanField(default=False, db_index=True)
+    submission_attempts = models.PositiveIntegerField(default=0, help_text='Failed submissions of the job')
+    parse_errors_extracted = models.BooleanField(default=False, db_index=True,
+                                                 help_text='Parse errors of coastSHARK are stored in JobParseError')
+    log_indexed = models.NullBooleanField(db_index=True, help_text='Logs are in the full-text log index, False if '
+                                                                   'they are too large to be indexed')
+
+    def get_required_jobs(self):
+        """Return all jobs this job requires.
+
+        The jobs are derived from the dependencies of the plugin execution, so the cross product of required jobs is
+        never stored. Jobs that were created with explicit requirements in Job.requires are included.
+        """
+        condition = Q(pk__in=self.requires.values('pk'))
+        for dependency in self.plugin_execution.dependencies.all():
+            if dependency.match_revision:
+                condition |= Q(plugin_execution_id=dependency.required_execution_id, revision_hash=self.revision_hash)
+            else:
+                condition |= Q(plugin_execution_id=dependency.required_execution_id)
+        return Job.objects.filter(condition)
+
+    def get_unfinished_required_jobs(self):
+        """Return the required jobs this job still waits on."""
+        return self.get_required_jobs().filter(status='WAIT')
 
     def __str__(self):
         return "job_id: %s, plugin: %s, project: %s, status: %s, hash: %s" % (self.job_id,
@@ -390,6 +442,121 @@ class Job(models.Model):
                                                                               self.status, self.revision_hash)
 
 
+class RevisionIndex(models.Model):
+    """Index of the revisions of a vcs system of a project that are stored in the mongodb.
+
+    The index is updated incrementally: last_commit_id is the highest mongodb id of all commits that were added to
+    the index, only commits with a higher id are fetched on the next update.
+    """
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    vcs_system_url = models.CharField(max_length=500)
+    last_commit_id = models.CharField(max_length=24, blank=True, default='')
+    updated_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('project', 'vcs_system_url',)
+
+    def __str__(self):
+        return "Revision index of %s for project %s" % (self.vcs_system_url, self.project)
+
+    @staticmethod
+    def get_updated_index(project, vcs_system_url):
+        index, created = RevisionIndex.objects.get_or_create(project=project, vcs_system_url=vcs_system_url)
+        index.update()
+        return index
+
+    def update(self):
+        """Add all commits that were stored in the mongodb since the last update and return their number."""
+        added, _ = self._fetch_revisions(self.last_commit_id or None)
+        return added
+
+    def rebuild(self):
+        """Add all missing commits and remove the revisions that are no longer stored in the mongodb.
+
+        Incremental updates only add commits, the index has to be rebuilt after commits were deleted or rewritten in
+        the mongodb. Returns the number of added and removed revisions.
+        """
+        added, revision_hashes = self._fetch_revisions(None)
+
+        stale = [pk for pk, revision_hash in self.revisions.values_list('pk', 'revision_hash')
+                 if revision_hash not in revision_hashes]
+        for i in range(0, len(stale), settings.JOB_CREATION_BATCH_SIZE):
+            Revision.objects.filter(pk__in=stale[i:i + settings.JOB_CREATION_BATCH_SIZE]).delete()
+
+        return added, len(stale)
+
+    def _fetch_revisions(self, after_id):
+        """Add the commits stored after the commit with after_id, return their number and their revision hashes."""
+        last_commit_id = None
+        added = 0
+        batch = []
+        revision_hashes = set()
+
+        for commit in handler.get_revisions_for_url(self.vcs_system_url, after_id=after_id):
+            batch.append(commit)
+            revision_hashes.add(commit['revision_hash'])
+            if last_commit_id is None or commit['_id'] > last_commit_id:
+                last_commit_id = commit['_id']
+
+            if len(batch) >= settings.JOB_CREATION_BATCH_SIZE:
+                added += self._add_revisions(batch)
+                batch = []
+        added += self._add_revisions(batch)
+
+        if last_commit_id is not None:
+            self.last_commit_id = str(last_commit_id)
+        elif after_id is None:
+            # the vcs system has no commits anymore
+            self.last_commit_id = ''
+        self.updated_at = timezone.now()
+        self.save()
+
+        return added, revision_hashes
+
+    def _add_revisions(self, commits):
+        if not commits:
+            return 0
+
+        # commits may be stored again in the mongodb with a new id, e.g., if vcsSHARK is executed again
+        existing = set(self.revisions.filter(revision_hash__in=[commit['revision_hash'] for commit in commits])
+                       .values_list('revision_hash', flat=True))
+
+        revisions = {}
+        for commit in commits:
+            if commit['revision_hash'] in existing:
+                continue
+
+            committer_date = commit.get('committer_date', None)
+            if committer_date is not None and timezone.is_naive(committer_date):
+                committer_date = timezone.make_aware(committer_date, timezone.utc)
+            revisions[commit['revision_hash']] = Revision(index=self, revision_hash=commit['revision_hash'],
+                                                          committer_date=committer_date)
+
+        Revision.objects.bulk_create(revisions.values())
+        return len(revisions)
+
+    def get_revision_hashes(self):
+        return self.revisions.values_list('revision_hash', flat=True)
+
+    def get_new_revision_hashes(self, plugin):
+        """Return the hashes of all revisions on which the plugin was not executed for the project yet."""
+        processed = Job.objects.filter(plugin_execution__plugin=plugin, plugin_execution__project=self.project,
+                                       revision_hash__isnull=False).values('revision_hash')
+        return self.get_revision_hashes().exclude(revision_hash__in=processed)
+
+
+class Revision(models.Model):
+    index = models.ForeignKey(RevisionIndex, on_delete=models.CASCADE, related_name='revisions')
+    revision_hash = models.CharField(max_length=100, db_index=True)
+    committer_date = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('index', 'revision_hash',)
+
+    def __str__(self):
+        return self.revision_hash
+
+
 class MongoRole(models.Model):
     name = models.CharField(max_length=100)
 
@@ -432,6 +599,16 @@ class SmartsharkUser(models.Model):
             handler.update_user(username=user.username, password=password, roles=[])
 
 
+class JobParseError(models.Model):
+    """File for which coastSHARK logged a parser or lexer error, extracted once from the output log of the job."""
+    job = models.ForeignKey(Job, related_name='parse_errors')
+    file = models.CharField(max_length=255, db_index=True)
+    line = models.TextField()
+
+    def __str__(self):
+        return '{} ({})'.format(self.file, self.line)
+
+
 class CommitVerification(models.Model):
     project = models.ForeignKey(Project)
     vcs_system = models.CharField(max_length=100)
@@ -178,9 +178,24 @@ class MongoHandler(object):
             except:
                 pass
 
-    def get_revisions_for_url(self, vcs_system_url):
+    def get_revisions_for_url(self, vcs_system_url, after_id=None):
         vs = self.client.get_database(self.database).get_collection('vcs_system').find_one({'url': vcs_system_url})
-        return self.client.get_database(self.database).get_collection('commit').find({'vcs_system_id': vs['_id']}, {'revision_hash': 1})
+        query = {'vcs_system_id': vs['_id']}
+
+        # only commits that were stored after the commit with the given id
+        if after_id is not None:
+            query['_id'] = {'$gt': ObjectId(after_id)}
+        return self.client.get_database(self.database).get_collection('commit').find(query, {'revision_hash': 1, 'committer_date': 1})
+
+    def count_revisions_for_url(self, vcs_system_url, after_id=None):
+        """Return the number of commits of the vcs system, only those stored after the commit with after_id if given."""
+        vs = self.client.get_database(self.database).get_collection('vcs_system').find_one({'url': vcs_system_url})
+        if vs is None:
+            return 0
+        query = {'vcs_system_id': vs['_id']}
+        if after_id is not None:
+            query['_id'] = {'$gt': ObjectId(after_id)}
+        return self.client.get_database(self.database).get_collection('commit').find(query).count()
 
     def get_vcs_url_for_project_id(self, mongo_id):
         url = None
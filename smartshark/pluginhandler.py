@@ -82,6 +82,12 @@ class PluginInformationHandler(object):
             if field not in self.info_json:
                 raise ValidationError("%s not in info_json" % field, 'info_file_%s' % field)
 
+        revision_batch_size = self.info_json.get('revision_batch_size', None)
+        if revision_batch_size is not None:
+            if self.info_json['plugin_type'] != 'rev' or not isinstance(revision_batch_size, int) or revision_batch_size < 1:
+                raise ValidationError("revision_batch_size in info_json must be a positive number and is only allowed "
+                                      "for revision plugins.", 'info_file_revision_batch_size')
+
         for created_collection_fields in self.info_json['created_collections']:
             for field in self.info_file_created_collection_required_fields:
                 if field not in created_collection_fields:
@@ -1,73 +1,162 @@
 import paramiko
 import re
+import threading
 import time
 
+from django.conf import settings
 from paramiko import SSHException
-from sshtunnel import SSHTunnelForwarder, HandlerSSHTunnelForwarderError
+from sshtunnel import SSHTunnelForwarder
+
+
+class SSHConnection(object):
+    """One authenticated ssh connection of the pool, optionally through an ssh tunnel."""
+
+    def __init__(self, host, user, port, tunnel_host, tunnel_user, tunnel_psw, tunnel_port, use_tunnel, key_path):
+        self.server = None
+        self.ssh = paramiko.SSHClient()
+        self.ssh.load_system_host_keys()
+        self.ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        self.sessions = 0
+        self.last_used = time.time()
+        # dead connections with open sessions are closed when their last session is released
+        self.closing = False
+
+        if use_tunnel:
+            # the tunnel binds to a free local port, concurrent tunnels can not collide
+            self.server = SSHTunnelForwarder(
+                (tunnel_host, tunnel_port),
+                ssh_username=tunnel_user,
+                ssh_password=tunnel_psw,
+                remote_bind_address=(host, port),
+                local_bind_address=('127.0.0.1', 0)
+            )
+            self.server.start()
+            try:
+                self.ssh.connect('127.0.0.1', self.server.local_bind_port, username=user)
+            except Exception:
+                self.server.close()
+                raise
+        else:
+            # p = paramiko.ecdsakey.ECDSAKey.from_private_key_file(key_path)
+            p = paramiko.rsakey.RSAKey.from_private_key_file(key_path)
+            self.ssh.connect(host, port, username=user, pkey=p)
+
+    def is_alive(self):
+        transport = self.ssh.get_transport()
+        if transport is None or not transport.is_active():
+            return False
+        if self.server is not None and not self.server.is_active:
+            return False
+        try:
+            transport.send_ignore()
+        except (SSHException, EOFError, OSError):
+            return False
+        return True
+
+    def close(self):
+        self.ssh.close()
+        if self.server is not None:
+            self.server.close()
+
+
+class SSHConnectionPool(object):
+    """Process wide pool of ssh connections.
+
+    Channels and sftp sessions of concurrent ShellHandlers are multiplexed over the same connection, up to
+    SSH_POOL_MAX_SESSIONS per connection. Dead connections are evicted when they are handed out and closed as soon as
+    their last session is released, connections which were not used for SSH_POOL_IDLE_TIMEOUT seconds are closed.
+    The keepalive check of a connection and closing connections are round trips to the host, they run outside of the
+    lock of the pool.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._connections = {}
+
+    def acquire(self, key):
+        while True:
+            with self._lock:
+                idle = self._evict_idle(key)
+                connection = next((connection for connection in self._connections[key]
+                                   if connection.sessions < settings.SSH_POOL_MAX_SESSIONS), None)
+                if connection is not None:
+                    # the session keeps other threads from closing the connection while it is checked
+                    connection.sessions += 1
+                    connection.last_used = time.time()
+
+            for idle_connection in idle:
+                idle_connection.close()
+            if connection is None:
+                break
+            if connection.is_alive():
+                return connection
+
+            with self._lock:
+                if connection in self._connections[key]:
+                    self._connections[key].remove(connection)
+                connection.closing = True
+            self.release(key, connection)
+
+        connection = SSHConnection(*key)
+        connection.sessions = 1
+        with self._lock:
+            self._connections.setdefault(key, []).append(connection)
+        return connection
+
+    def release(self, key, connection):
+        with self._lock:
+            connection.sessions -= 1
+            connection.last_used = time.time()
+            close = connection.closing and connection.sessions == 0
+        if close:
+            connection.close()
+
+    def close_all(self):
+        with self._lock:
+            connections = [connection for connections in self._connections.values() for connection in connections]
+            self._connections = {}
+        for connection in connections:
+            connection.close()
+
+    def _evict_idle(self, key):
+        """Remove the connections which were not used for SSH_POOL_IDLE_TIMEOUT seconds and return them."""
+        idle, active = [], []
+        for connection in self._connections.get(key, []):
+            if connection.sessions == 0 and time.time() - connection.last_used > settings.SSH_POOL_IDLE_TIMEOUT:
+                idle.append(connection)
+            else:
+                active.append(connection)
+        self._connections[key] = active
+        return idle
+
+
+pool = SSHConnectionPool()
 
 
 class ShellHandler:
+    """Gives access to a pooled ssh connection to the host for the duration of a with block."""
 
     def __init__(self, host, user, psw, port, tunnel_host, tunnel_user, tunnel_psw, tunnel_port, use_tunnel,
-                 bind_port=10020, key_path=None):
-        self.host = host
-        self.user = user
-        self.psw = psw
-        self.port = port
-        self.tunnel_host = tunnel_host
-        self.tunnel_user = tunnel_user
-        self.tunnel_psw = tunnel_psw
-        self.tunnel_port = tunnel_port
-        self.use_tunnel = use_tunnel
+                 key_path=None):
+        self.key = (host, user, port, tunnel_host, tunnel_user, tunnel_psw, tunnel_port, use_tunnel, key_path)
+        self.connection = None
         self.ssh = None
-        self.server = None
-        self.bind_port = bind_port
-        self.key_path = key_path
-        # self.p = paramiko.ecdsakey.ECDSAKey.from_private_key_file(key_path)
-        self.p = paramiko.rsakey.RSAKey.from_private_key_file(key_path)
 
     def __enter__(self):
-        if self.use_tunnel:
-            timeout = 60
-            timeout_start = time.time()
-            not_connected = True
-
-            while time.time() < timeout_start + timeout and not_connected is True:
-                try:
-                    self.server = SSHTunnelForwarder(
-                        (self.tunnel_host, self.tunnel_port),
-                        ssh_username=self.tunnel_user,
-                        ssh_password=self.tunnel_psw,
-                        remote_bind_address=(self.host, self.port),
-                        local_bind_address=('127.0.0.1', self.bind_port)
-                    )
-                    self.server.start()
-
-                    self.ssh = paramiko.SSHClient()
-                    self.ssh.load_system_host_keys()
-                    self.ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-                    # self.ssh.connect('127.0.0.1', self.bind_port, pkey=self.p)  # username=self.user, password=self.psw)
-                    self.ssh.connect('127.0.0.1', self.bind_port, username=self.user)  # username=self.user, password=self.psw)
-                    not_connected = False
-                except (HandlerSSHTunnelForwarderError, SSHException) as e:
-                    self.bind_port = self.bind_port + 1
-        else:
-            self.ssh = paramiko.SSHClient()
-            self.ssh.load_system_host_keys()
-            self.ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            # self.ssh.connect(self.host, self.port, pkey=self.p)  # username=self.user, password=self.psw)
-            self.ssh.connect(self.host, self.port, username=self.user, pkey=self.p)  # username=self.user, password=self.psw)
-
+        self.connection = pool.acquire(self.key)
+        self.ssh = self.connection.ssh
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if self.use_tunnel:
-            self.server.close()
-        else:
-            self.ssh.close()
+        pool.release(self.key, self.connection)
+        self.connection = None
+        self.ssh = None
 
         return
 
+    def open_sftp(self):
+        return self.ssh.open_sftp()
+
     def get_ssh_client(self):
         return self.ssh
 
@@ -89,7 +178,11 @@ class ShellHandler:
             chan.get_pty()
             out = chan.makefile()
             chan.exec_command(cmd)
-            return out.readlines()
+            try:
+                return out.readlines()
+            finally:
+                # the connection is shared, channels must not outlive the command
+                chan.close()
         else:
             channel = self.ssh.invoke_shell()
             stdin = channel.makefile('wb')
@@ -125,6 +218,8 @@ class ShellHandler:
                     # get rid of 'coloring and formatting' special characters
                     shout.append(re.compile(r'(\x9B|\x1B\[)[0-?]*[ -/]*[@-~]').sub('', line).
                                  replace('\b', '').replace('\r', ''))
+            channel.close()
+
             # first and last lines of shout/sherr contain a prompt
             if shout and echo_cmd in shout[-1]:
                 shout.pop()
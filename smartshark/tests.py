@@ -1,12 +1,43 @@
+import datetime
+import io
 import json
 import os
+import subprocess
+import sys
+import shutil
+import tarfile
+import tempfile
+from unittest import mock
 from bson.json_util import loads
 from bson.objectid import ObjectId
 
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.contrib.admin import AdminSite
 from django.test import TestCase
+from django.utils import timezone
 
 from smartshark.views import collection
 from smartshark.mongohandler import handler
+from smartshark import shellhandler
+from smartshark.admin import JobAdmin
+from smartshark.models import Project, Plugin, PluginExecution, Job, RevisionIndex, Revision, CommitVerification, \
+    JobParseError
+from smartshark.datacollection.hpcconnector import HPCConnector
+from smartshark.datacollection.localqueueconnector import LocalQueueConnector
+from smartshark.datacollection.pluginmanagementinterface import PluginManagementInterface
+from smartshark.management.commands.index_job_logs import Command as IndexJobLogsCommand
+from smartshark.management.commands.ingest_job_completions import Command as IngestJobCompletionsCommand
+from smartshark.management.commands.reconcile_jobs import Command as ReconcileJobsCommand
+from smartshark.management.commands.peon import Command as PeonCommand
+from smartshark.utils.joblog import LogCache, get_archive_command, split_batch_log
+from smartshark.utils.logindex import LogIndex
+from smartshark.utils.verification import check_parse_errors
+from smartshark.utils.projectclone import refresh_clone
+from smartshark.datacollection.executionutils import JobCreator, create_dependencies, plan_jobs_for_execution, \
+    reconcile_plugin_execution, store_completion_records, submit_pending_jobs, predict_job_resources, \
+    get_previous_attempts, collect_job_accounting
 
 DATABASE_NAME = "smartshark_unittest"
 PROJECT_DELETE = "zookeeper-testdelete"
@@ -147,4 +178,1056 @@ class TestDataDeletionOnProject(MongoDBIntegrationBasicTest):
             localCount = localCount + self.calculateNumber(deb)
         localCount = localCount + tree.count
         tree.count = 0
-        return localCount
\ No newline at end of file
+        return localCount
+
+class ExecutionTestCase(TestCase):
+    """Creates projects and plugins without the signal handlers, which would need a running MongoDB."""
+
+    def setUp(self):
+        Project.objects.bulk_create([Project(name='testproject', mongo_id='5b0d0c0b0a0908070605040a')])
+        Plugin.objects.bulk_create([
+            Plugin(name='vcsSHARK', author='test', version='1.0.0', description='', plugin_type='repo', archive='vcs.tar'),
+            Plugin(name='mecoSHARK', author='test', version='1.0.0', description='', plugin_type='rev', archive='meco.tar'),
+        ])
+        self.project = Project.objects.get(name='testproject')
+        self.vcs = Plugin.objects.get(name='vcsSHARK')
+        self.meco = Plugin.objects.get(name='mecoSHARK')
+        self.meco.requires.add(self.vcs)
+
+
+class TestJobCreator(ExecutionTestCase):
+
+    def test_batches(self):
+        pe = PluginExecution.objects.create(plugin=self.meco, project=self.project, execution_type='rev')
+        progress = []
+        creator = JobCreator(pe, batch_size=3, progress=lambda plugin_execution, created: progress.append(created))
+        for i in range(7):
+            creator.add(revision_hash='rev{}'.format(i))
+        creator.flush()
+
+        self.assertEqual(creator.created, 7)
+        self.assertEqual(progress, [3, 6, 7])
+        self.assertEqual(set(Job.objects.filter(plugin_execution=pe).values_list('revision_hash', flat=True)),
+                         {'rev{}'.format(i) for i in range(7)})
+
+    def test_submit_batches(self):
+        pe = PluginExecution.objects.create(plugin=self.meco, project=self.project, execution_type='rev')
+        submitted = []
+        creator = JobCreator(pe, batch_size=2,
+                             submit=lambda plugin_execution, jobs: submitted.append([job.revision_hash for job in jobs]))
+        for i in range(5):
+            creator.add(revision_hash='rev{}'.format(i))
+        creator.flush()
+
+        self.assertEqual(submitted, [['rev0', 'rev1'], ['rev2', 'rev3'], ['rev4']])
+
+
+class TestRevisionIndex(ExecutionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.index = RevisionIndex.objects.create(project=self.project, vcs_system_url='https://github.com/test/test')
+        self.commits = [{'_id': ObjectId('5b0d0c0b0a0908070605040{}'.format(i)), 'revision_hash': 'rev{}'.format(i),
+                         'committer_date': datetime.datetime(2018, 1, i + 1)} for i in range(3)]
+
+    def test_update(self):
+        with mock.patch.object(handler, 'get_revisions_for_url', return_value=self.commits[:2]) as get_revisions:
+            self.assertEqual(self.index.update(), 2)
+            get_revisions.assert_called_with(self.index.vcs_system_url, after_id=None)
+
+        with mock.patch.object(handler, 'get_revisions_for_url', return_value=self.commits[1:]) as get_revisions:
+            self.assertEqual(self.index.update(), 1)
+            get_revisions.assert_called_with(self.index.vcs_system_url, after_id=str(self.commits[1]['_id']))
+
+        self.assertEqual(self.index.last_commit_id, str(self.commits[2]['_id']))
+        self.assertEqual(set(self.index.get_revision_hashes()), {'rev0', 'rev1', 'rev2'})
+
+    def test_rebuild(self):
+        with mock.patch.object(handler, 'get_revisions_for_url', return_value=self.commits):
+            self.index.update()
+
+        # rev1 was deleted and rev2 rewritten with a new hash in the mongodb
+        rewritten = {'_id': ObjectId('5b0d0c0b0a09080706050410'), 'revision_hash': 'rev3', 'committer_date': None}
+        with mock.patch.object(handler, 'get_revisions_for_url', return_value=[self.commits[0], rewritten]) as get_revisions:
+            self.assertEqual(self.index.rebuild(), (1, 2))
+            get_revisions.assert_called_with(self.index.vcs_system_url, after_id=None)
+
+        self.assertEqual(set(self.index.get_revision_hashes()), {'rev0', 'rev3'})
+        self.assertEqual(self.index.last_commit_id, str(rewritten['_id']))
+
+    def test_new_revisions(self):
+        with mock.patch.object(handler, 'get_revisions_for_url', return_value=self.commits):
+            self.index.update()
+
+        pe = PluginExecution.objects.create(plugin=self.meco, project=self.project, execution_type='all')
+        Job.objects.create(plugin_execution=pe, revision_hash='rev0')
+        Job.objects.create(plugin_execution=pe, revision_hash='rev2')
+        other = PluginExecution.objects.create(plugin=self.vcs, project=self.project)
+        Job.objects.create(plugin_execution=other)
+
+        self.assertEqual(list(self.index.get_new_revision_hashes(self.meco)), ['rev1'])
+        self.assertEqual(set(self.index.get_new_revision_hashes(self.vcs)), {'rev0', 'rev1', 'rev2'})
+
+
+class TestExecutionDependency(ExecutionTestCase):
+
+    def test_whole_execution(self):
+        vcs_pe = PluginExecution.objects.create(plugin=self.vcs, project=self.project)
+        req_job = Job.objects.create(plugin_execution=vcs_pe)
+        pe = PluginExecution.objects.create(plugin=self.meco, project=self.project, execution_type='rev')
+        dependencies = create_dependencies(pe, {self.vcs.id: vcs_pe})
+        self.assertFalse(dependencies[0].match_revision)
+
+        job = Job.objects.create(plugin_execution=pe, revision_hash='a')
+        self.assertEqual(list(job.get_required_jobs()), [req_job])
+        self.assertEqual(list(job.get_unfinished_required_jobs()), [req_job])
+
+        req_job.status = 'DONE'
+        req_job.save()
+        self.assertFalse(job.get_unfinished_required_jobs().exists())
+
+    def test_match_revision(self):
+        upstream = PluginExecution.objects.create(plugin=self.vcs, project=self.project)
+        job_a = Job.objects.create(plugin_execution=upstream, revision_hash='a')
+        Job.objects.create(plugin_execution=upstream, revision_hash='b')
+        pe = PluginExecution.objects.create(plugin=self.meco, project=self.project, execution_type='rev')
+        pe.dependencies.create(required_execution=upstream, match_revision=True)
+
+        job = Job.objects.create(plugin_execution=pe, revision_hash='a')
+        self.assertEqual(list(job.get_required_jobs()), [job_a])
+
+    def test_running_execution(self):
+        PluginExecution.objects.create(plugin=self.vcs, project=self.project)
+        running = PluginExecution.objects.create(plugin=self.vcs, project=self.project)
+        Job.objects.create(plugin_execution=running)
+        pe = PluginExecution.objects.create(plugin=self.meco, project=self.project, execution_type='rev')
+
+        dependencies = create_dependencies(pe, {})
+        self.assertEqual([dependency.required_execution for dependency in dependencies], [running])
+
+
+
+class TestPlanJobs(ExecutionTestCase):
+
+    def test_plan(self):
+        done = PluginExecution.objects.create(plugin=self.meco, project=self.project, execution_type='rev')
+        started_at = datetime.datetime(2018, 1, 1, tzinfo=datetime.timezone.utc)
+        Job.objects.create(plugin_execution=done, revision_hash='a', status='DONE', started_at=started_at,
+                           finished_at=started_at + datetime.timedelta(hours=1))
+
+        pes = [PluginExecution(plugin=self.vcs, project=self.project),
+               PluginExecution(plugin=self.meco, project=self.project, execution_type='rev', revisions='a,b,c',
+                               cores_per_job=None)]
+        plan = plan_jobs_for_execution(self.project, pes, default_cores_per_job=2)
+
+        self.assertEqual([(entry['jobs'], entry['fan_in']) for entry in plan], [(1, 0), (3, 1)])
+        self.assertIsNone(plan[0]['core_hours'])
+        self.assertEqual(plan[1]['runtime'], 3600)
+        self.assertEqual(plan[1]['core_hours'], 6)
+        self.assertEqual(PluginExecution.objects.count(), 1)
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_plan_without_index(self):
+        url = 'https://github.com/test/test'
+        pes = [PluginExecution(plugin=self.meco, project=self.project, execution_type=execution_type,
+                               repository_url=url) for execution_type in ['all', 'new']]
+
+        # the plan counts the commits in the mongodb and neither creates nor updates the revision index
+        with mock.patch.object(handler, 'count_revisions_for_url', return_value=5) as count_revisions_for_url, \
+                mock.patch.object(handler, 'get_revisions_for_url') as get_revisions_for_url:
+            plan = plan_jobs_for_execution(self.project, pes)
+            get_revisions_for_url.assert_not_called()
+            count_revisions_for_url.assert_called_with(url)
+        self.assertEqual([entry['jobs'] for entry in plan], [5, 5])
+        self.assertFalse(RevisionIndex.objects.exists())
+
+        # with an index the commits since its last update are added to the revisions of the index
+        index = RevisionIndex.objects.create(project=self.project, vcs_system_url=url, last_commit_id='5' * 24)
+        Revision.objects.bulk_create([Revision(index=index, revision_hash=revision) for revision in ['a', 'b']])
+        Job.objects.create(plugin_execution=PluginExecution.objects.create(plugin=self.meco, project=self.project),
+                           revision_hash='a')
+        with mock.patch.object(handler, 'count_revisions_for_url', return_value=1) as count_revisions_for_url:
+            plan = plan_jobs_for_execution(self.project, pes)
+            count_revisions_for_url.assert_called_with(url, '5' * 24)
+        self.assertEqual([entry['jobs'] for entry in plan], [3, 2])
+
+
+class TestSSHConnectionPool(TestCase):
+
+    def test_reuse_and_evict(self):
+        with mock.patch.object(shellhandler, 'SSHConnection') as connection_class:
+            connection_class.side_effect = lambda *key: mock.Mock(sessions=0, last_used=0, closing=False)
+            pool = shellhandler.SSHConnectionPool()
+
+            first = pool.acquire('key')
+            self.assertIs(pool.acquire('key'), first)
+            self.assertEqual(first.sessions, 2)
+
+            pool.release('key', first)
+            pool.release('key', first)
+            first.is_alive.return_value = False
+            second = pool.acquire('key')
+            self.assertIsNot(second, first)
+            first.close.assert_called_once_with()
+
+            # a dead connection in use is closed when its last session is released
+            second.is_alive.return_value = False
+            self.assertIsNot(pool.acquire('key'), second)
+            second.close.assert_not_called()
+            pool.release('key', second)
+            second.close.assert_called_once_with()
+
+    def test_alive_check_outside_lock(self):
+        with mock.patch.object(shellhandler, 'SSHConnection') as connection_class:
+            connection_class.side_effect = lambda *key: mock.Mock(sessions=0, last_used=0, closing=False)
+            pool = shellhandler.SSHConnectionPool()
+            first = pool.acquire('key')
+            pool.release('key', first)
+
+            # other threads can use the pool while the keepalive of the connection is sent
+            first.is_alive.side_effect = lambda: not pool._lock.locked()
+            self.assertIs(pool.acquire('key'), first)
+            first.close.side_effect = lambda: self.assertFalse(pool._lock.locked())
+            first.is_alive.side_effect = None
+            first.is_alive.return_value = False
+            self.assertIsNot(pool.acquire('key'), first)
+            pool.release('key', first)
+            first.close.assert_called_once_with()
+
+
+class TestHPCConnector(ExecutionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.connector = HPCConnector()
+        self.connector.max_array_size = 2
+        self.connector.array_throttle = 5
+        self.pe = PluginExecution.objects.create(plugin=self.meco, project=self.project, execution_type='rev')
+
+    def test_submit_job_arrays(self):
+        for revision in ['a', 'b', 'c']:
+            Job.objects.create(plugin_execution=self.pe, revision_hash=revision)
+        jobs = Job.objects.filter(plugin_execution=self.pe).order_by('pk')
+        first, second, third = jobs
+
+        with mock.patch.object(self.connector, 'write_remote_file') as write_remote_file, \
+                mock.patch.object(self.connector, 'send_and_execute_file') as send_and_execute_file:
+            self.connector.submit_jobs(self.pe, jobs)
+
+        index_files = {call[0][0]: call[0][1] for call in write_remote_file.call_args_list if call[0][0].endswith('.txt')}
+        self.assertEqual(sorted(index_files.values()), sorted(['0 {} a\n1 {} b\n'.format(first.pk, second.pk),
+                                                               '0 {} c\n'.format(third.pk)]))
+        run_script = [call[0][1] for call in write_remote_file.call_args_list if call[0][0].endswith('run.sh')][0]
+        self.assertIn('worktree add --quiet --detach "$WORKTREE" "$REVISION"', run_script)
+        commands = send_and_execute_file.call_args[0][0]
+        self.assertEqual(len(commands), 2)
+        self.assertIn('--array=0-1%5', commands[0])
+        self.assertIn('--array=0%5', commands[1])
+        self.assertEqual(list(jobs.values_list('array_name', 'array_task_id')),
+                         [('array_{}'.format(first.pk), 0), ('array_{}'.format(first.pk), 1),
+                          ('array_{}'.format(third.pk), 0)])
+
+    def test_packed_job_arrays(self):
+        self.connector.pack_size = 2
+        self.connector.pack_parallelism = 2
+        for revision in ['a', 'b', 'c', 'd', 'e']:
+            Job.objects.create(plugin_execution=self.pe, revision_hash=revision)
+        jobs = Job.objects.filter(plugin_execution=self.pe).order_by('pk')
+
+        with mock.patch.object(self.connector, 'write_remote_file') as write_remote_file, \
+                mock.patch.object(self.connector, 'send_and_execute_file') as send_and_execute_file:
+            self.connector.submit_jobs(self.pe, jobs)
+
+        # two arrays of at most two tasks with two jobs each
+        commands = send_and_execute_file.call_args[0][0]
+        self.assertEqual(len(commands), 2)
+        self.assertIn('--array=0-1%5', commands[0])
+        self.assertIn('--array=0%5', commands[1])
+        self.assertIn(' -n 2 ', commands[0])
+        self.assertEqual(list(jobs.values_list('array_task_id', flat=True)), [0, 0, 1, 1, 0])
+        array_script = [call[0][1] for call in write_remote_file.call_args_list if call[0][0].endswith('array.sh')][0]
+        self.assertIn('xargs -L 1 -P 2', array_script)
+
+    def test_packed_walltime(self):
+        self.connector.pack_size = 5
+        self.connector.pack_parallelism = 2
+        for revision in ['a', 'b', 'c', 'd', 'e']:
+            Job.objects.create(plugin_execution=self.pe, revision_hash=revision)
+
+        with mock.patch('smartshark.datacollection.hpcconnector.predict_job_resources',
+                        return_value={'time': 3600, 'memory': None, 'cores': None}), \
+                mock.patch.object(self.connector, 'write_remote_file'), \
+                mock.patch.object(self.connector, 'send_and_execute_file') as send_and_execute_file:
+            self.connector.submit_jobs(self.pe, Job.objects.filter(plugin_execution=self.pe).order_by('pk'))
+
+        # five jobs with two at the same time run as long as three jobs in a row
+        self.assertIn(' -t 0-03:00:00 ', send_and_execute_file.call_args[0][0][0])
+
+    def test_revision_batch_script(self):
+        Plugin.objects.filter(pk=self.meco.pk).update(revision_batch_size=2)
+        pe = PluginExecution.objects.get(pk=self.pe.pk)
+
+        def write_file(path, content, executable=False):
+            with open(path, 'w') as f:
+                f.write(content)
+            if executable:
+                os.chmod(path, 0o755)
+
+        with tempfile.TemporaryDirectory() as path:
+            self.connector.log_path = os.path.join(path, 'logs')
+            self.connector.spool_path = os.path.join(path, 'spool')
+            self.connector.project_path = os.path.join(path, 'projects')
+            self.connector.scratch_path = os.path.join(path, 'scratch')
+            for folder in ['spool', 'scratch', os.path.join('logs', str(pe.pk))]:
+                os.makedirs(os.path.join(path, folder))
+
+            repository = os.path.join(self.connector.project_path, 'testproject')
+            subprocess.run(['git', 'init', '--quiet', repository], check=True)
+            revisions = []
+            for name in ['first', 'second']:
+                subprocess.run(['git', '-C', repository, '-c', 'user.name=test', '-c', 'user.email=test@test', 'commit',
+                                '--quiet', '--allow-empty', '-m', name], check=True)
+                revisions.append(subprocess.run(['git', '-C', repository, 'rev-parse', 'HEAD'], check=True,
+                                                stdout=subprocess.PIPE, universal_newlines=True).stdout.strip())
+
+            # the plugin only processes the first revision of the file
+            plugin = os.path.join(path, 'plugin.sh')
+            write_file(plugin, '#!/bin/bash\necho start\nwhile read R; do echo "+++ revision $R"; '
+                               'echo -e "+++ revision $R\\nerror $R" >&2; done < $1\n'
+                               'echo "$(head -n 1 $1) 0" > $2\n', executable=True)
+            index_file = os.path.join(self.connector.log_path, str(pe.pk), 'array_1.txt')
+            write_file(index_file, '0 1 {}\n0 2 {}\n1 3 other\n'.format(*revisions))
+
+            with mock.patch.object(self.connector, 'write_remote_file', side_effect=write_file), \
+                    mock.patch.object(self.connector, '_generate_plugin_execution_command',
+                                      return_value=plugin + ' $revision_file $result_file'):
+                run_script, array_script = self.connector.create_job_scripts(pe)
+
+            # the task fails, because the second revision has no result
+            process = subprocess.run([array_script, index_file], env=dict(os.environ, SLURM_ARRAY_TASK_ID='0'))
+            self.assertEqual(process.returncode, 1)
+
+            self.connector.local_spool_path = self.connector.spool_path
+            records = sorted(self.connector.read_completion_records(10))
+            self.assertEqual([record.split()[:2] for _, record in records], [['1', '0'], ['2', '1']])
+
+            # the logs of the call are split into the logs of the jobs
+            log_path = os.path.join(self.connector.log_path, str(pe.pk))
+            for job_id, revision in [(1, revisions[0]), (2, revisions[1])]:
+                with open(os.path.join(log_path, '{}_out.txt'.format(job_id)), 'r') as f:
+                    self.assertEqual(f.read(), 'start\n+++ revision {}\n'.format(revision))
+                with open(os.path.join(log_path, '{}_err.txt'.format(job_id)), 'r') as f:
+                    self.assertEqual(f.read(), '+++ revision {0}\nerror {0}\n'.format(revision))
+            self.assertFalse(os.path.exists(os.path.join(log_path, 'array_1_0_out.txt')))
+            self.assertEqual(os.listdir(self.connector.scratch_path), [])
+
+    def test_dependency_option(self):
+        vcs_pe = PluginExecution.objects.create(plugin=self.vcs, project=self.project)
+        Job.objects.create(plugin_execution=vcs_pe, job_id=10)
+        upstream = PluginExecution.objects.create(plugin=self.meco, project=self.project, execution_type='rev')
+        for task_id, revision in [(0, 'a'), (1, 'b'), (2, 'e'), (2, 'f')]:
+            Job.objects.create(plugin_execution=upstream, revision_hash=revision, job_id=20, array_name='array_1',
+                               array_task_id=task_id)
+        Job.objects.create(plugin_execution=upstream, revision_hash='c', job_id=30, status='DONE')
+        Job.objects.create(plugin_execution=upstream, revision_hash='d', job_id=40)
+        # finished, but not reconciled yet
+        Job.objects.create(plugin_execution=upstream, revision_hash='g', job_id=50)
+        self.pe.dependencies.create(required_execution=vcs_pe)
+        self.pe.dependencies.create(required_execution=upstream, match_revision=True)
+        jobs = {revision: Job.objects.create(plugin_execution=self.pe, revision_hash=revision)
+                for revision in ['a', 'b', 'c', 'd', 'e', 'f', 'g']}
+
+        self.connector.max_array_size = 3
+        queued = ['10', '20_0', '20_1', '20_2', '40']
+
+        def submit():
+            with mock.patch.object(self.connector, 'execute_command', return_value=queued), \
+                    mock.patch.object(self.connector, 'write_remote_file'), \
+                    mock.patch.object(self.connector, 'send_and_execute_file') as send_and_execute_file:
+                self.connector.submit_jobs(self.pe, Job.objects.filter(plugin_execution=self.pe).order_by('pk'))
+            return {command.split()[1].strip('"'): command for command in send_and_execute_file.call_args[0][0]}
+
+        # tasks with the same revisions wait for each other, the other jobs share arrays which wait for all their
+        # required jobs, jobs no longer in the queue of slurm are not waited for
+        commands = submit()
+        self.assertEqual(len(commands), 3)
+        dependencies = [
+            ('a', '--dependency=afterok:10,aftercorr:20 --kill-on-invalid-dep=yes --array=0-1%5'),
+            # the jobs of a packed task do not fit into one task, they wait for the packed task
+            ('e', '--dependency=afterok:10:20_2:40 --kill-on-invalid-dep=yes --array=0-2%5'),
+            ('c', '--dependency=afterok:10 --kill-on-invalid-dep=yes --array=0-1%5'),
+        ]
+        for revision, dependency in dependencies:
+            self.assertIn(dependency, commands['array_{}'.format(jobs[revision].pk)])
+
+        # arrays wait for at most max_array_dependencies jobs
+        Job.objects.filter(plugin_execution=self.pe).update(array_name=None, array_task_id=None)
+        self.connector.max_array_dependencies = 1
+        commands = submit()
+        self.assertEqual(len(commands), 4)
+        self.assertIn('--dependency=afterok:10:20_2 --kill-on-invalid-dep=yes --array=0-1%5',
+                      commands['array_{}'.format(jobs['e'].pk)])
+        self.assertIn('--dependency=afterok:10:40 --kill-on-invalid-dep=yes --array=0%5',
+                      commands['array_{}'.format(jobs['d'].pk)])
+
+        self.assertEqual(self.connector.get_dependency_option(self.connector._get_required_slurm_jobs(vcs_pe, [])[0]),
+                         '')
+
+    def test_array_task_states(self):
+        jobs = [Job(id=1, plugin_execution=self.pe)] + \
+               [Job(id=i + 2, plugin_execution=self.pe, array_name='array_2', array_task_id=i) for i in range(3)]
+        sacct = [['JobName State', '1 COMPLETED'],
+                 ['array_2|4567_0|COMPLETED', 'array_2|4567_0.batch|COMPLETED', 'array_2|4567_1|CANCELLED by 42',
+                  'array_2|4567_[2-3%5]|PENDING']]
+
+        with mock.patch.object(self.connector, 'execute_command', side_effect=sacct):
+            self.assertEqual(self.connector.get_job_stati(jobs), ['DONE', 'DONE', 'EXIT', 'WAIT'])
+
+    def test_store_slurm_job_ids(self):
+        single = Job.objects.create(plugin_execution=self.pe, revision_hash='a')
+        task = Job.objects.create(plugin_execution=self.pe, revision_hash='b', array_name='array_7', array_task_id=0)
+        # left over from an earlier submission of a larger array with the same name
+        left_over = Job.objects.create(plugin_execution=self.pe, revision_hash='c', array_name='array_7',
+                                       array_task_id=1)
+
+        self.connector.store_slurm_job_ids(
+            ['{} 4567\r\n'.format(single.pk), 'array_7 4568;cluster\r\n', 'sbatch: error'], {'array_7': [task.pk]})
+
+        single.refresh_from_db()
+        task.refresh_from_db()
+        left_over.refresh_from_db()
+        self.assertEqual((single.job_id, task.job_id), (4567, 4568))
+        self.assertEqual((left_over.job_id, left_over.submitted), (None, False))
+
+    def test_poll_by_job_id(self):
+        cache.clear()
+        jobs = [Job(id=1, plugin_execution=self.pe, job_id=4567),
+                Job(id=2, plugin_execution=self.pe, job_id=4568, array_name='array_2', array_task_id=0)]
+
+        with mock.patch.object(self.connector, 'execute_command', return_value=['4567|RUNNING', '4568_0|COMPLETED']) as sacct:
+            self.assertEqual(self.connector.get_job_stati(jobs), ['WAIT', 'DONE'])
+            self.assertIn('--jobs 4567,4568', sacct.call_args[0][0])
+
+            # polls within the poll interval are answered from the cache
+            self.assertEqual(self.connector.get_job_stati(jobs), ['WAIT', 'DONE'])
+            self.assertEqual(sacct.call_count, 1)
+
+        # later polls only return the changed jobs, the others keep their cached state
+        polled = cache.get('slurm_job_states_{}'.format(self.pe.pk))
+        polled['polled_at'] -= datetime.timedelta(hours=1)
+        cache.set('slurm_job_states_{}'.format(self.pe.pk), polled)
+        with mock.patch.object(self.connector, 'execute_command', return_value=['4567|FAILED']):
+            self.assertEqual(self.connector.get_job_stati(jobs), ['EXIT', 'DONE'])
+
+    def test_poll_in_batches(self):
+        cache.clear()
+        for i in range(3):
+            Job.objects.create(plugin_execution=self.pe, job_id=4567 + i, submitted=True)
+
+        # the states of all batches are written to the cache once
+        with mock.patch.object(self.connector, 'execute_command', side_effect=[['4567|RUNNING'], ['4568|COMPLETED'],
+                                                                               ['4569|FAILED']]), \
+                mock.patch.object(cache, 'set', wraps=cache.set) as cache_set, \
+                self.settings(JOB_STATE_BATCH_SIZE=1):
+            self.assertEqual(reconcile_plugin_execution(self.connector, self.pe), 2)
+
+        self.assertEqual(cache_set.call_count, 1)
+        polled = cache.get('slurm_job_states_{}'.format(self.pe.pk))
+        self.assertEqual(polled['states'], {'4567': 'RUNNING', '4568': 'COMPLETED', '4569': 'FAILED'})
+
+
+class TestReconcileJobs(ExecutionTestCase):
+
+    def test_reconcile_plugin_execution(self):
+        pe = PluginExecution.objects.create(plugin=self.meco, project=self.project, execution_type='rev')
+        Job.objects.bulk_create([Job(plugin_execution=pe, revision_hash=str(i), submitted=True) for i in range(5)])
+        Job.objects.create(plugin_execution=pe, revision_hash='done', status='DONE', submitted=True)
+        Job.objects.create(plugin_execution=pe, revision_hash='9')
+
+        interface = mock.MagicMock()
+        interface.get_job_stati.side_effect = lambda jobs: ['DONE' if int(job.revision_hash) % 2 else 'WAIT' for job in jobs]
+        with self.settings(JOB_STATE_BATCH_SIZE=2):
+            self.assertEqual(reconcile_plugin_execution(interface, pe), 2)
+
+        self.assertEqual(interface.get_job_stati.call_count, 3)
+        self.assertEqual(Job.objects.filter(plugin_execution=pe, status='DONE').count(), 3)
+        pe.refresh_from_db()
+        self.assertIsNotNone(pe.reconciled_at)
+
+    def test_periodic_command(self):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        command = ReconcileJobsCommand(stdout=stdout, stderr=stderr)
+
+        # a failed run does not stop the command, the next run follows after the interval
+        with mock.patch.object(PluginManagementInterface, 'find_correct_plugin_manager'), \
+                mock.patch.object(command, 'run_once', side_effect=[ValueError('broken'), KeyboardInterrupt]), \
+                mock.patch('smartshark.utils.periodiccommand.time.sleep') as sleep:
+            call_command(command, interval=5)
+
+        sleep.assert_called_once_with(5)
+        self.assertEqual(stderr.getvalue(), 'reconciliation failed: broken\n')
+        self.assertEqual(stdout.getvalue(), 'stopping reconciliation\n')
+
+
+class TestJobSubmission(ExecutionTestCase):
+
+    def test_queue_capacity(self):
+        connector = HPCConnector()
+        connector.max_queued_jobs = 10
+        pe = PluginExecution.objects.create(plugin=self.vcs, project=self.project)
+        jobs = [Job.objects.create(plugin_execution=pe) for i in range(3)]
+
+        def execute(commands, blocking):
+            return ['{} {}'.format(command.split('"')[1].split()[0], 100 + i) for i, command in enumerate(commands)]
+
+        with mock.patch.object(connector, 'execute_command', return_value=['8']), \
+                mock.patch.object(connector, 'write_remote_file'), \
+                mock.patch.object(connector, 'send_and_execute_file', side_effect=execute):
+            self.assertEqual(submit_pending_jobs(connector, pe), 2)
+
+        self.assertEqual(list(Job.objects.filter(submitted=True).values_list('pk', flat=True)), [jobs[0].pk, jobs[1].pk])
+
+    def test_submit_after_required_jobs(self):
+        vcs_pe = PluginExecution.objects.create(plugin=self.vcs, project=self.project)
+        required = Job.objects.create(plugin_execution=vcs_pe)
+        pe = PluginExecution.objects.create(plugin=self.meco, project=self.project, execution_type='rev')
+        pe.dependencies.create(required_execution=vcs_pe)
+        Job.objects.create(plugin_execution=pe, revision_hash='a')
+
+        interface = mock.Mock()
+        interface.get_submission_capacity.return_value = None
+        interface.submit_jobs.side_effect = lambda plugin_execution, jobs: len(jobs)
+        self.assertEqual(submit_pending_jobs(interface, pe), 0)
+
+        required.submitted = True
+        required.save()
+        self.assertEqual(submit_pending_jobs(interface, pe), 1)
+
+
+    def test_failed_submission(self):
+        pe = PluginExecution.objects.create(plugin=self.vcs, project=self.project)
+        jobs = [Job.objects.create(plugin_execution=pe) for i in range(2)]
+
+        def submit_jobs(plugin_execution, submitted_jobs):
+            # the first job is accepted by the backend before the connection breaks
+            Job.objects.filter(pk=jobs[0].pk).update(submitted=True)
+            raise OSError('connection lost')
+
+        interface = mock.Mock()
+        interface.get_submission_capacity.return_value = None
+        interface.submit_jobs.side_effect = submit_jobs
+        for attempt in range(settings.JOB_SUBMISSION_MAX_ATTEMPTS):
+            with self.assertRaises(OSError):
+                submit_pending_jobs(interface, pe)
+
+        # the accepted job stays submitted, the other one is given up after the last attempt
+        self.assertEqual(list(Job.objects.filter(pk__in=[job.pk for job in jobs]).order_by('pk')
+                              .values_list('submitted', 'submission_attempts', 'status')),
+                         [(True, 0, 'WAIT'), (False, settings.JOB_SUBMISSION_MAX_ATTEMPTS, 'EXIT')])
+        self.assertEqual(submit_pending_jobs(interface, pe), 0)
+        self.assertEqual(interface.submit_jobs.call_count, settings.JOB_SUBMISSION_MAX_ATTEMPTS)
+
+        # a plugin execution whose jobs are submitted by another process is skipped
+        Job.objects.create(plugin_execution=pe)
+        PluginExecution.objects.filter(pk=pe.pk).update(submission_locked_at=timezone.now())
+        self.assertEqual(submit_pending_jobs(interface, pe), 0)
+        self.assertEqual(interface.submit_jobs.call_count, settings.JOB_SUBMISSION_MAX_ATTEMPTS)
+
+    def test_restart_job(self):
+        pe = PluginExecution.objects.create(plugin=self.meco, project=self.project, execution_type='rev',
+                                            logs_archived=True)
+        now = datetime.datetime(2018, 1, 1, tzinfo=datetime.timezone.utc)
+        Job.objects.create(plugin_execution=pe, revision_hash='a', submitted=True, submission_attempts=1, job_id=7,
+                           array_name='array',
+                           array_task_id=1, exit_code=137, started_at=now, finished_at=now, max_rss=2048, cpu_time=1.0,
+                           log_indexed=True, parse_errors_extracted=True)
+
+        with mock.patch('smartshark.admin.JobSubmissionThread') as thread:
+            JobAdmin(Job, AdminSite()).restart_job(mock.Mock(), Job.objects.filter(plugin_execution=pe))
+        restarted_pe = thread.call_args[0][1][0]
+        self.assertFalse(restarted_pe.logs_archived)
+        restarted = Job.objects.get(plugin_execution=restarted_pe)
+        self.assertEqual((restarted.revision_hash, restarted.status), ('a', 'WAIT'))
+        self.assertEqual([restarted.job_id, restarted.array_name, restarted.array_task_id, restarted.exit_code,
+                          restarted.started_at, restarted.finished_at, restarted.max_rss, restarted.cpu_time,
+                          restarted.log_indexed],
+                         [None] * 9)
+        self.assertEqual(restarted.submission_attempts, 0)
+        self.assertFalse(restarted.parse_errors_extracted)
+
+        interface = mock.Mock()
+        interface.get_submission_capacity.return_value = None
+        interface.submit_jobs.side_effect = \
+            lambda plugin_execution, jobs: Job.objects.filter(pk__in=[job.pk for job in jobs]).update(submitted=True)
+        self.assertEqual(submit_pending_jobs(interface, restarted_pe), 1)
+        restarted.refresh_from_db()
+        self.assertTrue(restarted.submitted)
+
+
+class TestJobResources(ExecutionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.pe = PluginExecution.objects.create(plugin=self.meco, project=self.project, execution_type='rev')
+        started_at = datetime.datetime(2018, 1, 1, tzinfo=datetime.timezone.utc)
+        Job.objects.bulk_create([
+            Job(plugin_execution=self.pe, revision_hash=str(i), status='DONE', started_at=started_at,
+                finished_at=started_at + datetime.timedelta(seconds=100 * (i + 1)), max_rss=1000 * (i + 1),
+                cpu_time=150 * (i + 1))
+            for i in range(20)
+        ])
+
+    def test_predict(self):
+        with self.settings(RESOURCE_MARGIN=2, RESOURCE_MIN_TIME=60):
+            self.assertEqual(predict_job_resources(self.meco), {'time': 3800, 'memory': 38000, 'cores': 2})
+            # every failed attempt doubles walltime and memory
+            self.assertEqual(predict_job_resources(self.meco, attempts=1)['time'], 7600)
+            self.assertEqual(predict_job_resources(self.meco, attempts=5)['memory'], 38000 * 8)
+
+        with self.settings(RESOURCE_HISTORY_MIN_JOBS=100):
+            self.assertIsNone(predict_job_resources(self.meco))
+
+    def test_previous_attempts(self):
+        retry = PluginExecution.objects.create(plugin=self.meco, project=self.project, execution_type='error')
+        Job.objects.create(plugin_execution=self.pe, revision_hash='a', status='EXIT')
+        Job.objects.create(plugin_execution=retry, revision_hash='a', status='EXIT')
+        Job.objects.create(plugin_execution=retry, revision_hash='b', status='EXIT')
+
+        new = PluginExecution.objects.create(plugin=self.meco, project=self.project, execution_type='error')
+        self.assertEqual(get_previous_attempts(new, ['a', 'b', 'c']), 2)
+        self.assertEqual(get_previous_attempts(new, ['c']), 0)
+
+    def test_collect_accounting(self):
+        connector = HPCConnector()
+        single = Job.objects.create(plugin_execution=self.pe, revision_hash='x', status='EXIT', submitted=True,
+                                    job_id=100)
+        packed = [Job.objects.create(plugin_execution=self.pe, revision_hash=revision, status='DONE', submitted=True,
+                                     job_id=200, array_name='array_1', array_task_id=0, max_rss=5)
+                  for revision in ['y', 'z']]
+        sacct = ['100|2018-01-01T10:00:00|2018-01-01T10:10:00|01:00:30.500|',
+                 '100.batch|2018-01-01T10:00:00|2018-01-01T10:10:00|01:00:30.500|2G',
+                 '200_0|2018-01-01T10:00:00|2018-01-01T11:00:00|1-00:00:00|',
+                 '200_0.batch|2018-01-01T10:00:00|2018-01-01T11:00:00|1-00:00:00|512M']
+
+        with mock.patch.object(connector, 'execute_command', return_value=sacct):
+            self.assertEqual(collect_job_accounting(connector), 3)
+
+        single.refresh_from_db()
+        self.assertEqual((single.cpu_time, single.max_rss), (3630.5, 2 * 1024 ** 2))
+        self.assertEqual((single.finished_at - single.started_at).total_seconds(), 600)
+        for job in packed:
+            job.refresh_from_db()
+            self.assertEqual((job.cpu_time, job.max_rss), (43200, 5))
+
+
+class TestJobCompletion(ExecutionTestCase):
+
+    def test_store_completion_records(self):
+        pe = PluginExecution.objects.create(plugin=self.meco, project=self.project, execution_type='rev')
+        done = Job.objects.create(plugin_execution=pe, revision_hash='a')
+        failed = Job.objects.create(plugin_execution=pe, revision_hash='b')
+
+        job_ids = store_completion_records(['{} 0 1514764800 1514768400 2048'.format(done.pk),
+                                            '{} 137 1514764800 1514764860 4096'.format(failed.pk),
+                                            'garbage'])
+
+        self.assertEqual(sorted(job_ids), [done.pk, failed.pk])
+        done.refresh_from_db()
+        failed.refresh_from_db()
+        self.assertEqual((done.status, done.exit_code, done.max_rss), ('DONE', 0, 2048))
+        self.assertEqual((failed.status, failed.exit_code, failed.max_rss), ('EXIT', 137, 4096))
+        self.assertEqual((done.finished_at - done.started_at).total_seconds(), 3600)
+
+    def test_quarantine_unparsable_records(self):
+        pe = PluginExecution.objects.create(plugin=self.meco, project=self.project, execution_type='rev')
+        done = Job.objects.create(plugin_execution=pe, revision_hash='a')
+        connector = HPCConnector()
+
+        with tempfile.TemporaryDirectory() as path:
+            connector.local_spool_path = path
+            for name, content in [('1', 'garbage'), (str(done.pk), '{} 0 1514764800 1514768400 2048'.format(done.pk))]:
+                with open(os.path.join(path, name + '.done'), 'w') as f:
+                    f.write(content + '\n')
+
+            # the unparsable record sorts first and would be read again in every batch
+            with self.settings(JOB_COMPLETION_BATCH_SIZE=1):
+                IngestJobCompletionsCommand(stdout=io.StringIO(), stderr=io.StringIO()).run_once(connector)
+
+            self.assertEqual(os.listdir(path), ['failed'])
+            self.assertEqual(os.listdir(os.path.join(path, 'failed')), ['1.done'])
+
+        done.refresh_from_db()
+        self.assertEqual(done.status, 'DONE')
+
+
+class TestPluginInstallCache(ExecutionTestCase):
+
+    def test_skip_installed_plugin(self):
+        connector = HPCConnector()
+        install_hash = connector._get_install_hash('archivehash', self.meco)
+
+        with mock.patch.object(connector, '_get_file_hash', return_value='archivehash'), \
+                mock.patch.object(connector, 'execute_command', return_value=[install_hash + '\n']), \
+                mock.patch.object(connector, 'copy_plugin') as copy_plugin:
+            self.assertEqual(connector.install_plugins([self.meco]), [(True, None)])
+            copy_plugin.assert_not_called()
+
+        with mock.patch.object(connector, '_get_file_hash', return_value='changedhash'), \
+                mock.patch.object(connector, 'execute_command', return_value=[install_hash + '\n']), \
+                mock.patch.object(connector, 'copy_plugin') as copy_plugin, \
+                mock.patch.object(connector, 'execute_install'), \
+                mock.patch.object(connector, 'write_remote_file') as write_remote_file:
+            self.assertEqual(connector.install_plugins([self.meco]), [(True, None)])
+            copy_plugin.assert_called_once_with(self.meco, 'changedhash')
+            self.assertEqual(write_remote_file.call_args[0][1], connector._get_install_hash('changedhash', self.meco))
+
+
+class TestRepositoryTransfer(ExecutionTestCase):
+
+    def test_extract_local_repository(self):
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode='w:gz') as tar_gz:
+            content = b'readme'
+            info = tarfile.TarInfo('testproject/README')
+            info.size = len(content)
+            tar_gz.addfile(info, io.BytesIO(content))
+
+        connector = LocalQueueConnector()
+        connector._execute_command = mock.Mock()
+        pe = PluginExecution.objects.create(plugin=self.meco, project=self.project, execution_type='rev',
+                                            repository_url='https://github.com/test/test')
+
+        with tempfile.TemporaryDirectory() as project_path:
+            connector.project_path = project_path
+            connector.output_path = project_path
+            repository_file = io.BytesIO(archive.getvalue())
+            repository_file.md5 = 'hash1'
+
+            with mock.patch.object(connector, '_get_repository_file', return_value=repository_file) as get_file:
+                connector.prepare_execution(self.project, [pe])
+                self.assertTrue(os.path.isfile(os.path.join(project_path, 'testproject', 'README')))
+
+                # unchanged archives are not extracted again
+                get_file.return_value = io.BytesIO(b'')
+                get_file.return_value.md5 = 'hash1'
+                connector.prepare_execution(self.project, [pe])
+
+    def test_refresh_local_clone(self):
+        with tempfile.TemporaryDirectory() as path:
+            origin = os.path.join(path, 'origin')
+            project_folder = os.path.join(path, 'projects', 'testproject')
+
+            def commit(name):
+                with open(os.path.join(origin, name), 'w') as f:
+                    f.write(name)
+                subprocess.run(['git', '-C', origin, 'add', name], check=True)
+                subprocess.run(['git', '-C', origin, '-c', 'user.name=test', '-c', 'user.email=test@test', 'commit',
+                                '--quiet', '-m', name], check=True)
+
+            subprocess.run(['git', 'init', '--quiet', origin], check=True)
+            commit('first')
+            refresh_clone(origin, project_folder)
+            self.assertTrue(os.path.isfile(os.path.join(project_folder, 'first')))
+
+            # the clone is updated in place, files created by plugins are removed
+            commit('second')
+            with open(os.path.join(project_folder, 'plugin_output'), 'w') as f:
+                f.write('output')
+            refresh_clone(origin, project_folder)
+            self.assertTrue(os.path.isfile(os.path.join(project_folder, 'second')))
+            self.assertFalse(os.path.exists(os.path.join(project_folder, 'plugin_output')))
+
+            # a folder which is no clone is cloned again, the repository around it is not reset
+            subprocess.run(['git', 'init', '--quiet', path], check=True)
+            with open(os.path.join(path, 'untracked'), 'w') as f:
+                f.write('untracked')
+            shutil.rmtree(os.path.join(project_folder, '.git'))
+            refresh_clone(origin, project_folder)
+            self.assertTrue(os.path.isfile(os.path.join(path, 'untracked')))
+            self.assertTrue(os.path.isdir(os.path.join(project_folder, '.git')))
+            self.assertTrue(os.path.isfile(os.path.join(project_folder, 'second')))
+
+    def test_job_worktree(self):
+        peon = PeonCommand()
+
+        with tempfile.TemporaryDirectory() as path:
+            repository = os.path.join(path, 'testproject')
+            peon.scratch_path = os.path.join(path, 'scratch')
+
+            subprocess.run(['git', 'init', '--quiet', repository], check=True)
+            revisions = []
+            for name in ['first', 'second']:
+                with open(os.path.join(repository, name), 'w') as f:
+                    f.write(name)
+                subprocess.run(['git', '-C', repository, 'add', name], check=True)
+                subprocess.run(['git', '-C', repository, '-c', 'user.name=test', '-c', 'user.email=test@test', 'commit',
+                                '--quiet', '-m', name], check=True)
+                revisions.append(subprocess.run(['git', '-C', repository, 'rev-parse', 'HEAD'], check=True,
+                                                stdout=subprocess.PIPE, universal_newlines=True).stdout.strip())
+
+            # both revisions are checked out at the same time without touching the project folder
+            with peon.worktree(repository, revisions[0]) as first, peon.worktree(repository, revisions[1]) as second:
+                self.assertFalse(os.path.exists(os.path.join(first, 'second')))
+                self.assertTrue(os.path.isfile(os.path.join(second, 'second')))
+            self.assertFalse(os.path.exists(first))
+            self.assertFalse(os.path.exists(second))
+            self.assertEqual(os.listdir(peon.scratch_path), [])
+
+            with peon.worktree(None, revisions[0]) as project:
+                self.assertIsNone(project)
+
+    def test_revision_batch(self):
+        pe = PluginExecution.objects.create(plugin=self.meco, project=self.project, execution_type='rev')
+        jobs = [Job.objects.create(plugin_execution=pe, revision_hash=revision) for revision in ['a', 'b']]
+
+        with tempfile.TemporaryDirectory() as path:
+            plugin = os.path.join(path, 'plugin.sh')
+            with open(plugin, 'w') as f:
+                f.write('#!/bin/bash\nwhile read REVISION; do echo "$REVISION 3" >> $2; done < $1\n')
+            os.chmod(plugin, 0o755)
+
+            with open(os.path.join(path, 'out.txt'), 'w') as out, open(os.path.join(path, 'err.txt'), 'w') as err:
+                exit_code, max_rss, cpu_time, results = PeonCommand().execute(
+                    {'shell': plugin + ' $revision_file $result_file'}, jobs, out, err)
+
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(results, {'a': 3, 'b': 3})
+
+
+class TestJobLog(ExecutionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        pe = PluginExecution.objects.create(plugin=self.meco, project=self.project, execution_type='rev')
+        self.job = Job.objects.create(plugin_execution=pe, revision_hash='a', status='DONE')
+
+    def test_ranged_reads(self):
+        with tempfile.TemporaryDirectory() as path, self.settings(LOG_CACHE_PATH=os.path.join(path, 'cache')):
+            connector = HPCConnector()
+            connector.local_log_path = path
+            log_path = os.path.join(path, str(self.job.plugin_execution.pk))
+            os.makedirs(log_path)
+            with open(os.path.join(log_path, '{}_out.txt'.format(self.job.pk)), 'w') as f:
+                f.write(''.join('line {}\n'.format(i) for i in range(100000)))
+
+            self.assertEqual(connector.tail_log(self.job, 'out', 2), ['line 99998', 'line 99999'])
+            self.assertEqual(connector.read_log_lines(self.job, 'out', 10, 2), (['line 10', 'line 11'], True))
+            self.assertEqual(connector.read_log_lines(self.job, 'out', 99999, 2), (['line 99999'], False))
+            self.assertEqual(connector.read_log(self.job, 'out', 7, 6), b'line 1')
+            self.assertEqual(connector.get_error_log(self.job), ['File Not Found'])
+
+            # the log of the finished job is read from the cache afterwards
+            with mock.patch.object(HPCConnector, 'cache_logs', True):
+                self.assertEqual(connector.tail_log(self.job, 'out', 1), ['line 99999'])
+                shutil.rmtree(log_path)
+                self.assertEqual(connector.tail_log(self.job, 'out', 1), ['line 99999'])
+
+    def test_search_logs(self):
+        other = Job.objects.create(plugin_execution=self.job.plugin_execution, revision_hash='b', status='EXIT')
+
+        with tempfile.TemporaryDirectory() as path:
+            connector = HPCConnector()
+            connector.local_log_path = path
+            log_path = os.path.join(path, str(self.job.plugin_execution.pk))
+            os.makedirs(log_path)
+            with open(os.path.join(log_path, '{}_out.txt'.format(self.job.pk)), 'w') as f:
+                f.write('start\nParser Error in file a.java\nLexer Error in file b.java\n')
+            with open(os.path.join(log_path, '{}_out.txt'.format(other.pk)), 'w') as f:
+                f.write('start\nLexer Error in file c.java\nParser Error in file d.java\n')
+
+            patterns = ['Parser Error in file', 'Lexer Error in file']
+            expected = {self.job.pk: [(2, 'Parser Error in file a.java'), (3, 'Lexer Error in file b.java')],
+                        other.pk: [(2, 'Lexer Error in file c.java'), (3, 'Parser Error in file d.java')]}
+            self.assertEqual(connector.search_logs(self.job.plugin_execution, 'out', patterns), expected)
+            self.assertEqual(connector.search_job_logs([other], 'out', patterns, max_count=1),
+                             {other.pk: expected[other.pk][:1]})
+            self.assertEqual(connector.search_logs(self.job.plugin_execution, 'err', patterns), {})
+
+            # the default reads every log on its own
+            self.assertEqual(PluginManagementInterface.search_logs(connector, self.job.plugin_execution, 'out', patterns),
+                             expected)
+
+    def test_split_batch_log(self):
+        with tempfile.TemporaryDirectory() as path:
+            batch_log = os.path.join(path, 'batch_out.txt')
+            with open(batch_log, 'w') as f:
+                f.write('start\n+++ revision a\nParser Error in file a.java\n+++ revision b\ndone b\n'
+                        '+++ revision c\nunknown\n')
+            job_paths = {revision: os.path.join(path, '{}_out.txt'.format(revision)) for revision in ['a', 'b']}
+            # a link to the log of an earlier batch is replaced
+            os.symlink(batch_log, job_paths['b'])
+
+            split_batch_log(batch_log, job_paths)
+            self.assertFalse(os.path.islink(job_paths['b']))
+            with open(job_paths['a'], 'r') as f:
+                self.assertEqual(f.read(),
+                                 'start\n+++ revision a\nParser Error in file a.java\n+++ revision c\nunknown\n')
+            with open(job_paths['b'], 'r') as f:
+                self.assertEqual(f.read(), 'start\n+++ revision b\ndone b\n+++ revision c\nunknown\n')
+
+    def test_archived_logs(self):
+        other = Job.objects.create(plugin_execution=self.job.plugin_execution, revision_hash='b', status='DONE')
+
+        with tempfile.TemporaryDirectory() as path, self.settings(LOG_CACHE_PATH=os.path.join(path, 'cache')):
+            connector = HPCConnector()
+            connector.local_log_path = path
+            log_path = os.path.join(path, str(self.job.plugin_execution.pk))
+            os.makedirs(log_path)
+            with open(os.path.join(log_path, '{}_out.txt'.format(self.job.pk)), 'w') as f:
+                f.write('start\nParser Error in file a.java\n')
+            os.symlink(os.path.join(log_path, '{}_out.txt'.format(self.job.pk)),
+                       os.path.join(log_path, '{}_out.txt'.format(other.pk)))
+
+            subprocess.run(get_archive_command(log_path, sys.executable), check=True)
+            shutil.rmtree(log_path)
+            self.job.plugin_execution.logs_archived = True
+
+            self.assertEqual(connector.tail_log(other, 'out', 1), ['Parser Error in file a.java'])
+            self.assertEqual(connector.get_error_log(self.job), ['File Not Found'])
+
+            # the log is inflated once, later reads come from the cache
+            with mock.patch('smartshark.utils.joblog.zipfile.ZipFile') as zip_file:
+                self.assertEqual(connector.read_log_lines(other, 'out'),
+                                 (['start', 'Parser Error in file a.java'], False))
+                zip_file.assert_not_called()
+            self.assertEqual(connector.search_logs(self.job.plugin_execution, 'out', ['Parser Error'], jobs=[other]),
+                             {other.pk: [(2, 'Parser Error in file a.java')]})
+
+            # on the HPC system the archive is searched where it is stored
+            connector.local_log_path = ''
+            connector.log_path = path
+            execute_command = lambda command, ignore_errors: subprocess.run(
+                command, shell=True, stdout=subprocess.PIPE, universal_newlines=True).stdout.splitlines(True)
+            with mock.patch.object(connector, 'execute_command', side_effect=execute_command):
+                self.assertEqual(connector.search_logs(self.job.plugin_execution, 'out', ['in file a', '"\'$x'],
+                                                       max_count=1),
+                                 {self.job.pk: [(2, 'Parser Error in file a.java')],
+                                  other.pk: [(2, 'Parser Error in file a.java')]})
+
+    def test_cache_eviction(self):
+        other = Job.objects.create(plugin_execution=self.job.plugin_execution, revision_hash='b', status='DONE')
+
+        with tempfile.TemporaryDirectory() as path:
+            log_cache = LogCache(path, max_size=15, max_file_size=10)
+            log_cache.put(self.job, 'out', io.BytesIO(b'12345678'))
+            os.utime(log_cache.get(self.job, 'out'), (0, 0))
+            self.assertIsNone(log_cache.put(self.job, 'err', io.BytesIO(b'12345678901')))
+            log_cache.put(other, 'out', io.BytesIO(b'12345678'))
+
+            # the least recently read log is removed
+            self.assertIsNone(log_cache.get(self.job, 'out'))
+            self.assertIsNotNone(log_cache.get(other, 'out'))
+
+
+class TestLogIndex(ExecutionTestCase):
+
+    def test_index_job_logs(self):
+        pe = PluginExecution.objects.create(plugin=self.meco, project=self.project, execution_type='rev')
+        done = Job.objects.create(plugin_execution=pe, revision_hash='a', status='DONE')
+        failed = Job.objects.create(plugin_execution=pe, revision_hash='b', status='EXIT')
+        waiting = Job.objects.create(plugin_execution=pe, revision_hash='c')
+
+        with tempfile.TemporaryDirectory() as path, \
+                self.settings(LOG_INDEX_PATH=os.path.join(path, 'index.sqlite3'), LOG_INDEX_MAX_FILE_SIZE=100):
+            connector = HPCConnector()
+            connector.local_log_path = path
+            log_path = os.path.join(path, str(pe.pk))
+            os.makedirs(log_path)
+            for job, log in [(done, 'Parser Error in file a.java\nparser error in file b.java\n'),
+                             (failed, 'java.lang.OutOfMemoryError: Java heap space\n'),
+                             (waiting, 'Parser Error in file c.java\n')]:
+                with open(os.path.join(log_path, '{}_out.txt'.format(job.pk)), 'w') as f:
+                    f.write(log)
+            with open(os.path.join(log_path, '{}_err.txt'.format(failed.pk)), 'w') as f:
+                f.write('x' * 101)
+
+            log_index = LogIndex()
+            IndexJobLogsCommand(stdout=io.StringIO()).index(connector, log_index)
+
+            done.refresh_from_db()
+            failed.refresh_from_db()
+            waiting.refresh_from_db()
+            self.assertEqual((done.log_indexed, failed.log_indexed, waiting.log_indexed), (True, False, None))
+
+            self.assertEqual(log_index.search(['Parser Error in file'], 'out', plugin_execution=pe),
+                             {done.pk: [(1, 'Parser Error in file a.java')]})
+            # patterns match inside words and case sensitive, also those shorter than a trigram
+            self.assertEqual(log_index.search(['r Error in fi'], status='DONE'),
+                             {done.pk: [(1, 'Parser Error in file a.java')]})
+            self.assertEqual(log_index.search(['b.'], 'out'), {done.pk: [(2, 'parser error in file b.java')]})
+            self.assertEqual(log_index.search(['rror in fi'], status='EXIT'), {})
+            self.assertEqual(log_index.search(['PARSER']), {})
+
+            # jobs, status and max_count restrict the query, large job lists are searched in chunks
+            patterns = ['Parser Error', 'parser error']
+            with mock.patch('smartshark.utils.logindex.JOB_ID_CHUNK_SIZE', 1):
+                self.assertEqual(log_index.search(patterns, jobs=[failed, done], max_count=1),
+                                 {done.pk: [(1, 'Parser Error in file a.java')]})
+            self.assertEqual(log_index.search(patterns, jobs=[done], status='EXIT'), {})
+            self.assertEqual(log_index.search(patterns, jobs=[]), {})
+            self.assertEqual(len(log_index.search(patterns, status='DONE', max_count=2)[done.pk]), 2)
+
+            # the out log of the job with a too large err log is not indexed either
+            self.assertEqual(log_index.connection.execute('SELECT COUNT(*) FROM log_lines WHERE job_id = ?',
+                                                          (failed.pk,)).fetchone(), (0,))
+            log_index.close()
+
+            # the log of the job with a too large log is read, the others come from the index
+            os.remove(os.path.join(log_path, '{}_out.txt'.format(done.pk)))
+            self.assertEqual(connector.search_job_logs([done, failed], 'out', ['Parser Error', 'heap space']),
+                             {done.pk: [(1, 'Parser Error in file a.java')],
+                              failed.pk: [(1, 'java.lang.OutOfMemoryError: Java heap space')]})
+
+
+class TestCoastVerification(ExecutionTestCase):
+
+    def test_check_parse_errors(self):
+        Plugin.objects.bulk_create([Plugin(name='coastSHARK', author='test', version='1.0.0', description='',
+                                           plugin_type='rev', archive='coast.tar')])
+        pe = PluginExecution.objects.create(plugin=Plugin.objects.get(name='coastSHARK'), project=self.project,
+                                            execution_type='rev')
+        jobs = [Job.objects.create(plugin_execution=pe, revision_hash=revision, status='EXIT') for revision in 'ab']
+        verifications = [
+            CommitVerification.objects.create(project=self.project, vcs_system='git', commit=commit, vcsSHARK=True,
+                                              mecoSHARK=True, coastSHARK=False, text=text)
+            for commit, text in [('a', '+++ coastSHARK +++\n-src/A.java\n-src/B.java\n-src/D.java\n+++ mecoSHARK +++\n'
+                                       '-src/C.java\n'),
+                                 ('b', '+++ coastSHARK +++\n-src/A.java\n-src/C.java\n'),
+                                 ('c', '+++ coastSHARK +++\n-src/A.java\n')]
+        ]
+
+        with tempfile.TemporaryDirectory() as path:
+            connector = HPCConnector()
+            connector.local_log_path = path
+            os.makedirs(os.path.join(path, str(pe.pk)))
+            for job in jobs:
+                with open(os.path.join(path, str(pe.pk), '{}_out.txt'.format(job.pk)), 'w') as f:
+                    # the forms in which coastSHARK logs parse errors, the files are matched anywhere in the line
+                    f.write('INFO parsing src/B.java\n'
+                            'Parser Error in file src/A.java: line 1\n'
+                            'Lexer Error in file: /tmp/checkout/src/B.java line 3:4 token recognition error at: \'#\'\n'
+                            'Parser Error in file (unknown), last file was src/D.java\n')
+
+            results = check_parse_errors(connector, CommitVerification.objects.filter(project=self.project))
+
+        self.assertEqual(results[verifications[0]], (
+            ['src/A.java (Parser Error in file src/A.java: line 1)',
+             'src/B.java (Lexer Error in file: /tmp/checkout/src/B.java line 3:4 token recognition error at: \'#\')',
+             'src/D.java (Parser Error in file (unknown), last file was src/D.java)'], True))
+        self.assertEqual(results[verifications[1]], (['src/A.java (Parser Error in file src/A.java: line 1)'], False))
+        self.assertNotIn(verifications[2], results)
+        self.assertEqual(list(JobParseError.objects.filter(job=jobs[0]).order_by('pk').values_list('file', flat=True)),
+                         ['src/A.java', '/tmp/checkout/src/B.java', '(unknown)'])
+
+        # the logs are not searched again
+        with mock.patch.object(connector, 'search_job_logs') as search_job_logs:
+            check_parse_errors(connector, verifications)
+            search_job_logs.assert_not_called()
+
+        # the log of a job which did not finish yet is incomplete, its parse errors are extracted once it finished
+        waiting = Job.objects.create(plugin_execution=pe, revision_hash='c')
+        with mock.patch.object(connector, 'search_job_logs') as search_job_logs:
+            check_parse_errors(connector, [verifications[2]])
+            search_job_logs.assert_not_called()
+        waiting.refresh_from_db()
+        self.assertFalse(waiting.parse_errors_extracted)
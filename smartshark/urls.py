@@ -27,5 +27,6 @@ urlpatterns = [
     url(r'^remote/test/$', remote.test_connection, name='remote_test_connection'),
     url(r'^remote/plugin/$', remote.list_plugins, name='remote_list_plugins'),
     url(r'^remote/argument/$', remote.list_arguments, name='remote_list_plugin_arguments'),
-    url(r'^remote/collect/$', remote.start_collection, name='remote_start_collection')
+    url(r'^remote/collect/$', remote.start_collection, name='remote_start_collection'),
+    url(r'^remote/plan/$', remote.plan_collection, name='remote_plan_collection')
 ]
@@ -5,12 +5,14 @@
 Provide common connector methods via the BaseConnector.
 """
 
+import hashlib
 import string
 import os
 import server.settings
 
 from django.conf import settings
 from mongoengine import connect
+from pycoshark.mongomodels import VCSSystem
 
 
 class BaseConnector(object):
@@ -42,6 +44,32 @@ class BaseConnector(object):
 
         return command
 
+    def _get_file_hash(self, path):
+        file_hash = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(settings.UPLOAD_CHUNK_SIZE), b''):
+                file_hash.update(chunk)
+        return file_hash.hexdigest()
+
+    def _get_install_hash(self, archive_hash, plugin):
+        """Return the hash which identifies an installation of the plugin archive with the current install arguments."""
+        install_hash = hashlib.sha256(archive_hash.encode('utf-8'))
+        install_hash.update(self._add_parameters_to_install_command('', plugin).encode('utf-8'))
+        return install_hash.hexdigest()
+
+    def _get_repository_file(self, repository_url):
+        """Return the GridFS file of the repository archive which vcsSHARK stored for the url, it can be read in chunks."""
+        repository = VCSSystem.objects.get(url=repository_url).repository_file
+
+        if repository.grid_id is None:
+            raise Exception("VCSShark need to be executed first!")
+
+        return repository.get()
+
+    def _get_repository_hash(self, repository_file):
+        """Return a hash that changes whenever vcsSHARK stores a new repository archive."""
+        return repository_file.md5 or '%s-%s' % (repository_file._id, repository_file.length)
+
     def _generate_plugin_execution_command(self, plugin_path, plugin_execution):
         path_to_execute_script = '{}/{}/execute.sh'.format(plugin_path, str(plugin_execution.plugin))
 
@@ -0,0 +1,373 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Provide streaming reads and searches of job logs, the archives of logs and the local cache for the logs of finished jobs.
+
+The read functions work on binary files that support seek and read, e.g., local files or files opened over sftp, and
+never read more of the log than they return. Searches over many logs run as one grep where the logs are stored.
+
+Plugins which process a batch of revisions in one call print a line BATCH_REVISION_MARKER followed by the revision to
+stdout and stderr before the output of each revision, the logs of the call are split at these lines into the logs of
+the jobs.
+
+The logs of finished plugin executions are packed into one zip archive <plugin execution id>.zip next to their folder,
+the members are named <plugin execution id>/<job id>_<log type>.txt.
+"""
+
+import collections
+import contextlib
+import logging
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import uuid
+import zipfile
+
+from django.conf import settings
+
+logger = logging.getLogger('django')
+
+BLOCK_SIZE = 64 * 1024
+
+# one line of grep -H -n, the file name of a log starts with the id of its job
+GREP_LINE = re.compile(r'^(?:.*?/)?(\d+)_(?:out|err)\.txt:(\d+):(.*)$')
+
+# member of a log archive
+ARCHIVE_MEMBER = re.compile(r'^\d+/(\d+)_(out|err)\.txt$')
+
+# packs the folder given as argument into a zip archive next to it, runs where the logs are stored
+ARCHIVE_SCRIPT = """
+import os, sys, zipfile
+path = sys.argv[1].rstrip('/')
+with zipfile.ZipFile(path + '.zip.tmp', 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+    for root, _, files in os.walk(path):
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            if os.path.exists(file_path):
+                archive.write(file_path, os.path.relpath(file_path, os.path.dirname(path)))
+os.replace(path + '.zip.tmp', path + '.zip')
+"""
+
+# searches the logs of a type in the archive given as argument and prints the matches like grep -H -n, runs where the
+# archives are stored: <archive> <log type> <max count, 0 for all> <patterns>...
+SEARCH_ARCHIVE_SCRIPT = """
+import sys, zipfile
+path, log_type, max_count = sys.argv[1], sys.argv[2], int(sys.argv[3])
+patterns = [pattern.encode('utf-8') for pattern in sys.argv[4:]]
+with zipfile.ZipFile(path) as archive:
+    for info in archive.infolist():
+        if not info.filename.endswith('_%s.txt' % log_type):
+            continue
+        count = 0
+        with archive.open(info) as log_file:
+            for number, line in enumerate(log_file, 1):
+                if any(pattern in line for pattern in patterns):
+                    name = info.filename.encode('utf-8')
+                    sys.stdout.buffer.write(b'%s:%d:%s\\n' % (name, number, line.rstrip(b'\\r\\n')))
+                    count += 1
+                    if count == max_count:
+                        break
+"""
+
+# starts the output of a revision in the logs of a batch of revisions
+BATCH_REVISION_MARKER = '+++ revision '
+
+# splits the log of a batch of revisions like split_batch_log, runs where the logs are written:
+# awk -v marker=<marker> -v prefix=<log folder>/ -v suffix=_<log type>.txt <file of "<job id> <revision>"> <log>
+SPLIT_BATCH_LOG_AWK = (
+    'NR == FNR { jobs[$2] = $1; printf "" > (prefix $1 suffix); next } '
+    'index($0, marker) == 1 { revision = substr($0, length(marker) + 1); sub(/[ \\t\\r]+$/, "", revision); '
+    'current = (revision in jobs) ? jobs[revision] : "" } '
+    '{ if (current != "") { print > (prefix current suffix) } '
+    'else { for (r in jobs) print > (prefix jobs[r] suffix) } }'
+)
+
+LogMatch = collections.namedtuple('LogMatch', ['line_number', 'line'])
+
+
+def _decode(line):
+    return line.decode('utf-8', errors='replace').rstrip('\r\n')
+
+
+def get_size(log_file):
+    """Return the size of the log in bytes."""
+    log_file.seek(0, os.SEEK_END)
+    size = log_file.tell()
+    log_file.seek(0)
+    return size
+
+
+def read_range(log_file, offset=0, length=None):
+    """Return length bytes of the log starting at offset, at most LOG_MAX_READ_BYTES."""
+    length = min(length or settings.LOG_MAX_READ_BYTES, settings.LOG_MAX_READ_BYTES)
+    log_file.seek(offset)
+    return log_file.read(length)
+
+
+def iter_lines(log_file):
+    """Yield the lines of the log from the current position without line breaks."""
+    rest = b''
+    for block in iter(lambda: log_file.read(BLOCK_SIZE), b''):
+        lines = (rest + block).split(b'\n')
+        rest = lines.pop()
+        for line in lines:
+            yield _decode(line)
+    if rest:
+        yield _decode(rest)
+
+
+def read_lines(log_file, start=0, count=None):
+    """Return up to count lines of the log starting with line start and whether the log has more lines."""
+    count = count or settings.LOG_PAGE_LINES
+    log_file.seek(0)
+    lines = []
+    for number, line in enumerate(iter_lines(log_file)):
+        if number < start:
+            continue
+        if len(lines) == count:
+            return lines, True
+        lines.append(line)
+    return lines, False
+
+
+def tail_lines(log_file, count=None):
+    """Return the last count lines of the log, the log is read backwards from its end."""
+    count = count or settings.LOG_PAGE_LINES
+    log_file.seek(0, os.SEEK_END)
+    position = log_file.tell()
+    data = b''
+
+    # a trailing line break does not start another line
+    while position > 0 and data.count(b'\n') <= count:
+        read = min(BLOCK_SIZE, position)
+        position -= read
+        log_file.seek(position)
+        data = log_file.read(read) + data
+
+    if data.endswith(b'\n'):
+        data = data[:-1]
+    lines = data.split(b'\n') if data else []
+    return [_decode(line) for line in lines[-count:]]
+
+
+def search_lines(log_file, patterns, max_count=None):
+    """Return the lines of the log which contain one of the patterns as list of LogMatch, at most max_count lines."""
+    matches = []
+    for number, line in enumerate(iter_lines(log_file), 1):
+        if any(pattern in line for pattern in patterns):
+            matches.append(LogMatch(number, line))
+            if len(matches) == max_count:
+                break
+    return matches
+
+
+def get_grep_command(path, log_type, patterns, max_count=None):
+    """Return the arguments of one grep over all logs of the type below path which prints the lines containing one of
+    the patterns."""
+    command = ['grep', '-R', '-a', '-H', '-n', '-F', '--include=*_{}.txt'.format(log_type)]
+    if max_count:
+        command += ['-m', str(max_count)]
+    for pattern in patterns:
+        command += ['-e', pattern]
+    return command + ['--', path]
+
+
+def run_grep(command):
+    """Run the grep command locally and yield its output lines."""
+    with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as process:
+        for line in process.stdout:
+            yield line.decode('utf-8', errors='replace')
+
+    # grep exits with 1 if nothing matched and with 2 on errors, e.g., if the plugin execution has no logs yet
+    if process.returncode > 1:
+        logger.warning('Error while searching logs with {}'.format(command))
+
+
+def parse_grep_output(lines, job_ids=None):
+    """Return the matches of the grep output as dict of job id to list of LogMatch, only for the job_ids if given."""
+    matches = collections.defaultdict(list)
+    for line in lines:
+        match = GREP_LINE.match(line.rstrip('\r\n'))
+        if match is None:
+            continue
+        job_id = int(match.group(1))
+        if job_ids is None or job_id in job_ids:
+            matches[job_id].append(LogMatch(int(match.group(2)), match.group(3)))
+    return dict(matches)
+
+
+def split_batch_log(path, job_paths):
+    """Split the log at path of a call for a batch of revisions into the logs of its jobs.
+
+    job_paths is a dict of revision to the path of the log of its job. The lines from a BATCH_REVISION_MARKER up to the
+    next marker are written to the log of the job of that revision. Lines before the first marker, e.g., of the start
+    of the plugin, and after markers of unknown revisions are written to the logs of all jobs. Links to the logs of
+    earlier batches are replaced, not followed.
+    """
+    marker = BATCH_REVISION_MARKER.encode('utf-8')
+    for job_path in job_paths.values():
+        if os.path.islink(job_path):
+            os.remove(job_path)
+
+    with contextlib.ExitStack() as stack, open(path, 'rb') as batch_file:
+        job_files = {revision: stack.enter_context(open(job_path, 'wb')) for revision, job_path in job_paths.items()}
+        current = list(job_files.values())
+        for line in batch_file:
+            if line.startswith(marker):
+                revision = line[len(marker):].strip().decode('utf-8', errors='replace')
+                current = [job_files[revision]] if revision in job_files else list(job_files.values())
+            for job_file in current:
+                job_file.write(line)
+
+
+def get_archive_command(path, python='python3'):
+    """Return the arguments of the call which packs the log folder at path into path.zip."""
+    return [python, '-c', ARCHIVE_SCRIPT, path]
+
+
+def get_search_archive_command(path, log_type, patterns, max_count=None, python='python3'):
+    """Return the arguments of the call which searches the logs of the type in the archive at path, its output is
+    parsed with parse_grep_output."""
+    return [python, '-c', SEARCH_ARCHIVE_SCRIPT, path, log_type, str(max_count or 0)] + list(patterns)
+
+
+@contextlib.contextmanager
+def open_archived_log(archive_file, job, log_type, cache=None):
+    """Extract the log of the job from the opened archive of its plugin execution and yield it.
+
+    The log is extracted into the log cache if one is given and the log fits into it, otherwise into a temporary file.
+    Raises FileNotFoundError if the archive does not contain the log.
+    """
+    with zipfile.ZipFile(archive_file) as archive:
+        try:
+            info = archive.getinfo('{}/{}_{}.txt'.format(job.plugin_execution_id, job.pk, log_type))
+        except KeyError:
+            raise FileNotFoundError('{} log of job {} is not archived'.format(log_type, job.pk))
+
+        path = None
+        if cache:
+            try:
+                with archive.open(info) as member:
+                    path = cache.put(job, log_type, member, size=info.file_size)
+            except OSError as e:
+                logger.warning('Could not cache the {} log of job {}: {}'.format(log_type, job.pk, e))
+        if path is not None:
+            with open(path, 'rb') as log_file:
+                yield log_file
+            return
+
+        with archive.open(info) as member, tempfile.TemporaryFile() as log_file:
+            shutil.copyfileobj(member, log_file, BLOCK_SIZE)
+            log_file.seek(0)
+            yield log_file
+
+
+@contextlib.contextmanager
+def open_log_or_archive(open_file, path, archive_path, job, log_type):
+    """Open the log at path with open_file, e.g., open or the open of a sftp client, or read it from the archive at
+    archive_path if the logs of the plugin execution were archived.
+
+    Archived logs are inflated once into the log cache, later reads of the log do not open the archive.
+    """
+    try:
+        log_file = open_file(path, 'rb')
+    except FileNotFoundError:
+        cache = LogCache()
+        cached_path = cache.get(job, log_type)
+        if cached_path is None:
+            with open_file(archive_path, 'rb') as archive_file, \
+                    open_archived_log(archive_file, job, log_type, cache) as log_file:
+                yield log_file
+            return
+
+        with open(cached_path, 'rb') as log_file:
+            yield log_file
+        return
+
+    with log_file:
+        yield log_file
+
+
+def search_archive(archive_file, log_type, patterns, job_ids=None, max_count=None):
+    """Search the logs of the type in the opened archive in one pass, returns the same dict as parse_grep_output."""
+    matches = {}
+    with zipfile.ZipFile(archive_file) as archive:
+        for info in archive.infolist():
+            member = ARCHIVE_MEMBER.match(info.filename)
+            if member is None or member.group(2) != log_type:
+                continue
+            job_id = int(member.group(1))
+            if job_ids is not None and job_id not in job_ids:
+                continue
+
+            with archive.open(info) as log_file:
+                job_matches = search_lines(log_file, patterns, max_count)
+            if job_matches:
+                matches[job_id] = job_matches
+    return matches
+
+
+class LogCache(object):
+    """Bounded on-disk cache for the logs of finished jobs, the least recently read logs are removed first.
+
+    The modification time of a cached log is its last access. Logs larger than LOG_CACHE_MAX_FILE_SIZE are not cached.
+    """
+
+    def __init__(self, path=None, max_size=None, max_file_size=None):
+        self.path = path or settings.LOG_CACHE_PATH
+        self.max_size = max_size or settings.LOG_CACHE_SIZE
+        self.max_file_size = max_file_size or settings.LOG_CACHE_MAX_FILE_SIZE
+
+    def _get_path(self, job, log_type):
+        return os.path.join(self.path, '{}_{}.txt'.format(job.pk, log_type))
+
+    def get(self, job, log_type):
+        """Return the path of the cached log or None."""
+        path = self._get_path(job, log_type)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, job, log_type, log_file, size=None):
+        """Copy the log into the cache and return the path of the cached log, None if the log is too large.
+
+        The size of the log must be given for files which do not support seek, they are copied from their position.
+        """
+        if (get_size(log_file) if size is None else size) > self.max_file_size:
+            return None
+
+        os.makedirs(self.path, exist_ok=True)
+        path = self._get_path(job, log_type)
+
+        # the log is written to a temporary file first, so readers never see an incomplete log
+        tmp_path = '{}.{}.tmp'.format(path, uuid.uuid4().hex)
+        with open(tmp_path, 'wb') as f:
+            for block in iter(lambda: log_file.read(BLOCK_SIZE), b''):
+                f.write(block)
+        os.replace(tmp_path, path)
+
+        self.evict()
+        return path
+
+    def evict(self):
+        """Remove the least recently read logs until the cache is not larger than max_size."""
+        entries = []
+        for entry in os.scandir(self.path):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        size = sum(entry_size for _, entry_size, _ in entries)
+        for _, entry_size, path in sorted(entries):
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
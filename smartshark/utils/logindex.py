@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Provide the full-text index over the logs of finished jobs.
+
+The index is a local SQLite database with an FTS5 table of all log lines. The logs of a job are indexed once after
+it finished (see the index_job_logs command), afterwards searches over many jobs do not read the logs again. The table
+uses the case sensitive trigram tokenizer (SQLite 3.34 or newer), so the index finds substrings like grep -F does.
+"""
+
+import collections
+import sqlite3
+
+from django.conf import settings
+
+from smartshark.models import Job
+from smartshark.utils.joblog import LogMatch
+
+# job ids per query, SQLite allows at most 999 parameters in older versions
+JOB_ID_CHUNK_SIZE = 500
+
+
+class LogIndex(object):
+    """Full-text index over the lines of job logs, one row per line."""
+
+    def __init__(self, path=None):
+        self.path = path or settings.LOG_INDEX_PATH
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute('CREATE VIRTUAL TABLE IF NOT EXISTS log_lines USING fts5('
+                                'line, job_id UNINDEXED, plugin_execution_id UNINDEXED, log_type UNINDEXED, '
+                                'line_number UNINDEXED, tokenize="trigram case_sensitive 1")')
+
+    def close(self):
+        self.connection.close()
+
+    def add(self, job, logs):
+        """Index the logs of the job, a dict of log type to its lines, in one transaction. Replaces the lines indexed
+        before for the job."""
+        with self.connection:
+            self.connection.execute('DELETE FROM log_lines WHERE job_id = ?', (job.pk,))
+            for log_type, lines in logs.items():
+                self.connection.executemany(
+                    'INSERT INTO log_lines (line, job_id, plugin_execution_id, log_type, line_number) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    ((line, job.pk, job.plugin_execution_id, log_type, number) for number, line in enumerate(lines, 1))
+                )
+
+    def delete(self, plugin_execution):
+        """Remove the logs of all jobs of the plugin execution from the index."""
+        with self.connection:
+            self.connection.execute('DELETE FROM log_lines WHERE plugin_execution_id = ?', (plugin_execution.pk,))
+
+    def _get_condition(self, patterns):
+        # trigrams only find patterns with at least three characters, shorter patterns are searched in every line
+        if all(len(pattern) >= 3 for pattern in patterns):
+            # every pattern is one phrase, quotes inside the phrase are doubled
+            phrases = ['"{}"'.format(pattern.replace('"', '""')) for pattern in patterns]
+            return 'log_lines MATCH ?', [' OR '.join(phrases)]
+        return '({})'.format(' OR '.join(['instr(line, ?) > 0'] * len(patterns))), list(patterns)
+
+    def search(self, patterns, log_type=None, plugin_execution=None, jobs=None, status=None, max_count=None):
+        """Return the indexed lines which contain one of the patterns as dict of job id to list of LogMatch.
+
+        The lines contain a pattern exactly as grep -F would match it. The search can be restricted to a log type, a
+        plugin execution, the given jobs and jobs with the given status, at most max_count lines per job are returned.
+        The jobs with the status are looked up first, the restrictions to jobs are part of the query in chunks.
+        """
+        job_ids = [job.pk for job in jobs] if jobs is not None else None
+        if status:
+            job_ids = self._get_jobs_with_status(status, plugin_execution, job_ids)
+
+        matches = collections.defaultdict(list)
+        chunks = [None] if job_ids is None else [job_ids[start:start + JOB_ID_CHUNK_SIZE]
+                                                 for start in range(0, len(job_ids), JOB_ID_CHUNK_SIZE)]
+        for chunk in chunks:
+            sql, parameters = self._get_query(patterns, log_type, plugin_execution, chunk, max_count)
+            for job_id, line_number, line in self.connection.execute(sql, parameters):
+                matches[job_id].append(LogMatch(line_number, line))
+        return dict(matches)
+
+    def _get_jobs_with_status(self, status, plugin_execution, job_ids):
+        jobs = Job.objects.filter(status=status)
+        if plugin_execution:
+            jobs = jobs.filter(plugin_execution=plugin_execution)
+        if job_ids is None:
+            return list(jobs.values_list('pk', flat=True))
+
+        with_status = []
+        for start in range(0, len(job_ids), JOB_ID_CHUNK_SIZE):
+            with_status.extend(jobs.filter(pk__in=job_ids[start:start + JOB_ID_CHUNK_SIZE])
+                               .values_list('pk', flat=True))
+        return with_status
+
+    def _get_query(self, patterns, log_type, plugin_execution, job_ids, max_count):
+        condition, parameters = self._get_condition(patterns)
+        sql = 'SELECT job_id, line_number, line FROM log_lines WHERE ' + condition
+        if log_type:
+            sql += ' AND log_type = ?'
+            parameters.append(log_type)
+        if plugin_execution:
+            sql += ' AND plugin_execution_id = ?'
+            parameters.append(plugin_execution.pk)
+        if job_ids is not None:
+            sql += ' AND job_id IN ({})'.format(', '.join(['?'] * len(job_ids)))
+            parameters.extend(job_ids)
+
+        if max_count:
+            # the first max_count matching lines of every job
+            sql = 'SELECT job_id, line_number, line FROM (SELECT job_id, line_number, line, ROW_NUMBER() OVER ' \
+                  '(PARTITION BY job_id ORDER BY line_number) AS number FROM ({})) WHERE number <= ?'.format(sql)
+            parameters.append(max_count)
+        return sql + ' ORDER BY job_id, line_number', parameters
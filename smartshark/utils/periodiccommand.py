@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Provide the base of the management commands which run periodically next to the web server, e.g., reconcile_jobs.
+"""
+
+import time
+import logging
+
+from django.conf import settings
+from django.db import connections
+from django.core.management.base import BaseCommand
+
+from smartshark.datacollection.pluginmanagementinterface import PluginManagementInterface
+
+logger = logging.getLogger('django')
+
+
+class PeriodicCommand(BaseCommand):
+    """Runs run_once every --interval seconds until it is interrupted, or only once with --once.
+
+    Subclasses set interval_setting to the name of the setting with the default interval and activity to the name of
+    what they do in messages, e.g., 'reconciliation'. A failed run is logged, the next run tries again.
+    """
+
+    interval_setting = None
+    activity = None
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=getattr(settings, self.interval_setting),
+                            help='Seconds between two runs.')
+        parser.add_argument('--once', action='store_true', help='Run once and exit.')
+
+    def run_once(self, interface, **options):
+        raise NotImplementedError
+
+    def handle(self, *args, **options):
+        interface = PluginManagementInterface.find_correct_plugin_manager()
+
+        try:
+            while True:
+                try:
+                    self.run_once(interface, **options)
+                except Exception as e:
+                    logger.exception(e)
+                    self.stderr.write('{} failed: {}'.format(self.activity, e))
+
+                if options['once']:
+                    break
+
+                # close db connection because we wait for a long time
+                connections['default'].close()
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('stopping {}'.format(self.activity))
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Provide the lock of a local project folder and the update of the clone in it.
+
+The server process and the peon workers of the local queue take the same lock: the update of the clone holds it
+exclusively, jobs which work on the project folder or on worktrees of it hold it shared.
+"""
+
+import contextlib
+import fcntl
+import logging
+import os
+import shutil
+import subprocess
+
+logger = logging.getLogger('localqueueconnector')
+
+
+@contextlib.contextmanager
+def project_lock(project_folder, shared=False):
+    """Lock the project folder against changes by other executions of the same project, shared for readers."""
+    project_path = os.path.dirname(project_folder)
+    os.makedirs(project_path, exist_ok=True)
+    with open(os.path.join(project_path, '.{}.lock'.format(os.path.basename(project_folder))), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def refresh_clone(repository_url, project_folder):
+    """Update the clone of the repository with git fetch --prune and reset, clone it again only if that fails.
+
+    git does not look for a repository above the project folder, so a folder which is no clone is cloned again
+    instead of resetting a repository it is part of.
+    """
+    project_path = os.path.dirname(project_folder)
+    hash_path = os.path.join(project_path, '.{}.repository_hash'.format(os.path.basename(project_folder)))
+    env = dict(os.environ, GIT_CEILING_DIRECTORIES=os.path.realpath(project_path))
+
+    with project_lock(project_folder):
+        if os.path.isfile(hash_path):
+            os.remove(hash_path)
+
+        try:
+            for command in [['remote', 'set-url', 'origin', repository_url], ['fetch', '--prune', '--quiet', 'origin'],
+                            ['reset', '--hard', '--quiet', 'origin/HEAD'], ['clean', '-fdxq']]:
+                subprocess.run(['git', '-C', project_folder] + command, check=True, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE, env=env)
+            logger.info('updated {}'.format(project_folder))
+        except subprocess.CalledProcessError as e:
+            logger.info('could not update {}, cloning it again: {}'.format(project_folder, e.stderr))
+            shutil.rmtree(project_folder, ignore_errors=True)
+            subprocess.run(['git', 'clone', '--quiet', repository_url, project_folder], check=True)
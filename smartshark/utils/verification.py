@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Provide the reconciliation of failed coastSHARK verifications with the parse errors which coastSHARK logged.
+
+The parse errors of a job are extracted once from its output log into JobParseError, afterwards the verifications of a
+whole project are checked against the stored parse errors without reading any log.
+"""
+
+from django.db import transaction
+
+from smartshark.models import Job, JobParseError
+
+PARSE_ERROR_PREFIXES = ('Parser Error in file', 'Lexer Error in file')
+
+
+def get_parse_error_file(line):
+    """Return the file of a parser or lexer error line of coastSHARK, an empty string if the line names no file, or
+    None if the line is no parse error."""
+    for prefix in PARSE_ERROR_PREFIXES:
+        if line.startswith(prefix):
+            words = line[len(prefix):].lstrip(' :').split()
+            return words[0].rstrip(':,') if words else ''
+    return None
+
+
+def extract_parse_errors(interface, jobs):
+    """Store the parse errors of the finished jobs whose parse errors were not extracted yet, with one log search per
+    plugin execution. Jobs which did not finish yet are skipped, their logs are incomplete."""
+    jobs = [job for job in jobs if not job.parse_errors_extracted and job.status in ('DONE', 'EXIT')]
+    if not jobs:
+        return 0
+
+    matches = interface.search_job_logs(jobs, 'out', PARSE_ERROR_PREFIXES)
+
+    parse_errors = []
+    for job_id, job_matches in matches.items():
+        for match in job_matches:
+            line = match.line.strip()
+            file = get_parse_error_file(line)
+            if file is not None:
+                parse_errors.append(JobParseError(job_id=job_id, file=file[:255], line=line))
+
+    with transaction.atomic():
+        JobParseError.objects.filter(job__in=jobs).delete()
+        JobParseError.objects.bulk_create(parse_errors, batch_size=1000)
+        Job.objects.filter(pk__in=[job.pk for job in jobs]).update(parse_errors_extracted=True)
+
+    for job in jobs:
+        job.parse_errors_extracted = True
+    return len(jobs)
+
+
+def get_coast_files(text):
+    """Return the files for which coastSHARK failed from the text of a CommitVerification."""
+    coast_files = []
+    collect_state = False
+    for line in (text or '').split('\n'):
+        if line.strip().startswith('+++ mecoSHARK +++'):
+            collect_state = False
+        if collect_state and line.strip():
+            coast_files.append(line.strip()[1:])
+        if line.strip().startswith('+++ coastSHARK +++'):
+            collect_state = True
+    return coast_files
+
+
+def get_latest_coast_jobs(project, commits):
+    """Return the latest coastSHARK job of each of the commits of the project as dict of commit to job."""
+    jobs = Job.objects.filter(plugin_execution__plugin__name__startswith='coastSHARK',
+                              plugin_execution__project=project, revision_hash__in=commits)
+    return {job.revision_hash: job for job in jobs.order_by('plugin_execution__submitted_at', 'pk')}
+
+
+def check_parse_errors(interface, verifications):
+    """Check the failed coastSHARK verifications of one project against the parse errors of their latest jobs.
+
+    Returns a dict of verification to the list of parse error lines for its files and whether every file for which
+    coastSHARK failed has a parse error. Verifications without a coastSHARK job are missing in the dict.
+    """
+    verifications = list(verifications)
+    if not verifications:
+        return {}
+
+    jobs = get_latest_coast_jobs(verifications[0].project, [obj.commit for obj in verifications])
+    extract_parse_errors(interface, jobs.values())
+
+    parse_errors = {}
+    for parse_error in JobParseError.objects.filter(job__in=list(jobs.values())).order_by('pk'):
+        parse_errors.setdefault(parse_error.job_id, []).append(parse_error.line)
+
+    results = {}
+    for obj in verifications:
+        if obj.commit not in jobs:
+            continue
+
+        job_errors = parse_errors.get(jobs[obj.commit].pk, [])
+        coast_files = get_coast_files(obj.text)
+        new_lines = []
+        parse_error_files = set()
+        for file in coast_files:
+            # coastSHARK logs the files with the path of its checkout
+            for line in job_errors:
+                if file in line:
+                    new_lines.append(file + ' ({})'.format(line))
+                    parse_error_files.add(file)
+
+        results[obj] = (new_lines, parse_error_files == set(coast_files))
+    return results
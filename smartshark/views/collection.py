@@ -1,4 +1,5 @@
 import os
+import functools
 import threading
 import logging
 import urllib.request
@@ -14,9 +15,10 @@ from bson.objectid import ObjectId
 from django.db.models import Q
 
 from smartshark.common import create_substitutions_for_display, order_plugins, append_success_messages_to_req
-from smartshark.datacollection.executionutils import create_jobs_for_execution
+from smartshark.datacollection.executionutils import create_jobs_for_execution, plan_jobs_for_execution, \
+    submit_pending_jobs
 from smartshark.forms import ProjectForm, get_form, set_argument_values, set_argument_execution_values
-from smartshark.models import Plugin, Project, PluginExecution, Job, CommitVerification
+from smartshark.models import Plugin, Project, PluginExecution, CommitVerification
 from smartshark.utils import projectUtils
 
 from smartshark.datacollection.pluginmanagementinterface import PluginManagementInterface
@@ -34,8 +36,12 @@ class JobSubmissionThread(threading.Thread):
     def run(self):
         interface = PluginManagementInterface.find_correct_plugin_manager()
         if self.create_jobs:
-            create_jobs_for_execution(self.project, self.plugin_executions)
-        interface.execute_plugins(self.project, self.plugin_executions)
+            # jobs are submitted batch by batch while the remaining jobs are created
+            interface.prepare_execution(self.project, self.plugin_executions)
+            create_jobs_for_execution(self.project, self.plugin_executions,
+                                      submit=functools.partial(submit_pending_jobs, interface))
+        else:
+            interface.execute_plugins(self.project, self.plugin_executions)
 
 
 def install(request):
@@ -112,7 +118,6 @@ def choose_plugins(request):
         # check whether it's valid:
         if form.is_valid():
             plugin_ids = []
-            interface = PluginManagementInterface.find_correct_plugin_manager()
 
             # check requirements
             for plugin in form.cleaned_data['plugins']:
@@ -147,21 +152,9 @@ def choose_plugins(request):
 
                     logger.debug("At least one plugin execution for plugin %s was successful." % str(req_plugin))
 
-                # Update job information
+                # the job states are kept up to date by the reconcile_jobs command
                 plugin_executions = PluginExecution.objects.all().filter(plugin=plugin, project=project)
 
-                # Get all jobs from all plugin_executions which did not terminate yet
-                jobs = []
-                for plugin_execution in plugin_executions:
-                    jobs.extend(Job.objects.filter(plugin_execution=plugin_execution, status='WAIT').all())
-
-                # Update the job stati for these jobs
-                job_stati = interface.get_job_stati(jobs)
-                i = 0
-                for job in jobs:
-                    job.status = job_stati[i]
-                    job.save()
-
                 # check if some plugin has unfinished jobs
                 has_unfinished_jobs = False
                 for plugin_execution in plugin_executions:
@@ -213,30 +206,28 @@ def start_collection(request):
 
         # check whether it's valid:
         if form.is_valid():
-            execution_type = form.cleaned_data.get('execution', None)
-            revisions = form.cleaned_data.get('revisions', None)
-            repository_url = form.cleaned_data.get('repository_url', None)
-            job_queue = form.cleaned_data.get("queue", None)
-            cores_per_job = form.cleaned_data.get("cores_per_job", None)
-
             sorted_plugins = order_plugins(plugins)
 
+            # show the jobs that would be created without creating anything
+            if 'plan' in request.POST:
+                plugin_executions = [_get_plugin_execution(project, plugin, form.cleaned_data) for plugin in sorted_plugins]
+                interface = PluginManagementInterface.find_correct_plugin_manager()
+                plan = plan_jobs_for_execution(project, plugin_executions, interface.default_cores_per_job())
+
+                return render(request, 'smartshark/project/execution.html', {
+                    'form': form,
+                    'plugins': plugins,
+                    'projects': [project],
+                    'substitutions': create_substitutions_for_display(),
+                    'plan': plan,
+                    'plan_jobs': sum(entry['jobs'] for entry in plan),
+                    'plan_core_hours': sum(entry['core_hours'] for entry in plan if entry['core_hours'] is not None),
+                })
+
             plugin_executions = []
             for plugin in sorted_plugins:
                 # Create Plugin Execution Objects
-                plugin_execution = PluginExecution(project=project, plugin=plugin)
-
-                if plugin.plugin_type == 'repo' or plugin.plugin_type == 'rev':
-                    plugin_execution.repository_url = repository_url
-
-                if plugin.plugin_type == 'rev':
-                    plugin_execution.execution_type = execution_type
-                    plugin_execution.revisions = revisions
-
-                # Set the job queue and cores_per_job
-                plugin_execution.job_queue = job_queue
-                plugin_execution.cores_per_job = cores_per_job
-
+                plugin_execution = _get_plugin_execution(project, plugin, form.cleaned_data)
                 plugin_execution.save()
                 plugin_executions.append(plugin_execution)
 
@@ -266,6 +257,24 @@ def start_collection(request):
     })
 
 
+def _get_plugin_execution(project, plugin, cleaned_data):
+    """Return a new, unsaved plugin execution for the plugin with the values of the execution form."""
+    plugin_execution = PluginExecution(project=project, plugin=plugin)
+
+    if plugin.plugin_type == 'repo' or plugin.plugin_type == 'rev':
+        plugin_execution.repository_url = cleaned_data.get('repository_url', None)
+
+    if plugin.plugin_type == 'rev':
+        plugin_execution.execution_type = cleaned_data.get('execution', None)
+        plugin_execution.revisions = cleaned_data.get('revisions', None)
+
+    # Set the job queue and cores_per_job
+    plugin_execution.job_queue = cleaned_data.get("queue", None)
+    plugin_execution.cores_per_job = cleaned_data.get("cores_per_job", None)
+
+    return plugin_execution
+
+
 def delete_project_data(request):
     if request.method == 'POST':
         if 'cancel' in request.POST:
@@ -2,15 +2,19 @@ import json
 from collections import defaultdict
 from queue import Queue
 
+from django.conf import settings
 from django.contrib import messages
 from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
-from django.http import HttpResponseRedirect
+from django.http import HttpResponseRedirect, HttpResponse, HttpResponseBadRequest, Http404, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404
 
 from smartshark.datacollection.pluginmanagementinterface import PluginManagementInterface
 from smartshark.filters import JobExecutionFilter
 from smartshark.models import PluginExecution, Job, Project, Plugin
 from smartshark.mongohandler import handler
+from smartshark.utils.joblog import BLOCK_SIZE
+
+LOG_TYPES = {'output': 'out', 'error': 'err'}
 
 
 def index(request):
@@ -171,22 +175,12 @@ def plugin_execution_status(request, id):
         messages.error(request, 'You are not authorized to perform this action.')
         return HttpResponseRedirect('/admin/smartshark/project')
 
-    interface = PluginManagementInterface.find_correct_plugin_manager()
+    # the job states are kept up to date by the reconcile_jobs command
     plugin_execution = get_object_or_404(PluginExecution, pk=id)
 
-    # Get all jobs from all plugin_executions which did not terminate yet
-    # Update the job stati for these jobs
-    jobs = Job.objects.filter(plugin_execution=plugin_execution, status='WAIT').all()
-    job_stati = interface.get_job_stati(jobs)
-    i = 0
-    for job in jobs:
-        job.status = job_stati[i]
-        job.save()
-        i += 1
-
     job_filter = JobExecutionFilter(request.GET, queryset=Job.objects.all().filter(plugin_execution=plugin_execution))
 
-    rev = [exitjob.revision_hash if exitjob.revision_hash else '' for exitjob in job_filter.qs.filter(status='EXIT')]
+    rev = [revision_hash if revision_hash else '' for revision_hash in job_filter.qs.filter(status='EXIT').values_list('revision_hash', flat=True)]
     exit_job_revisions = ''
     if rev:
         exit_job_revisions = ','.join(rev)
@@ -207,11 +201,11 @@ def plugin_execution_status(request, id):
         'plugin_execution': plugin_execution,
         'filter': job_filter,
         'jobs': jobs,
-        'overall': len(job_filter.qs),
+        'overall': job_filter.qs.count(),
         'queried_status': job_filter.data.get('status', None),
-        'done_jobs': len(job_filter.qs.filter(status='DONE')),
+        'done_jobs': job_filter.qs.filter(status='DONE').count(),
         'exit_jobs': len(rev),
-        'waiting_jobs': len(job_filter.qs.filter(status='WAIT')),
+        'waiting_jobs': job_filter.qs.filter(status='WAIT').count(),
         'exit_job_revisions': exit_job_revisions
     })
 
@@ -242,6 +236,11 @@ def plugin_status(request, id):
 
 
 def job_output(request, id, type):
+    """Show the tail or a page of lines of a job log, or return a byte range or the whole log as download.
+
+    Parameters: page shows the given page of LOG_PAGE_LINES lines, offset and length return the bytes of the log,
+    download streams the whole log. Without parameters the last LOG_PAGE_LINES lines are shown.
+    """
     if not request.user.is_authenticated() or not request.user.has_perm('smartshark.job_output'):
         messages.error(request, 'You are not authorized to perform this action.')
         return HttpResponseRedirect('/admin/smartshark/project')
@@ -249,17 +248,48 @@ def job_output(request, id, type):
     job = get_object_or_404(Job, pk=id)
     interface = PluginManagementInterface.find_correct_plugin_manager()
 
-    if type == 'output':
-        output = interface.get_output_log(job)
-    elif type == 'error':
-        output = interface.get_error_log(job)
-    elif type == 'arguments':
+    if type == 'arguments':
         return render(request, 'smartshark/job/execution_arguments.html', {
             'exe_arguments': job.plugin_execution.executionhistory_set.all().order_by('execution_argument__position'),
             'cmd': interface.get_sent_bash_command(job),
         })
+    if type not in LOG_TYPES:
+        raise Http404('Unknown log type {}'.format(type))
+    log_type = LOG_TYPES[type]
+
+    try:
+        if 'download' in request.GET:
+            response = StreamingHttpResponse(_stream_log(interface, job, log_type), content_type='text/plain')
+            response['Content-Disposition'] = 'attachment; filename="{}_{}.txt"'.format(job.pk, log_type)
+            return response
+
+        if 'offset' in request.GET:
+            data = interface.read_log(job, log_type, max(int(request.GET['offset']), 0),
+                                      int(request.GET.get('length', 0)))
+            return HttpResponse(data, content_type='text/plain')
+
+        page = request.GET.get('page')
+        if page is not None:
+            page = max(int(page), 1)
+            lines, has_next = interface.read_log_lines(job, log_type, (page - 1) * settings.LOG_PAGE_LINES)
+        else:
+            lines, has_next = interface.tail_log(job, log_type), False
+    except FileNotFoundError:
+        lines, page, has_next = ['File Not Found'], None, False
+    except ValueError:
+        return HttpResponseBadRequest('page, offset and length must be numbers')
 
     return render(request, 'smartshark/job/output.html', {
-        'output': '\n'.join(output),
+        'output': '\n'.join(lines),
         'job': job,
+        'type': type,
+        'page': page,
+        'has_next': has_next,
+        'page_lines': settings.LOG_PAGE_LINES,
     })
+
+
+def _stream_log(interface, job, log_type):
+    with interface.open_log(job, log_type) as log_file:
+        for block in iter(lambda: log_file.read(BLOCK_SIZE), b''):
+            yield block
@@ -4,6 +4,7 @@ WIP
 Allow the visualshark to start / restart jobs remotely.
 """
 
+import functools
 import threading
 import logging
 
@@ -12,9 +13,11 @@ from django.http import HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 
 from smartshark.common import order_plugins
-from smartshark.datacollection.executionutils import create_jobs_for_execution
+from smartshark.datacollection.executionutils import create_jobs_for_execution, plan_jobs_for_execution, \
+    submit_pending_jobs
 from smartshark.forms import get_form, set_argument_execution_values
-from smartshark.models import Plugin, Project, PluginExecution, Job, Argument
+from smartshark.views.collection import _get_plugin_execution
+from smartshark.models import Plugin, Project, PluginExecution, Argument
 
 from smartshark.datacollection.pluginmanagementinterface import PluginManagementInterface
 
@@ -31,8 +34,12 @@ class JobSubmissionThread(threading.Thread):
     def run(self):
         interface = PluginManagementInterface.find_correct_plugin_manager()
         if self.create_jobs:
-            create_jobs_for_execution(self.project, self.plugin_executions)
-        interface.execute_plugins(self.project, self.plugin_executions)
+            # jobs are submitted batch by batch while the remaining jobs are created
+            interface.prepare_execution(self.project, self.plugin_executions)
+            create_jobs_for_execution(self.project, self.plugin_executions,
+                                      submit=functools.partial(submit_pending_jobs, interface))
+        else:
+            interface.execute_plugins(self.project, self.plugin_executions)
 
 
 def test_connection(request):
@@ -103,8 +110,6 @@ def start_collection(request):
     if not plugin_ids:
         return HttpResponse('no plugins selected', status=400)
 
-    interface = PluginManagementInterface.find_correct_plugin_manager()
-
     plugins = []
     projects = []
 
@@ -125,18 +130,7 @@ def start_collection(request):
             # check if plugin alredy runs
             plugin_executions = PluginExecution.objects.all().filter(plugin=plugin, project=project)
 
-            # Get all jobs from all plugin_executions which did not terminate yet
-            jobs = []
-            for plugin_execution in plugin_executions:
-                jobs.extend(Job.objects.filter(plugin_execution=plugin_execution, status='WAIT').all())
-
-            # Update the job stati for these jobs
-            job_stati = interface.get_job_stati(jobs)
-            i = 0
-            for job in jobs:
-                job.status = job_stati[i]
-                job.save()
-
+            # the job states are kept up to date by the reconcile_jobs command
             # check if some plugin has unfinished jobs
             has_unfinished_jobs = False
             for plugin_execution in plugin_executions:
@@ -184,6 +178,49 @@ def start_collection(request):
         return HttpResponse('Form Invalid', status=400)
 
 
+@csrf_exempt
+def plan_collection(request):
+    """Return the jobs that start_collection would create with the same parameters, without creating them."""
+    ak = request.POST.get('ak', None)
+    if not ak:
+        return HttpResponse('Unauthorized', status=401)
+    if ak != settings.API_KEY:
+        return HttpResponse('Unauthorized', status=401)
+
+    project_mongo_ids = request.POST.get('project_mongo_ids', None)
+    plugin_ids = request.POST.get('plugin_ids', None)
+
+    if not project_mongo_ids:
+        return HttpResponse('project mongo ids required', status=400)
+
+    if not plugin_ids:
+        return HttpResponse('no plugins selected', status=400)
+
+    interface = PluginManagementInterface.find_correct_plugin_manager()
+
+    projects = [Project.objects.get(mongo_id=mongo_id) for mongo_id in project_mongo_ids.split(',')]
+    plugins = [Plugin.objects.get(pk=plugin_id, active=True, installed=True) for plugin_id in plugin_ids.split(',')]
+
+    form = get_form(plugins, request.POST, 'execute')
+
+    if not form.is_valid():
+        return HttpResponse('Form Invalid', status=400)
+
+    sorted_plugins = order_plugins(plugins)
+
+    dat = {}
+    for project in projects:
+        plugin_executions = [_get_plugin_execution(project, plugin, form.cleaned_data) for plugin in sorted_plugins]
+        plan = plan_jobs_for_execution(project, plugin_executions, interface.default_cores_per_job())
+        dat[project.mongo_id] = {
+            'plugins': plan,
+            'jobs': sum(entry['jobs'] for entry in plan),
+            'core_hours': sum(entry['core_hours'] for entry in plan if entry['core_hours'] is not None),
+        }
+
+    return JsonResponse(dat)
+
+
 def _check_if_at_least_one_execution_was_successful(req_plugin, project):
     # Go through all plugin executions
     for plugin_execution in PluginExecution.objects.filter(plugin=req_plugin, project=project).all():